@@ -1,3 +1,39 @@
 __version__ = '1.1.4'
 
-from .argtoolbox import *
+import importlib
+
+# The public names are imported on first use (PEP 562), "import argtoolbox"
+# does not load argparse, configparser, ... until they are really needed.
+
+__all__ = [
+    'DEFAULT_LOGGING_FORMAT', 'DEBUG_LOGGING_FORMAT', 'streamHandler',
+    'DefaultHook', 'Base64ElementHook', 'SectionHook', 'Config',
+    'ResolvedInterpolation', 'TypedList', 'ResourcePool',
+    'SimpleSection', 'SubSection', 'ListSection', 'Element',
+    'ElementWithSubSections', 'ElementWithRelativeSubSection',
+    'DefaultCommand', 'TargetsCommand', 'TargetResult', 'TestCommand',
+    'cached_command',
+    'DefaultCompleter', 'DefaultProgram',
+    'BasicProgram', 'get_user_cache_dir', 'query_yes_no',
+]
+
+_SUBMODULES = ('argtoolbox', 'commands', 'server', 'client', 'storage',
+               'completion')
+
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        return importlib.import_module('.' + name, __name__)
+    if name in __all__:
+        module = importlib.import_module('.argtoolbox', __name__)
+        value = getattr(module, name)
+        # the logging objects are created lazily, they are not cached here.
+        if name not in ('DEFAULT_LOGGING_FORMAT', 'DEBUG_LOGGING_FORMAT',
+                        'streamHandler'):
+            globals()[name] = value
+        return value
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__ + list(_SUBMODULES))
@@ -28,37 +28,210 @@
 
 
 import os
+import re
 import sys
 import logging
-import base64
+import threading
+import types
+import weakref
+import contextlib
+import contextvars
+import io
+import time
 import copy
+import json
+import shlex
+import queue
+import heapq
+import array
+import atexit
+import base64
 import binascii
+import hashlib
+import inspect
+import keyword
+import pickle
+import shutil
+import functools
 from collections import OrderedDict
+from concurrent import futures
 import configparser
 import argparse
 from argparse import ArgumentError
 
+from . import __version__
+
+# asyncio, logging.handlers, dataclasses and typing (about 50ms together) are
+# imported by the functions using them : coroutine hooks, queue logging and
+# the dataclass views are optional.
+
 # global logger variable
 #log = logging.getLogger('argtoolbox')
 #log.setLevel(logging.INFO)
 #log.setLevel(logging.DEBUG)
-# logger formats
-DEFAULT_LOGGING_FORMAT = logging.Formatter(
-    "%(asctime)s %(levelname)-8s: %(message)s", "%H:%M:%S")
-DEBUG_LOGGING_FORMAT = logging.Formatter(
-    "%(asctime)s %(levelname)-8s %(module)s:%(name)s:%(funcName)s:%(lineno)d:%(message)s",
-    "%H:%M:%S")
-# logger handlers
-# pylint: disable-msg=C0103
-streamHandler = logging.StreamHandler(sys.stdout)
-streamHandler.setFormatter(DEFAULT_LOGGING_FORMAT)
+
+# logger formats and handler : DEFAULT_LOGGING_FORMAT, DEBUG_LOGGING_FORMAT
+# and streamHandler are created on first use, when a program initializes its
+# logger (see _get_logging and __getattr__).
+_LOGGING = {}
+_LOGGING_LOCK = threading.Lock()
+
+
+def _get_logging(name):
+    """Return one of the default logging objects, they are created on
+    first use."""
+    with _LOGGING_LOCK:
+        if not _LOGGING:
+            _LOGGING['DEFAULT_LOGGING_FORMAT'] = logging.Formatter(
+                "%(asctime)s %(levelname)-8s: %(message)s", "%H:%M:%S")
+            _LOGGING['DEBUG_LOGGING_FORMAT'] = logging.Formatter(
+                "%(asctime)s %(levelname)-8s %(module)s:%(name)s:%(funcName)s:%(lineno)d:%(message)s",
+                "%H:%M:%S")
+            # logger handlers
+            handler = logging.StreamHandler(sys.stdout)
+            handler.setFormatter(_LOGGING['DEFAULT_LOGGING_FORMAT'])
+            _LOGGING['streamHandler'] = handler
+        return _LOGGING[name]
+
+
+def _install_queue_logging(debug_file=None, max_bytes=10 << 20,
+                           backup_count=3):
+    """Route the root logger through a QueueHandler : records are written by
+    a background thread (QueueListener) to the stream handler and to the
+    optional debug file, a buffered and rotating log file. The previous debug
+    file is rotated at installation.
+    This function can be called many times, the handlers are installed once.
+    Everything is flushed at exit (see _stop_queue_logging)."""
+    from logging import handlers
+    stream_handler = _get_logging('streamHandler')
+    if _LOGGING.get('queueDisabled'):
+        # the records are handled by the thread emitting them (server mode).
+        if debug_file:
+            _add_debug_file(debug_file)
+        return None
+    with _LOGGING_LOCK:
+        listener = _LOGGING.get('queueListener')
+        if listener is None:
+            log_queue = queue.Queue(-1)
+            queue_handler = handlers.QueueHandler(log_queue)
+            listener = handlers.QueueListener(log_queue, stream_handler,
+                                              respect_handler_level=True)
+            root = logging.getLogger()
+            root.removeHandler(stream_handler)
+            root.addHandler(queue_handler)
+            listener.start()
+            _LOGGING['queueHandler'] = queue_handler
+            _LOGGING['queueListener'] = listener
+            _LOGGING['debugFiles'] = {}
+            if not _LOGGING.get('atexit'):
+                atexit.register(_stop_queue_logging)
+                _LOGGING['atexit'] = True
+        if debug_file and debug_file not in _LOGGING['debugFiles']:
+            target = handlers.RotatingFileHandler(
+                debug_file, maxBytes=max_bytes, backupCount=backup_count,
+                encoding='utf-8', delay=True)
+            if os.path.exists(debug_file):
+                target.doRollover()
+            target.setFormatter(_LOGGING['DEBUG_LOGGING_FORMAT'])
+            buffered = handlers.MemoryHandler(
+                1024, flushLevel=logging.WARNING, target=target)
+            _LOGGING['debugFiles'][debug_file] = buffered
+            # the listener thread reads this attribute for every record.
+            listener.handlers = listener.handlers + (buffered,)
+        return _LOGGING['queueHandler']
+
+
+def _add_debug_file(debug_file):
+    """Write every record into the debug file too, without the background
+    thread. The handler is added once per file."""
+    debug_format = _get_logging('DEBUG_LOGGING_FORMAT')
+    with _LOGGING_LOCK:
+        files = _LOGGING.setdefault('fileHandlers', {})
+        if debug_file not in files:
+            handler = logging.FileHandler(debug_file, 'w', 'utf-8')
+            handler.setFormatter(debug_format)
+            logging.getLogger().addHandler(handler)
+            files[debug_file] = handler
+
+
+def _disable_queue_logging(disabled=True):
+    """Stop the background thread of the queue logging and do not start it
+    again, until this function is called with disabled=False : the records
+    are handled by the thread emitting them, so the server can route them to
+    the streams of each request. The debug files are kept."""
+    with _LOGGING_LOCK:
+        if not disabled:
+            _LOGGING.pop('queueDisabled', None)
+            return
+        _LOGGING['queueDisabled'] = True
+        listener = _LOGGING.pop('queueListener', None)
+        if listener is None:
+            return
+        listener.stop()
+        root = logging.getLogger()
+        root.removeHandler(_LOGGING.pop('queueHandler'))
+        for buffered in _LOGGING['debugFiles'].values():
+            root.addHandler(buffered)
+        if _LOGGING['streamHandler'] not in root.handlers:
+            root.addHandler(_LOGGING['streamHandler'])
+
+
+def _stop_queue_logging():
+    """Write the pending records, stop the background thread and restore
+    the stream handler on the root logger."""
+    with _LOGGING_LOCK:
+        listener = _LOGGING.pop('queueListener', None)
+        if listener is None:
+            return
+        # stop() waits until every queued record is handled.
+        listener.stop()
+        root = logging.getLogger()
+        root.removeHandler(_LOGGING.pop('queueHandler'))
+        for buffered in _LOGGING.pop('debugFiles').values():
+            buffered.flush()
+            buffered.target.close()
+            buffered.close()
+        if _LOGGING['streamHandler'] not in root.handlers:
+            root.addHandler(_LOGGING['streamHandler'])
+
+
+# debug mode of the request served by the current thread of a ProgramServer
+# ({'debug': bool, 'names': tuple}), None outside of a server.
+_LOG_CONTEXT = contextvars.ContextVar('argtoolbox_log_context', default=None)
+
+
+def _set_debug_logging(names=None):
+    """Enable the debug mode : DEBUG level for the loggers 'names' (the
+    root logger by default) and the debug format for the stream handler.
+    Inside a request of a ProgramServer, only this request is changed (see
+    _LOG_CONTEXT), the loggers are shared by the concurrent requests."""
+    context = _LOG_CONTEXT.get()
+    if context is not None:
+        context['debug'] = True
+        context['names'] = tuple(names or ())
+        return
+    if names:
+        for name in names:
+            logging.getLogger(name).setLevel(logging.DEBUG)
+    else:
+        logging.getLogger().setLevel(logging.DEBUG)
+    _get_logging('streamHandler').setFormatter(
+        _get_logging('DEBUG_LOGGING_FORMAT'))
+
+
+def __getattr__(name):
+    if name in ('DEFAULT_LOGGING_FORMAT', 'DEBUG_LOGGING_FORMAT',
+                'streamHandler'):
+        return _get_logging(name)
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
 
 # debug mode
 # if you need debug during class construction, file config loading, ...,
 # you need to modify the logger level here.
-#log.addHandler(streamHandler)
+#log.addHandler(_get_logging('streamHandler'))
 #log.setLevel(logging.DEBUG)
-#streamHandler.setFormatter(DEBUG_LOGGING_FORMAT)
+#_get_logging('streamHandler').setFormatter(
+#    _get_logging('DEBUG_LOGGING_FORMAT'))
 
 
 class DefaultHook(object):
@@ -66,8 +239,14 @@ class DefaultHook(object):
     This class does nothing. This is the default class for creating your own
     hook. After reading an option from the config file, you can apply a
     postprocessing, like the base64 decoding or every thing you want.
+
+    A hook doing I/O (reading a file, asking a keyring agent, ...) should set
+    io_bound to True, or be a coroutine function. Such hooks are applied by
+    Config.load in a thread pool (or an event loop), all elements together.
     """
 
+    io_bound = False
+
     def __init__(self):
         pass
 
@@ -107,6 +286,14 @@ class Base64ElementHook(DefaultHook):
             raise TypeError(str(ex))
 
 
+def _is_concurrent_hook(hook):
+    """Return True if the hook can be applied concurrently with the other
+    ones : I/O bound hooks and coroutine hooks."""
+    return (getattr(hook, 'io_bound', False)
+            or inspect.iscoroutinefunction(hook)
+            or inspect.iscoroutinefunction(getattr(hook, '__call__', None)))
+
+
 class SectionHook(object):
     """
     The SectionHook class is used during the configuration reloading
@@ -139,30 +326,253 @@ class SectionHook(object):
             setattr(self.section, self.attribute, value)
 
 
+class ResolvedInterpolation(configparser.Interpolation):
+    """Interpolation engine for Config (see the interpolation argument).
+
+    It supports the BasicInterpolation syntax, %(option)s, and references to
+    the options of other sections : ${section:option} (and ${option} for the
+    current section). '%%' and '$$' are escaped '%' and '$'.
+
+    Instead of expanding the references on every get, a dependency graph of
+    every option of the file is built once, then everything is resolved in
+    topological order and cached. The cache is dropped when the parser reads
+    a file or when an option is set. Errors (missing references, cycles) are
+    only raised when a broken option is read.
+    """
+
+    _PATTERN = re.compile(r"%\((?P<local>[^)]+)\)s|\$\{(?P<ref>[^}]+)\}"
+                          r"|(?P<escape>%%|\$\$)")
+
+    def __init__(self):
+        # one cache per parser (parsers are not hashable, the id is used) :
+        # {id(parser): (weakref(parser), {(section, option): (raw, value)})}
+        self._caches = {}
+
+    def _get_cache(self, parser):
+        entry = self._caches.get(id(parser))
+        if entry is None or entry[0]() is not parser:
+            key = id(parser)
+            ref = weakref.ref(parser, lambda r: self._caches.pop(key, None))
+            entry = (ref, self._build(parser))
+            self._caches[key] = entry
+        return entry[1]
+
+    def _drop_cache(self, parser):
+        self._caches.pop(id(parser), None)
+
+    def before_get(self, parser, section, option, value, defaults):
+        # pylint: disable-msg=R0913
+        cache = self._get_cache(parser)
+        entry = cache.get((section, option))
+        if entry is None or entry[0] != value:
+            # value which does not come from the file (vars, fallback, ...)
+            entry = (value, self._resolve_alone(parser, section, option,
+                                                value, cache, defaults))
+        if isinstance(entry[1], Exception):
+            raise entry[1]
+        return entry[1]
+
+    def before_set(self, parser, section, option, value):
+        self._drop_cache(parser)
+        return value
+
+    def before_read(self, parser, section, option, value):
+        self._drop_cache(parser)
+        return value
+
+    def _parse(self, parser, section, option, value):
+        """Split a raw value into literal strings and (section, option)
+        references."""
+        parts = []
+        pos = 0
+        for match in self._PATTERN.finditer(value):
+            parts.append(self._literal(option, section, value,
+                                       value[pos:match.start()]))
+            if match.group('escape'):
+                parts.append(match.group('escape')[0])
+            elif match.group('local'):
+                parts.append((section, parser.optionxform(
+                    match.group('local'))))
+            else:
+                ref = match.group('ref').split(':')
+                if len(ref) == 1:
+                    parts.append((section, parser.optionxform(ref[0])))
+                elif len(ref) == 2:
+                    parts.append((ref[0], parser.optionxform(ref[1])))
+                else:
+                    raise configparser.InterpolationSyntaxError(
+                        option, section,
+                        "More than one ':' found: %r" % match.group())
+            pos = match.end()
+        parts.append(self._literal(option, section, value, value[pos:]))
+        return parts
+
+    @staticmethod
+    def _literal(option, section, value, literal):
+        if '%' in literal:
+            raise configparser.InterpolationSyntaxError(
+                option, section,
+                "'%%' must be followed by '%%' or '(', found: %r" % value)
+        return literal
+
+    def _build(self, parser):
+        """Resolve every option of every section, in topological order."""
+        raw = OrderedDict()
+        for section in [parser.default_section] + parser.sections():
+            if section == parser.default_section:
+                items = parser.defaults().items()
+            else:
+                items = parser.items(section, raw=True)
+            for option, value in items:
+                raw[(section, option)] = value
+        cache = {}
+        graph = {}
+        for key, value in raw.items():
+            if value is None:
+                cache[key] = (value, value)
+                continue
+            try:
+                graph[key] = self._parse(parser, key[0], key[1], value)
+            except configparser.InterpolationError as ex:
+                cache[key] = (value, ex)
+        # Kahn's algorithm
+        waiting = {}
+        dependents = {}
+        ready = []
+        for key, parts in graph.items():
+            # missing options and broken ones are not waited for.
+            deps = set(p for p in parts if isinstance(p, tuple) and p in graph)
+            waiting[key] = len(deps)
+            for dep in deps:
+                dependents.setdefault(dep, []).append(key)
+            if not deps:
+                ready.append(key)
+        while ready:
+            key = ready.pop()
+            res = []
+            for part in graph[key]:
+                if not isinstance(part, tuple):
+                    res.append(part)
+                    continue
+                dep = cache.get(part)
+                if dep is None:
+                    res = configparser.InterpolationMissingOptionError(
+                        key[1], key[0], raw[key], part[1])
+                    break
+                if isinstance(dep[1], Exception):
+                    res = dep[1]
+                    break
+                res.append(dep[1])
+            if isinstance(res, list):
+                res = "".join(res)
+            cache[key] = (raw[key], res)
+            for dependent in dependents.get(key, []):
+                waiting[dependent] -= 1
+                if waiting[dependent] == 0:
+                    ready.append(dependent)
+        # the remaining options are part of (or depend on) a cycle.
+        for key in graph:
+            if key not in cache:
+                cache[key] = (raw[key], configparser.InterpolationDepthError(
+                    key[1], key[0], raw[key]))
+        return cache
+
+    def _resolve_alone(self, parser, section, option, value, cache,
+                       defaults):
+        # pylint: disable-msg=R0913
+        try:
+            parts = self._parse(parser, section, option, value)
+        except configparser.InterpolationError as ex:
+            return ex
+        res = []
+        for part in parts:
+            if not isinstance(part, tuple):
+                res.append(part)
+            elif part in cache:
+                if isinstance(cache[part][1], Exception):
+                    return cache[part][1]
+                res.append(cache[part][1])
+            elif part[0] == section and part[1] in defaults:
+                res.append(defaults[part[1]])
+            else:
+                return configparser.InterpolationMissingOptionError(
+                    option, section, value, part[1])
+        return "".join(res)
+
+
 class Config(object):
     # pylint: disable-msg=R0902
     """This is the entry point, this class will contains all Section and
      Elements."""
 
     def __init__(self, prog_name, config_file=None, desc=None,
-                 mandatory=False, use_config_file=True):
+                 mandatory=False, use_config_file=True, hook_workers=8,
+                 lazy_load=False, interpolation=None):
+        """Keyword Arguments:
+
+    - interpolation -- configparser.Interpolation instance used by the file
+    parser, like ResolvedInterpolation(). Default: BasicInterpolation.
+
+    - lazy_load -- The configuration file is read once but every section is
+    only loaded (type conversion, checks, hooks) on first access, through
+    Config.__getattr__, get_section or its elements. Loading errors are
+    raised by this first access, use validate_all to check everything.
+    exit_on_failure is ignored for the sections not loaded yet.
+    """
         self.prog_name = prog_name
         self.config_file = config_file
         self.use_config_file = use_config_file
         self._desc = desc
         self.mandatory = mandatory
 
+        # flat load plan, see freeze_schema.
+        self._plan = None
         self.sections = OrderedDict()
         self._default_section = self.add_section(SimpleSection("DEFAULT"))
         self.parser = None
+        # command line arguments used instead of sys.argv[1:] when they are
+        # set (daemon mode, batch mode, ...)
+        self.argv = None
+        # configuration files really read during the last (re)loading.
+        self.loaded_files = []
+        # max number of I/O bound element hooks running at the same time.
+        self.hook_workers = hook_workers
+        self.lazy_load = lazy_load
+        self.interpolation = interpolation
+        self.file_parser = self._new_file_parser()
+        # resource pools, see register_pool.
+        self._pool_factories = {}
+        self._pools = {}
+        self._pools_lock = threading.Lock()
+        # incremented by refresh_pools, see pool.
+        self._pools_generation = 0
+
+    def __getstate__(self):
+        # the pools (open clients) are not shared with the copies.
+        state = self.__dict__.copy()
+        state['_pools'] = {}
+        del state['_pools_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._pools_lock = threading.Lock()
+
+    def _new_file_parser(self):
+        """This method will return a new (empty) file parser."""
+        kwargs = {}
+        if self.interpolation is not None:
+            kwargs['interpolation'] = self.interpolation
         if sys.version_info[2] <= 2:
-            self.file_parser = configparser.SafeConfigParser()
-        else:
-            self.file_parser = configparser.ConfigParser()
+            return configparser.SafeConfigParser(**kwargs)
+        return configparser.ConfigParser(**kwargs)
 
     def add_section(self, section):
         """Add a new Section object to the config. Should be a subclass of
         _AbstractSection."""
+        if self._plan is not None:
+            raise RuntimeError("The schema of %s is frozen, sections can not "
+                               "be added." % self.prog_name)
         if not issubclass(section.__class__, _AbstractSection):
             raise TypeError("argument should be a subclass of Section")
         self.sections[section.get_key_name()] = section
@@ -170,18 +580,49 @@ class Config(object):
 
     def get_section(self, name):
         if name.lower() == "default":
-            return self._default_section
-        return self.sections.get(name)
+            return self.get_default_section()
+        s = self.sections.get(name)
+        if s is not None:
+            s.materialize()
+        return s
 
     def get_default_section(self):
         """This method will return default section object"""
+        self._default_section.materialize()
         return self._default_section
 
+    def get_default_file_list(self):
+        """This method will return the list of the configuration files the
+        program is looking for when no config_file was provided."""
+        defaultFileList = []
+        defaultFileList.append(self.prog_name + ".cfg")
+        defaultFileList.append(
+            os.path.expanduser('~/.' + self.prog_name + '.cfg'))
+        defaultFileList.append('/etc/' + self.prog_name + '.cfg')
+        return defaultFileList
+
     def load(self, exit_on_failure=False):
         """One you have added all your configuration data (Section, Element,
         ...) you need to load data from the config file."""
         if self.use_config_file:
             self._load(exit_on_failure)
+            self.refresh_pools()
+
+    def freeze_schema(self):
+        """This method compiles the declared sections and elements into a
+        flat load plan (see _LoadPlan) used by the next loadings, instead of
+        the per element loading methods. Sections and elements can not be
+        added anymore, the declarations of the compiled elements (e_type,
+        default, conf_required, hooks, lazy_hooks) can not be modified
+        (RuntimeError).
+        It returns the plan."""
+        if self._plan is None:
+            self._plan = _LoadPlan(list(self.sections.values()))
+            for s in list(self.sections.values()):
+                s.frozen = True
+            for e in self._plan.elements:
+                e.freeze()
+        return self._plan
 
     def _load(self, exit_on_failure):
         """One you have added all your configuration data (Section, Element,
@@ -202,15 +643,13 @@ class Config(object):
                         self.config_file,
                         "file descriptor")
         else:
-            defaultFileList = []
-            defaultFileList.append(self.prog_name + ".cfg")
-            defaultFileList.append(
-                os.path.expanduser('~/.' + self.prog_name + '.cfg'))
-            defaultFileList.append('/etc/' + self.prog_name + '.cfg')
+            defaultFileList = self.get_default_file_list()
             log.debug("defaultFileList: " + str(defaultFileList))
             discoveredFileList = self.file_parser.read(defaultFileList)
 
         log.debug("discoveredFileList: " + str(discoveredFileList))
+        self.loaded_files = discoveredFileList
+        _set_parser_sources(self.file_parser, discoveredFileList)
 
         if self.mandatory and len(discoveredFileList) < 1:
             msg = "The required config file was missing."
@@ -219,20 +658,214 @@ class Config(object):
             raise EnvironmentError(msg)
 
         log.debug("loading configuration ...")
-        if exit_on_failure:
+        if self.lazy_load:
+            for s in list(self.sections.values()):
+                s.defer_load(self.file_parser)
+            log.debug("configuration indexed.")
+            return
+        if self._plan is not None:
+            try:
+                self._plan.run(self.file_parser)
+                self.apply_hooks()
+            except ValueError:
+                if exit_on_failure:
+                    sys.exit(1)
+                raise
+        elif exit_on_failure:
             for s in list(self.sections.values()):
                 log.debug("loading section : " + s.get_section_name())
                 try:
                     s.load(self.file_parser)
                 except ValueError:
                     sys.exit(1)
+            try:
+                self.apply_hooks()
+            except ValueError:
+                sys.exit(1)
         else:
             for s in list(self.sections.values()):
                 log.debug("loading section : " + s.get_section_name())
                 s.load(self.file_parser)
+            self.apply_hooks()
 
         log.debug("configuration loaded.")
 
+    def iter_elements(self):
+        """This method will yield every element of every section, including
+        the elements of the nested sections."""
+        for s in list(self.sections.values()):
+            for e in s.iter_elements():
+                yield e
+
+    def apply_hooks(self):
+        """This method applies the I/O bound and coroutine element hooks
+        deferred by the loading process. The hooks of an element run in
+        order, the elements are processed concurrently (at most hook_workers
+        at the same time). Every failure is logged, then the error of the
+        first failing element (in declaration order) is raised.
+        Lazy elements (lazy_hooks) are left untouched."""
+        # the sections not loaded yet (lazy_load) are left untouched too.
+        elements = [e for s in list(self.sections.values())
+                    if not s.load_pending for e in s.iter_elements()
+                    if e.hooks_pending and not e.lazy_hooks]
+        if not elements:
+            return
+        import asyncio
+        # pylint: disable-msg=W0621
+        log = logging.getLogger('argtoolbox')
+        log.debug("applying %d element hooks concurrently.", len(elements))
+
+        async def apply_all(executor):
+            semaphore = asyncio.Semaphore(self.hook_workers)
+            return await asyncio.gather(
+                *[e.apply_hooks_async(executor, semaphore) for e in elements],
+                return_exceptions=True)
+
+        with futures.ThreadPoolExecutor(
+                max_workers=self.hook_workers) as executor:
+            results = _run_awaitable(apply_all(executor))
+        errors = [(e, r) for e, r in zip(elements, results)
+                  if isinstance(r, BaseException)]
+        for e, ex in errors:
+            log.error("Hook failure for the field '%(name)s' : %(error)s",
+                      {"name": e.name, "error": ex})
+        if errors:
+            raise errors[0][1]
+
+    def validate_all(self):
+        """This method loads every section not loaded yet (lazy_load) and
+        applies every pending element hook (lazy_hooks), so every error is
+        raised right now, as if nothing was lazy."""
+        for s in list(self.sections.values()):
+            s.materialize()
+        self.apply_hooks()
+        for e in self.iter_elements():
+            e.apply_hooks()
+
+    def overlay(self, **overrides):
+        """This method will return a copy-on-write view of the
+        configuration. Reads fall through to the current configuration,
+        writes (element.value = ...) only change the view.
+
+    Keyword Arguments:
+
+    - <section>__<element> -- new value of an element, <element> alone for
+    the DEFAULT section.
+
+    - <section> -- a section object used instead of the section <section>
+    (another server section for example).
+
+    The current configuration is not modified, views can be created and
+    discarded from many threads. Only the value of the elements is
+    overlaid; the representation, get_values, as_dataclasses and the
+    argparse arguments of the view use it. An overridden section gets its
+    own pool in the view (see pool), closed by the close_pools method of
+    the view.
+    """
+        return _ConfigOverlay(self, {}, {}).overlay(**overrides)
+
+    def register_pool(self, key, factory, size=4, idle_timeout=300,
+                      check=None, close=None):
+        """Register the factory of the clients (connections, ...) of a
+        section, see pool. factory(section) returns a new client.
+
+    Keyword Arguments:
+
+    - key -- a section name, or a section class for all its sections.
+
+    - size -- max number of clients of a pool.
+
+    - idle_timeout -- the clients unused for idle_timeout seconds are
+    closed.
+
+    - check -- check(client) returns False if the client is not usable
+    anymore, it is then closed and replaced. Default: no check.
+
+    - close -- close(client) releases a client. Default: client.close().
+    """
+        with self._pools_lock:
+            self._pool_factories[key] = {
+                "factory": factory, "size": size,
+                "idle_timeout": idle_timeout, "check": check, "close": close}
+
+    def _get_pool_factory(self, name, section):
+        factory = self._pool_factories.get(name)
+        if factory is None:
+            for cls in type(section).__mro__:
+                factory = self._pool_factories.get(cls)
+                if factory is not None:
+                    break
+        return factory
+
+    @staticmethod
+    def _get_section_fingerprint(section):
+        return hashlib.sha1(repr(section.get_values()).encode(
+            'utf-8')).hexdigest()
+
+    def pool(self, name):
+        """This method will return the ResourcePool of the section 'name'.
+        The pool is created on first use. It is closed and replaced when
+        the values of the section change : they are compared once per
+        load (load, reload, refresh_pools)."""
+        section = self.get_section(name)
+        if section is None:
+            raise ValueError("Unknown section : %s" % name)
+        key = section.get_key_name()
+        with self._pools_lock:
+            pool = self._pools.get(key)
+            generation = self._pools_generation
+        if pool is not None and pool.generation == generation:
+            return pool
+        fingerprint = self._get_section_fingerprint(section)
+        old = None
+        with self._pools_lock:
+            pool = self._pools.get(key)
+            if pool is not None and pool.fingerprint != fingerprint:
+                old = pool
+                pool = None
+            if pool is None:
+                factory = self._get_pool_factory(key, section)
+                if factory is None:
+                    raise ValueError("No pool factory for the section : %s"
+                                     % name)
+                pool = ResourcePool(section, fingerprint=fingerprint,
+                                    **factory)
+                self._pools[key] = pool
+            pool.generation = generation
+        if old is not None:
+            # pylint: disable-msg=W0621
+            log = logging.getLogger('argtoolbox')
+            log.debug("section %s changed, closing its pool.", key)
+            old.close()
+        return pool
+
+    def refresh_pools(self):
+        """This method closes the pools of the sections whose values have
+        changed. It is called by load and reload, call it after modifying
+        the values of a section directly."""
+        with self._pools_lock:
+            self._pools_generation += 1
+            generation = self._pools_generation
+            pools = list(self._pools.items())
+        for key, pool in pools:
+            section = self.sections.get(key)
+            if section is None or section.load_pending or \
+                    self._get_section_fingerprint(section) != pool.fingerprint:
+                with self._pools_lock:
+                    if self._pools.get(key) is pool:
+                        del self._pools[key]
+                pool.close()
+            else:
+                pool.generation = generation
+
+    def close_pools(self):
+        """This method closes every pool."""
+        with self._pools_lock:
+            pools = list(self._pools.values())
+            self._pools.clear()
+        for pool in pools:
+            pool.close()
+
     def get_parser(self, **kwargs):
         """This method will create and return a new parser with prog_name,
         description, and a config file argument.
@@ -271,7 +904,7 @@ class Config(object):
             compline = os.environ.get('COMP_LINE')
             args = self.parser.parse_known_args(compline.split()[1:])[0]
         else:
-            args = self.parser.parse_known_args()[0]
+            args = self.parser.parse_known_args(self.argv)[0]
         if hooks is not None:
             if isinstance(hooks, list):
                 for h in hooks:
@@ -293,58 +926,777 @@ class Config(object):
             log = logging.getLogger('argtoolbox')
             log.debug("reloading configuration ...")
             if args.config_file:
-                if sys.version_info[2] <= 2:
-                    self.file_parser = configparser.SafeConfigParser()
-                else:
-                    self.file_parser = configparser.ConfigParser()
+                self.file_parser = self._new_file_parser()
                 discoveredFileList = self.file_parser.read(args.config_file)
                 log.debug("discoveredFileList: %s", discoveredFileList)
+                self.loaded_files = discoveredFileList
+                _set_parser_sources(self.file_parser, discoveredFileList)
             for s in list(self.sections.values()):
                 log.debug("loading section : %s", s.get_section_name())
                 s.reset()
-                s.load(self.file_parser)
+                if self.lazy_load:
+                    s.defer_load(self.file_parser)
+                elif self._plan is None:
+                    s.load(self.file_parser)
+            if self._plan is not None and not self.lazy_load:
+                self._plan.run(self.file_parser)
+            self.apply_hooks()
+            self.refresh_pools()
             log.debug("configuration reloaded.")
 
     def __getattr__(self, name):
+        # __dict__ is empty while the object is copied or unpickled.
+        if 'sections' not in self.__dict__:
+            raise AttributeError(name)
         if name.lower() == "default":
-            return self._default_section
+            return self.get_default_section()
         s = self.sections.get(name)
         if s is not None:
+            s.materialize()
             return s
         else:
             raise AttributeError("'%(class)s' object has no attribute \
 '%(name)s'" % {"name": name, "class": self.__class__.__name__})
 
-    def __str__(self):
+    def get_fingerprint(self):
+        """This method will return a hash of all the loaded values. It can be
+        used to detect configuration changes."""
         res = []
-        res.append("Configuration of %(prog_name)s : " % self.__dict__)
-        for s in list(self.sections.values()):
-            res.append("".join(s.get_representation("\t")))
-        return "\n".join(res)
+        for key, s in list(self.sections.items()):
+            if s.load_pending:
+                # not loaded yet (lazy_load), the raw data is used instead.
+                continue
+            res.append((key, s.get_values()))
+        if self.lazy_load:
+            res.append(sorted(self.file_parser.defaults().items()))
+            for name in self.file_parser.sections():
+                res.append((name, self.file_parser.items(name, raw=True)))
+        return hashlib.sha1(repr(res).encode('utf-8')).hexdigest()
+
+    def __str__(self):
+        return "".join(self.iter_representation())
+
+    def iter_representation(self, sections=None, depth=None):
+        """This method will yield the string representation of the
+        configuration, chunk by chunk.
+
+    Keyword Arguments:
 
-    def write_default_config_file(self, output, comments=True):
+    - sections -- list of the section names (keys) to display.
+    Default: every section.
+
+    - depth -- max number of nested section levels, 1 means only the
+    sections of the configuration, without their sub sections.
+    Default: no limit.
+    """
+        yield "Configuration of %(prog_name)s : " % {
+            "prog_name": self.prog_name}
+        for key, s in list(self.sections.items()):
+            if sections is not None and key not in sections:
+                continue
+            yield "\n"
+            for chunk in s.iter_representation("\t", depth=depth):
+                yield chunk
+
+    def write_representation(self, stream, sections=None, depth=None,
+                             bufsize=8192):
+        """This method writes the string representation of the
+        configuration (see iter_representation) into the stream,
+        incrementally."""
+        buf = []
+        size = 0
+        for chunk in self.iter_representation(sections, depth):
+            buf.append(chunk)
+            size += len(chunk)
+            if size >= bufsize:
+                stream.write("".join(buf))
+                buf = []
+                size = 0
+        stream.write("".join(buf))
+
+    def _get_dataclasses(self, sections=None):
+        """Return the list of (field name, section, dataclass) of the
+        sections and the root dataclass."""
+        import typing
+        res = []
+        for key, s in list(self.sections.items()):
+            if sections is not None and key not in sections:
+                continue
+            s.materialize()
+            name = "default" if key == "DEFAULT" else _get_field_name(key)
+            res.append((name, s, _get_section_dataclass(s)))
+        _check_field_names(self.prog_name,
+                           [s.get_key_name() for _, s, _ in res],
+                           [name for name, _, _ in res])
+        root = _get_dataclass(
+            _get_class_name(self.prog_name, "Config"),
+            tuple((name, cls or typing.Mapping[str, str])
+                  for name, s, cls in res))
+        return res, root
+
+    def as_dataclasses(self, sections=None):
+        """This method will return a frozen (and slotted) dataclass instance
+        holding the loaded values : config.as_dataclasses().ldap.host is
+        config.ldap.host.value, without any property or __getattr__ cost.
+        The classes are built from the declared elements, typed according
+        to their e_type, and cached per schema. The values are a snapshot,
+        they are not updated by a reload. ListSection values are mappings,
+        the sub sections of elements are not part of the view.
+        sections is the list of the section names (keys) to use.
+        """
+        res, root = self._get_dataclasses(sections)
+        values = []
+        for _, s, cls in res:
+            if cls is None:
+                values.append(s.elements)
+            else:
+                values.append(cls(*[e.value for e in
+                                    list(s.elements.values())]))
+        return root(*values)
+
+    def get_dataclasses_source(self, sections=None):
+        """This method will return the python source code of the classes
+        built by as_dataclasses, it can be stored into a module for static
+        type checkers."""
+        res, root = self._get_dataclasses(sections)
+        lines = ["import array", "import dataclasses", "import typing", ""]
+        for cls in [cls for _, _, cls in res if cls is not None] + [root]:
+            lines.append("")
+            lines.append("@dataclasses.dataclass(frozen=True)")
+            lines.append("class %s:" % cls.__name__)
+            for field, annotation in cls.__annotations__.items():
+                lines.append("    %s: %s" % (field,
+                                             _get_type_source(annotation)))
+            if not cls.__annotations__:
+                lines.append("    pass")
+            lines.append("")
+        return "\n".join(lines)
+
+    def write_default_config_file(self, output, comments=True,
+                                  skip_unchanged=False):
         """This method write a sample file, with attributes, descriptions,
         sample values, required flags, using the configuration object
         properties.
+        The file is rendered into a temporary file which replaces the output
+        file at the end. With skip_unchanged, the output file is not touched
+        if its content would be the same.
+        It returns True if the output file was written, False if it was
+        unchanged and None if the configuration does not use a file.
         """
-        if self.use_config_file:
-            # pylint: disable-msg=W0621
-            log = logging.getLogger('argtoolbox')
-            with open(output, 'w') as f:
+        if not self.use_config_file:
+            return None
+        # pylint: disable-msg=W0621
+        log = logging.getLogger('argtoolbox')
+        tmp = "%s.%d.tmp" % (output, os.getpid())
+        try:
+            with open(tmp, 'w', buffering=1 << 16,
+                      encoding='utf-8') as fde:
+                f = _HashWriter(fde)
                 if comments:
-                    f.write("#####################################\n")
-                    f.write("# Description :\n")
-                    f.write("# -------------\n# ")
+                    res = ["#####################################\n",
+                           "# Description :\n",
+                           "# -------------\n# "]
                     for i in self._desc.split('\n'):
-                        f.write("# ")
-                        f.write(i)
-                        f.write("\n")
-                    f.write("\n\n")
+                        res.append("# " + i + "\n")
+                    res.append("\n\n")
+                    f.write("".join(res))
 
                 for s in list(self.sections.values()):
-                    log.debug("loading section : " + s.get_section_name())
+                    log.debug("writing section : %s", s.get_section_name())
                     s.write_config_file(f, comments)
-            log.debug("config file generation completed : " + str(output))
+            if skip_unchanged and f.digest() == _file_digest(output):
+                os.remove(tmp)
+                log.debug("config file unchanged : %s", output)
+                return False
+            if os.path.exists(output):
+                os.chmod(tmp, os.stat(output).st_mode)
+            os.replace(tmp, output)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        log.debug("config file generation completed : %s", output)
+        return True
+
+
+# dataclasses built by Config.as_dataclasses, per schema.
+_DATACLASSES = {}
+_DATACLASSES_LOCK = threading.Lock()
+
+
+def _get_field_name(name):
+    """Convert an element or section name into an attribute name."""
+    res = re.sub(r'\W', '_', name)
+    if not res or res[0].isdigit():
+        res = "f_" + res
+    if keyword.iskeyword(res):
+        res += "_"
+    return res
+
+
+def _check_field_names(owner, names, fields):
+    """Raise a ValueError if two names give the same attribute name."""
+    seen = {}
+    for name, field in zip(names, fields):
+        if field in seen:
+            raise ValueError(
+                "'%(first)s' and '%(second)s' of %(owner)s give the same "
+                "attribute name : %(field)s" % {
+                    "first": seen[field], "second": name, "owner": owner,
+                    "field": field})
+        seen[field] = name
+
+
+def _get_class_name(name, suffix):
+    return "".join(p.capitalize() for p in re.split(r'[\W_]+', name)) \
+        + suffix
+
+
+def _get_type(elt):
+    """Return the type annotation of an element, according to its e_type."""
+    import typing
+    if elt.hooks:
+        # hooks can change the type of the value (base64 : bytes, ...)
+        return typing.Any
+    if isinstance(elt.e_type, TypedList):
+        res = array.array
+    elif elt.e_type in (str, int, float, bool):
+        res = elt.e_type
+    elif elt.e_type is list:
+        res = typing.List[str]
+    else:
+        return typing.Any
+    if elt.default is None and not elt.conf_required:
+        res = typing.Optional[res]
+    return res
+
+
+def _get_type_source(annotation):
+    if isinstance(annotation, type):
+        if annotation.__module__ == 'builtins' or hasattr(
+                annotation, '__dataclass_fields__'):
+            return annotation.__name__
+        return "%s.%s" % (annotation.__module__, annotation.__name__)
+    return repr(annotation)
+
+
+def _get_dataclass(name, fields):
+    """Build (or get from the cache) a frozen dataclass."""
+    import dataclasses
+    key = (name, fields)
+    with _DATACLASSES_LOCK:
+        cls = _DATACLASSES.get(key)
+        if cls is None:
+            kwargs = {"frozen": True}
+            # slots are not supported before python 3.10
+            if sys.version_info >= (3, 10):
+                kwargs["slots"] = True
+            cls = dataclasses.make_dataclass(name, list(fields), **kwargs)
+            _DATACLASSES[key] = cls
+        return cls
+
+
+def _get_section_dataclass(section):
+    """Return the dataclass of a section, None for a ListSection (its
+    values are given as a mapping)."""
+    if isinstance(section, _SectionOverlay):
+        # a view has the schema of its section.
+        return _get_section_dataclass(section._section)
+    if not isinstance(section, _Section):
+        return None
+    elements = list(section.elements.values())
+    fields = tuple((_get_field_name(e.name), _get_type(e)) for e in elements)
+    _check_field_names(section.get_section_name(),
+                       [e.name for e in elements], [f for f, _ in fields])
+    return _get_dataclass(
+        _get_class_name(section.get_key_name(), "Section"), fields)
+
+
+def _set_parser_sources(file_parser, files):
+    """Keep the list of the files read by the file parser."""
+    # pylint: disable-msg=W0212
+    file_parser._argtoolbox_sources = list(files or [])
+
+
+def get_parser_sources(file_parser):
+    """This method will return the list of the configuration files read by
+    a file parser of a Config (empty if the data came from a stream)."""
+    return getattr(file_parser, '_argtoolbox_sources', [])
+
+
+class ResourcePool(object):
+    """Pool of the clients of a section, see Config.register_pool and
+    Config.pool.
+
+    with config.pool("ldap").connection() as client:
+        ...
+    """
+
+    def __init__(self, section, factory, size=4, idle_timeout=300,
+                 check=None, close=None, fingerprint=None):
+        self.section = section
+        self.factory = factory
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.check = check
+        self._close = close
+        self.fingerprint = fingerprint
+        # load generation of the config when fingerprint was checked.
+        self.generation = None
+        self.closed = False
+        # (last use, client), the most recently used last.
+        self._idle = []
+        self._count = 0
+        self._cond = threading.Condition()
+
+    def _close_client(self, client):
+        try:
+            if self._close is not None:
+                self._close(client)
+            elif hasattr(client, 'close'):
+                client.close()
+        # pylint: disable-msg=W0703
+        except Exception as ex:
+            logging.getLogger('argtoolbox').debug(
+                "Can not close a client of %s : %s",
+                self.section.get_section_name(), ex)
+
+    def _evict(self, now):
+        """Remove the expired idle clients, they must be closed."""
+        expired = [c for t, c in self._idle if now - t > self.idle_timeout]
+        if expired:
+            self._idle = [(t, c) for t, c in self._idle
+                          if now - t <= self.idle_timeout]
+            self._count -= len(expired)
+            self._cond.notify(len(expired))
+        return expired
+
+    def acquire(self, timeout=None):
+        """This method will return a client, an idle one or a new one. It
+        waits for a released client if size clients are in use.
+        TimeoutError is raised after timeout seconds."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            to_close = []
+            client = None
+            create = False
+            with self._cond:
+                while True:
+                    if self.closed:
+                        raise RuntimeError("The pool of %s is closed."
+                                           % self.section.get_section_name())
+                    to_close = self._evict(time.monotonic())
+                    if self._idle:
+                        client = self._idle.pop()[1]
+                        break
+                    if self._count < self.size:
+                        self._count += 1
+                        create = True
+                        break
+                    wait = None
+                    if deadline is not None:
+                        wait = deadline - time.monotonic()
+                        if wait <= 0:
+                            raise TimeoutError(
+                                "No client of %s available."
+                                % self.section.get_section_name())
+                    self._cond.wait(wait)
+            for old in to_close:
+                self._close_client(old)
+            if create:
+                try:
+                    return self.factory(self.section)
+                except BaseException:
+                    with self._cond:
+                        self._count -= 1
+                        self._cond.notify()
+                    raise
+            if self.check is None or self.check(client):
+                return client
+            self.release(client, discard=True)
+
+    def release(self, client, discard=False):
+        """This method gives back a client to the pool. It is closed if
+        discard is True (broken client, ...) or if the pool is closed."""
+        with self._cond:
+            if discard or self.closed:
+                self._count -= 1
+            else:
+                self._idle.append((time.monotonic(), client))
+                client = None
+            self._cond.notify()
+        if client is not None:
+            self._close_client(client)
+
+    @contextlib.contextmanager
+    def connection(self, timeout=None):
+        """Context manager acquiring and releasing a client. The client is
+        discarded if an exception was raised."""
+        client = self.acquire(timeout)
+        try:
+            yield client
+        except BaseException:
+            self.release(client, discard=True)
+            raise
+        self.release(client)
+
+    def close(self):
+        """This method closes the idle clients, the clients in use are
+        closed when they are released."""
+        with self._cond:
+            self.closed = True
+            idle = [c for t, c in self._idle]
+            self._idle = []
+            self._count -= len(idle)
+            self._cond.notify_all()
+        for client in idle:
+            self._close_client(client)
+
+
+class _LoadPlan(object):
+    """Flat load plan of the sections of a Config, see
+    Config.freeze_schema.
+
+    The facts about every element (option name, converter, default, flags,
+    hooks) are computed once and stored into parallel tuples, the plan loads
+    the elements with a single loop, the section names are computed once per
+    section. The sections
+    which are not simple ones (ListSection, elements with sub sections, ...)
+    are loaded by their own load method, in declaration order.
+    """
+
+    def __init__(self, sections):
+        steps = []
+        elements = []
+        converters = []
+        defaults = []
+        conf_required = []
+        hooks = []
+        deferred = []
+        for s in sections:
+            if not self.is_compilable(s):
+                steps.append((s, None, None, None))
+                continue
+            start = len(elements)
+            for e in list(s.elements.values()):
+                elements.append(e)
+                converters.append(_get_converter(e.e_type))
+                defaults.append(e.default)
+                conf_required.append(e.conf_required)
+                hooks.append(tuple(e.hooks))
+                deferred.append(bool(e.hooks) and (e.lazy_hooks or any(
+                    _is_concurrent_hook(h) for h in e.hooks)))
+            # pylint: disable-msg=W0212
+            steps.append((s, s._required, start, len(elements)))
+        self.steps = tuple(steps)
+        self.elements = tuple(elements)
+        self.names = tuple(e.name for e in elements)
+        self.converters = tuple(converters)
+        self.defaults = tuple(defaults)
+        self.conf_required = tuple(conf_required)
+        self.hooks = tuple(hooks)
+        self.deferred = tuple(deferred)
+
+    @staticmethod
+    def is_compilable(section):
+        """True if the section and its elements use the default loading
+        methods."""
+        if not isinstance(section, _Section) or \
+                type(section).load is not _Section.load:
+            return False
+        return all(type(e) is Element for e in section.elements.values())
+
+    def run(self, file_parser):
+        """Load every section from file_parser. Element hooks are applied
+        or marked as pending, like Element.load does."""
+        # pylint: disable-msg=W0621
+        log = logging.getLogger('argtoolbox')
+        elements = self.elements
+        names = self.names
+        converters = self.converters
+        defaults = self.defaults
+        conf_required = self.conf_required
+        hooks = self.hooks
+        deferred = self.deferred
+        default_section = file_parser.default_section
+        for section, required, start, end in self.steps:
+            if start is None:
+                section.load(file_parser)
+                continue
+            # like _Section.load, a section without elements is not read.
+            if start == end:
+                continue
+            # the name can be changed by a SectionHook.
+            section_name = section.get_section_name()
+            if section_name != default_section and \
+                    not file_parser.has_section(section_name):
+                if required:
+                    log.error("Required section : " + section_name)
+                    raise ValueError(
+                        configparser.NoSectionError(section_name))
+                log.debug("Missing section : " + section_name)
+                continue
+            for i in range(start, end):
+                e = elements[i]
+                try:
+                    e._value = converters[i](file_parser, section_name,
+                                             names[i])
+                except configparser.NoOptionError:
+                    if conf_required[i]:
+                        msg = "The required field '%(name)s' was missing \
+from the config file." % {"name": names[i]}
+                        log.error(msg)
+                        raise ValueError(msg)
+                    if defaults[i] is not None:
+                        e._value = defaults[i]
+                except ValueError as ex:
+                    log.error("The current field '%(name)s' was present, but "
+                              "the required type is : %(e_type)s.",
+                              {"name": names[i], "e_type": e.e_type})
+                    log.error(str(ex))
+                    raise ValueError(str(ex))
+                if deferred[i]:
+                    e._hooks_pending = True
+                else:
+                    e._hooks_pending = False
+                    for h in hooks[i]:
+                        h(e)
+
+
+_MISSING = object()
+
+
+class _ConfigOverlay(object):
+    """Copy-on-write view of a Config, see Config.overlay."""
+
+    # methods of Config run on the view, they read the overlaid sections.
+    _METHODS = ('iter_representation', 'write_representation',
+                'get_fingerprint', '_get_dataclasses', 'as_dataclasses',
+                'iter_elements')
+
+    def __init__(self, base, sections, values):
+        self._base = base
+        # section key -> section used instead of the base one.
+        self._sections = sections
+        # (section key, element name) -> value.
+        self._values = values
+        # pools of the overridden sections, see pool.
+        self._pools = {}
+        self._pools_lock = threading.Lock()
+
+    def overlay(self, **overrides):
+        """This method will return a new view with more overrides, see
+        Config.overlay."""
+        sections = dict(self._sections)
+        values = dict(self._values)
+        for key, value in list(overrides.items()):
+            if isinstance(value, _AbstractSection):
+                sections[key] = value
+        for key, value in list(overrides.items()):
+            if isinstance(value, _AbstractSection):
+                continue
+            sec_name, sep, elt_name = key.partition('__')
+            if not sep:
+                sec_name, elt_name = "DEFAULT", key
+            section = sections.get(sec_name)
+            if section is None:
+                section = self._base.sections.get(sec_name)
+            # the elements are declared before the section is loaded.
+            if elt_name not in getattr(section, 'elements', {}):
+                raise ValueError("Unknown element : %s" % key)
+            values[(sec_name, elt_name)] = value
+        return _ConfigOverlay(self._base, sections, values)
+
+    def get_section(self, name):
+        if name.lower() == "default":
+            name = "DEFAULT"
+        section = self._sections.get(name)
+        if section is None:
+            section = self._base.get_section(name)
+            if section is None:
+                return None
+        else:
+            section.materialize()
+        return _SectionOverlay(self._values, name, section)
+
+    def get_default_section(self):
+        """This method will return default section view"""
+        return self.get_section("DEFAULT")
+
+    @property
+    def sections(self):
+        """The section views, by key."""
+        keys = list(self._base.sections)
+        keys.extend(k for k in self._sections if k not in keys)
+        return OrderedDict((k, self.get_section(k)) for k in keys)
+
+    def pool(self, name):
+        """This method will return the ResourcePool of the section 'name'.
+        The pool of the base configuration is used if the section is not
+        overridden by the view, else the view has its own pool, closed by
+        close_pools."""
+        if name.lower() == "default":
+            name = "DEFAULT"
+        if name not in self._sections and \
+                not [k for k in self._values if k[0] == name]:
+            return self._base.pool(name)
+        section = self.get_section(name)
+        if section is None:
+            raise ValueError("Unknown section : %s" % name)
+        with self._pools_lock:
+            pool = self._pools.get(name)
+            if pool is None:
+                # pylint: disable-msg=W0212
+                factory = self._base._get_pool_factory(name, section._section)
+                if factory is None:
+                    raise ValueError("No pool factory for the section : %s"
+                                     % name)
+                pool = ResourcePool(section, **factory)
+                self._pools[name] = pool
+            return pool
+
+    def close_pools(self):
+        """This method closes the pools of the view."""
+        with self._pools_lock:
+            pools = list(self._pools.values())
+            self._pools.clear()
+        for pool in pools:
+            pool.close()
+
+    def __str__(self):
+        return "".join(self.iter_representation())
+
+    def __getattr__(self, name):
+        # __dict__ is empty while the object is copied or unpickled.
+        if '_base' not in self.__dict__:
+            raise AttributeError(name)
+        if name in self._METHODS:
+            return types.MethodType(getattr(Config, name), self)
+        if name.lower() == "default" or name in self._sections or \
+                name in self._base.sections:
+            return self.get_section(name)
+        return getattr(self._base, name)
+
+
+class _SectionOverlay(object):
+    """Section view of a _ConfigOverlay : its elements are overlaid."""
+
+    # methods of the section run on the view, they read the overlaid
+    # elements.
+    _METHODS = ('get_representation', 'iter_representation', 'get_values',
+                'iter_elements')
+
+    def __init__(self, values, key, section):
+        self._values = values
+        self._key = key
+        self._section = section
+
+    @property
+    def elements(self):
+        """The element views, by name (the values of a ListSection)."""
+        elements = self._section.elements
+        if not isinstance(self._section, _Section):
+            return elements
+        return OrderedDict(
+            (name, _ElementOverlay(self._values, (self._key, name), e))
+            for name, e in list(elements.items()))
+
+    def get_element(self, name):
+        e = self._section.get_element(name)
+        if e is None:
+            return None
+        return _ElementOverlay(self._values, (self._key, name), e)
+
+    def __str__(self):
+        return "".join(self.get_representation())
+
+    def __getattr__(self, name):
+        # __dict__ is empty while the object is copied or unpickled.
+        if '_section' not in self.__dict__:
+            raise AttributeError(name)
+        if name in self._METHODS:
+            return types.MethodType(getattr(type(self._section), name), self)
+        if name in self._section.__dict__ or hasattr(type(self._section),
+                                                     name):
+            return getattr(self._section, name)
+        e = self.get_element(name)
+        if e is not None:
+            return e
+        return getattr(self._section, name)
+
+
+class _ElementOverlay(object):
+    """Element view of a _ConfigOverlay : the value is read from the
+    overlay first, it is always written into the overlay."""
+
+    # methods of the element run on the view, they read the overlaid value.
+    _METHODS = ('get_representation', 'iter_representation',
+                'get_arg_parse_arguments', 'get_memoryview')
+
+    def __init__(self, values, key, element):
+        self._values = values
+        self._key = key
+        self._element = element
+
+    @property
+    def value(self):
+        """TODO"""
+        value = self._values.get(self._key, _MISSING)
+        if value is _MISSING:
+            return self._element.value
+        return value
+
+    @value.setter
+    def value(self, value):
+        """TODO"""
+        self._values[self._key] = value
+
+    @property
+    def raw_value(self):
+        """Same as value, the hooks pending in the base element are not
+        applied."""
+        value = self._values.get(self._key, _MISSING)
+        if value is _MISSING:
+            return self._element.raw_value
+        return value
+
+    def __str__(self):
+        return "".join(self.get_representation())
+
+    def __getattr__(self, name):
+        # __dict__ is empty while the object is copied or unpickled.
+        if '_element' not in self.__dict__:
+            raise AttributeError(name)
+        if name in self._METHODS:
+            return types.MethodType(getattr(type(self._element), name), self)
+        return getattr(self._element, name)
+
+
+class _HashWriter(object):
+    """Write data into a stream and compute its hash on the fly."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.hash = hashlib.sha1()
+
+    def write(self, data):
+        self.hash.update(data.encode('utf-8'))
+        return self.stream.write(data)
+
+    def digest(self):
+        """Return the hash of the data written so far."""
+        return self.hash.hexdigest()
+
+
+def _file_digest(filename):
+    """Return the hash of the file content, None if it does not exist."""
+    if not os.path.exists(filename):
+        return None
+    res = hashlib.sha1()
+    with open(filename, 'rb') as fde:
+        for data in iter(lambda: fde.read(1 << 16), b''):
+            res.update(data)
+    return res.hexdigest()
 
 
 class _AbstractSection(object):
@@ -359,6 +1711,13 @@ class _AbstractSection(object):
         self._prefix = prefix
         self._suffix = suffix
         self._required = required
+        # file parser of a load postponed until the first access.
+        self._pending_parser = None
+        # set by Config.freeze_schema, elements can not be added anymore.
+        self.frozen = False
+        # a postponed loading is done once, by one thread.
+        self._load_lock = threading.RLock()
+        self._loading = False
 
     @property
     def name(self):
@@ -374,6 +1733,43 @@ class _AbstractSection(object):
         because it is used as a key or identifier."""
         return self._name
 
+    @property
+    def load_pending(self):
+        """True if the loading of the current section was postponed."""
+        return self.__dict__.get('_pending_parser') is not None
+
+    def defer_load(self, file_parser):
+        """The current section will be loaded from file_parser on its first
+        access (see Config lazy_load)."""
+        self._pending_parser = file_parser
+
+    def materialize(self):
+        """This method loads the current section now if its loading was
+        postponed. On failure, it stays postponed."""
+        if self.__dict__.get('_pending_parser') is None:
+            return
+        with self._load_lock:
+            # loaded by another thread, or being loaded by the current one.
+            file_parser = self._pending_parser
+            if file_parser is None or self._loading:
+                return
+            self._loading = True
+            try:
+                self.load(file_parser)
+                self._pending_parser = None
+            finally:
+                self._loading = False
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # locks can not be copied.
+        state.pop('_load_lock', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._load_lock = threading.RLock()
+
     def get_section_name(self):
         """This method build the current section name that the program will
         looking for into the configuration file.
@@ -397,8 +1793,29 @@ class _AbstractSection(object):
 
     def get_representation(self, prefix="", suffix="\n"):
         """return the string representation of the current object."""
-        res = prefix + "Section " + self.get_section_name().upper() + suffix
-        return res
+        return "".join(self.iter_representation(prefix, suffix))
+
+    def get_representation_header(self, prefix="", suffix="\n"):
+        """return the first line of the string representation."""
+        return prefix + "Section " + self.get_section_name().upper() + suffix
+
+    def iter_representation(self, prefix="", suffix="\n", depth=None):
+        """This method will yield the string representation of the current
+        object, chunk by chunk. depth is the max number of nested section
+        levels (None : no limit)."""
+        if depth is None or depth > 0:
+            yield self.get_representation_header(prefix, suffix)
+
+    # pylint: disable-msg=R0201
+    def get_values(self):
+        """This method will return the list of (name, value) of the current
+        section. It is used to detect configuration changes."""
+        return []
+
+    # pylint: disable-msg=R0201
+    def iter_elements(self):
+        """This method will yield the elements of the current section."""
+        return iter([])
 
     def __str__(self):
         return "".join(self.get_representation())
@@ -408,19 +1825,19 @@ class _AbstractSection(object):
         sample values, required flags, using the configuration object
         properties.
         """
+        res = []
         if comments:
-            f.write("#####################################\n")
-            f.write("# Section : ")
-            f.write("#".join(self.get_representation()) + "\n")
-            f.write("#####################################\n")
-        f.write("[" + self._name + "]\n")
+            res.append("#####################################\n")
+            res.append("# Section : ")
+            res.append("#".join(self.get_representation()) + "\n")
+            res.append("#####################################\n")
+        res.append("[" + self._name + "]\n")
         if self._desc and comments:
-            f.write("# Description : ")
+            res.append("# Description : ")
             for i in self._desc.split('\n'):
-                f.write("# ")
-                f.write(i)
-                f.write("\n")
-            f.write("\n")
+                res.append("# " + i + "\n")
+            res.append("\n")
+        f.write("".join(res))
 
 
 class _Section(_AbstractSection):
@@ -434,6 +1851,10 @@ class _Section(_AbstractSection):
         will be used as an identifier."""
         if not isinstance(elt, Element):
             raise TypeError("argument should be a subclass of Element")
+        if self.__dict__.get('frozen'):
+            raise RuntimeError("The schema of the section %s is frozen, "
+                               "elements can not be added."
+                               % self.get_section_name())
         self.elements[elt.name] = elt
         return elt
 
@@ -448,15 +1869,38 @@ class _Section(_AbstractSection):
         Section"""
         return len(self.elements)
 
+    def get_representation(self, prefix="", suffix="\n"):
+        self.materialize()
+        res = []
+        if self.count() > 0:
+            res.append(self.get_representation_header(prefix, suffix))
+            for elt in list(self.elements.values()):
+                res.append("".join(elt.iter_representation(prefix)))
+        return res
+
+    def iter_representation(self, prefix="", suffix="\n", depth=None):
+        self.materialize()
+        if self.count() > 0 and (depth is None or depth > 0):
+            yield self.get_representation_header(prefix, suffix)
+            for elt in list(self.elements.values()):
+                for chunk in elt.iter_representation(prefix, depth=depth):
+                    yield chunk
+
     def reset(self):
         for e in list(self.elements.values()):
             e.reset()
 
-    def load(self, file_parser):
+    def load(self, file_parser, hooks=True):
+        """Load the elements of the current section. Without hooks, the
+        values are only read and checked, the element hooks are not
+        applied."""
         section = self.get_section_name()
         try:
             for e in list(self.elements.values()):
-                e.load(file_parser, section)
+                if hooks:
+                    e.load(file_parser, section)
+                else:
+                    e._load(file_parser, section)
         except configparser.NoSectionError as e:
             # pylint: disable-msg=W0621
             log = logging.getLogger('argtoolbox')
@@ -467,6 +1911,10 @@ class _Section(_AbstractSection):
                 log.debug("Missing section : " + section)
 
     def __getattr__(self, name):
+        # __dict__ is empty while the object is copied or unpickled.
+        if 'elements' not in self.__dict__:
+            raise AttributeError(name)
+        self.materialize()
         e = self.elements.get(name)
         if e is not None:
             return e
@@ -475,8 +1923,33 @@ class _Section(_AbstractSection):
 '%(name)s'" % {"name": name, "class": self.__class__.__name__})
 
     def get_element(self, name):
+        self.materialize()
         return self.elements.get(name)
 
+    def iter_elements(self):
+        self.materialize()
+        for e in list(self.elements.values()):
+            yield e
+            sections = getattr(e, 'sections', {})
+            if getattr(sections, 'stored', False):
+                continue
+            for sec in list(sections.values()):
+                for sub in sec.iter_elements():
+                    yield sub
+
+    def get_values(self):
+        self.materialize()
+        res = []
+        for e in list(self.elements.values()):
+            res.append((e.name, e.raw_value))
+            sections = getattr(e, 'sections', {})
+            if getattr(sections, 'stored', False):
+                res.append((e.name, sections.store.get_fingerprint()))
+                continue
+            for sec in list(sections.values()):
+                res.append((sec.get_section_name(), sec.get_values()))
+        return res
+
     def write_config_file(self, f, comments):
         """This method write a sample file, with attributes, descriptions,
         sample values, required flags, using the configuration object
@@ -503,27 +1976,13 @@ class SimpleSection(_Section):
         super(SimpleSection, self).__init__(*args, **kwargs)
         self._name = name
 
-    def get_representation(self, prefix="", suffix="\n"):
-        res = []
-        if self.count() > 0:
-            res.append(prefix + "Section "
-                       + self.get_section_name().upper() + suffix)
-            for elt in list(self.elements.values()):
-                res.append("".join(elt.get_representation(prefix)))
-        return res
-
 
 class SubSection(_Section):
     """ TODO """
 
-    def get_representation(self, prefix="", suffix="\n"):
-        res = []
-        if self.count() > 0:
-            res.append(prefix + "SubSection : "
-                       + self.get_section_name().upper() + suffix)
-            for elt in list(self.elements.values()):
-                res.append("".join(elt.get_representation(prefix)))
-        return res
+    def get_representation_header(self, prefix="", suffix="\n"):
+        return (prefix + "SubSection : " + self.get_section_name().upper()
+                + suffix)
 
     def __copy__(self):
         newone = type(self)()
@@ -542,20 +2001,40 @@ class SubSection(_Section):
 
 
 class ListSection(_AbstractSection):
-    """ TODO """
+    """ TODO
+
+    With storage='sqlite', the data is stored into a SQLite file of the user
+    cache (see argtoolbox.storage) instead of being kept in memory. It is
+    read from the configuration file again only if the file has changed.
+    """
     def __init__(self, name, *args, **kwargs):
+        self.storage = kwargs.pop('storage', None)
         super(ListSection, self).__init__(*args, **kwargs)
         self.elements = OrderedDict()
         self._name = name
 
+    def _iter_items(self, file_parser, section):
+        defaults = file_parser.defaults()
+        for key in file_parser.options(section):
+            if key not in defaults:
+                yield key, file_parser.get(section, key)
+
     def load(self, file_parser):
 
         section = self.get_section_name()
         try:
-
-            for key in [item for item in file_parser.options(section)
-                        if item not in list(file_parser.defaults().keys())]:
-                self.elements[key] = file_parser.get(section, key)
+            store = None
+            if self.storage == 'sqlite':
+                from .storage import open_store
+                store, fingerprint = open_store(section, file_parser)
+            if store is None:
+                for key, value in self._iter_items(file_parser, section):
+                    self.elements[key] = value
+            else:
+                if store.get_fingerprint() != fingerprint:
+                    store.ingest(self._iter_items(file_parser, section),
+                                 fingerprint)
+                self.elements = store
         except configparser.NoSectionError as e:
             # pylint: disable-msg=W0621
             log = logging.getLogger('argtoolbox')
@@ -566,24 +2045,148 @@ class ListSection(_AbstractSection):
                 log.debug("Missing section : " + section)
 
     def reset(self):
-        for e in list(self.elements.values()):
-            e.reset()
+        # the values are strings, not elements.
+        if isinstance(self.elements, OrderedDict):
+            self.elements = OrderedDict()
+
+    def get_values(self):
+        self.materialize()
+        if not isinstance(self.elements, OrderedDict):
+            # the store is not read, its fingerprint follows the files.
+            return [(self._name, self.elements.get_fingerprint())]
+        return list(self.elements.items())
 
     def get_representation(self, prefix="", suffix="\n"):
-        res = []
-        res.append(prefix + "Section " + self._name + suffix)
-
-        for key, val in list(self.elements.items()):
-            a = []
-            a.append(prefix)
-            a.append(" - " + str(key) + " : " + str(val))
-            a.append(suffix)
-            res.append("".join(a))
+        return list(self.iter_representation(prefix, suffix))
+
+    def get_representation_header(self, prefix="", suffix="\n"):
+        return prefix + "Section " + self._name + suffix
+
+    def iter_representation(self, prefix="", suffix="\n", depth=None):
+        self.materialize()
+        if depth is not None and depth < 1:
+            return
+        yield self.get_representation_header(prefix, suffix)
+        for key, val in self.elements.items():
+            yield prefix + " - " + str(key) + " : " + str(val) + suffix
+
+
+class TypedList(object):
+    """Data type (e_type) of an Element storing a list of numbers, parsed in
+    one pass into a compact array.array, or into a numpy array when numpy is
+    available and use_numpy is True (the numpy array shares the memory of
+    the array.array).
+
+    typecode -- array.array type code : 'b', 'B', 'h', 'H', 'i', 'I', 'l',
+    'L', 'q', 'Q' for integers, 'f' and 'd' for floats.
+    separator -- items separator, default : any whitespace.
+
+    ex: Element('ports', e_type=TypedList('H', separator=','))
+        ports=22,80,443
+    """
+
+    def __init__(self, typecode, separator=None, use_numpy=False):
+        if typecode not in array.typecodes or typecode == 'u':
+            raise ValueError("Unsupported typecode : %s" % typecode)
+        self.typecode = typecode
+        self.separator = separator
+        self.use_numpy = use_numpy
+        self.item_type = float if typecode in 'fd' else int
+        self.__name__ = "TypedList(%s)" % typecode
+
+    def __repr__(self):
+        return self.__name__
+
+    def __call__(self, data):
+        """Convert one item (used by argparse as the 'type' argument)."""
+        return self.item_type(data)
+
+    def __eq__(self, other):
+        return (isinstance(other, TypedList)
+                and self.typecode == other.typecode
+                and self.separator == other.separator
+                and self.use_numpy == other.use_numpy)
+
+    def __hash__(self):
+        return hash((self.typecode, self.separator, self.use_numpy))
+
+    def from_list(self, values):
+        """Build the array from a list of numbers."""
+        try:
+            res = array.array(self.typecode, values)
+        except OverflowError as ex:
+            raise ValueError(str(ex))
+        if self.use_numpy:
+            try:
+                import numpy
+                return numpy.frombuffer(res, dtype=self.typecode)
+            except ImportError:
+                pass
         return res
 
+    def parse(self, data):
+        """Build the array from the string stored into the configuration
+        file."""
+        items = data.split(self.separator)
+        if self.separator is not None:
+            items = [i.strip() for i in items]
+        return self.from_list(map(self.item_type, items))
+
+    def normalize(self, value):
+        """Build the array from a default value : a string using the
+        configuration file syntax, a list or an array of numbers."""
+        if isinstance(value, str):
+            return self.parse(value)
+        return self.from_list(value)
+
+    def format(self, value):
+        """Return the string stored into the configuration file."""
+        separator = " " if self.separator is None else self.separator
+        return separator.join(str(i) for i in value)
+
+
+class _TypedListAction(argparse.Action):
+    """argparse action storing the arguments of a TypedList element as an
+    array (the type argument is the TypedList object)."""
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        try:
+            setattr(namespace, self.dest, self.type.from_list(values))
+        except ValueError as ex:
+            raise ArgumentError(self, str(ex))
+
+
+class _LazyDefault(object):
+    """argparse default of an element whose hooks are pending (lazy_hooks):
+    the value is computed when the argument is read, see _Namespace."""
+
+    def __init__(self, element):
+        self.element = element
+
+    def __repr__(self):
+        return "<lazy default of %s>" % self.element.name
+
+
+class _Namespace(argparse.Namespace):
+    """Namespace of the parsed arguments, the lazy defaults (see
+    _LazyDefault) are replaced by the element values on first access."""
+
+    def __getattribute__(self, name):
+        value = super(_Namespace, self).__getattribute__(name)
+        if type(value) is _LazyDefault:
+            value = value.element.value
+            setattr(self, name, value)
+        return value
+
 
 # warning| [R0902, Element] Too many instance attributes (13/7)
 # pylint: disable-msg=R0902
+# elements whose hooks are applied by the current context : their hooks
+# read and write the value being built.
+_HOOKS_RUNNING = contextvars.ContextVar('argtoolbox_hooks_running',
+                                        default=())
+
+
 class Element(object):
     """
     An Element could represent a option into the configuration file, this
@@ -596,7 +2199,8 @@ class Element(object):
     # pylint: disable-msg=R0913
     def __init__(self, name, e_type=str, required=False, default=None,
                  conf_hidden=False, conf_required=False, desc=None, dest=None,
-                 hooks=None, hidden=False, e_type_exclude=False):
+                 hooks=None, hidden=False, e_type_exclude=False,
+                 lazy_hooks=False):
         """Information about how to declare a element which will be load from a
         configuration file.
 
@@ -636,12 +2240,19 @@ class Element(object):
     DefaultHook. The hook will be apply to the element value once read
     from config file.
 
+    - lazy_hooks -- The hooks are not applied during the loading process but
+    the first time the value is read. The result is kept until the next
+    loading or reset. Hook errors are raised by this first access.
+    Default: False, hooks are applied (and checked) at loading time, the
+    I/O bound ones concurrently, by Config.load.
+
     """
 
         self._name = name
         self.e_type = e_type
         self.e_type_exclude = e_type_exclude
         self._required = required
+        self._default = None
         self.default = default
         self._desc = desc
         self._dest = dest
@@ -651,6 +2262,10 @@ class Element(object):
         self._desc_for_argparse = None
         self._value = None
         self.hidden = hidden
+        self.lazy_hooks = lazy_hooks
+        self._hooks_pending = False
+        # the pending hooks are applied once, by one thread.
+        self._lock = threading.RLock()
 
         if hooks is None:
             hooks = []
@@ -671,6 +2286,8 @@ class Element(object):
     @property
     def value(self):
         """TODO"""
+        if self._hooks_pending and self not in _HOOKS_RUNNING.get():
+            self.apply_hooks()
         if self._value is None:
             return self.default
         return self._value
@@ -678,8 +2295,92 @@ class Element(object):
     @value.setter
     def value(self, value):
         """TODO"""
+        if self not in _HOOKS_RUNNING.get():
+            self._hooks_pending = False
         self._value = value
 
+    @property
+    def default(self):
+        """Default value used if the attribute is not set in the
+        configuration file."""
+        return self._default
+
+    @default.setter
+    def default(self, default):
+        """The default value of a TypedList element is stored as an
+        array."""
+        self._check_frozen('default')
+        if default is not None and isinstance(self.e_type, TypedList):
+            default = self.e_type.normalize(default)
+        self._default = default
+
+    def _check_frozen(self, name):
+        """The declaration of an element compiled by Config.freeze_schema
+        can not be modified."""
+        if self.__dict__.get('frozen'):
+            raise RuntimeError("The schema of the element %s is frozen, %s "
+                               "can not be modified." % (self._name, name))
+
+    @property
+    def e_type(self):
+        """Data type of the attribute."""
+        return self._e_type
+
+    @e_type.setter
+    def e_type(self, e_type):
+        self._check_frozen('e_type')
+        self._e_type = e_type
+
+    @property
+    def conf_required(self):
+        """The attribute must be present in the configuration file."""
+        return self._conf_required
+
+    @conf_required.setter
+    def conf_required(self, conf_required):
+        self._check_frozen('conf_required')
+        self._conf_required = conf_required
+
+    @property
+    def hooks(self):
+        """The hooks applied to the loaded value, a tuple once the schema
+        is frozen."""
+        return self._hooks
+
+    @hooks.setter
+    def hooks(self, hooks):
+        self._check_frozen('hooks')
+        self._hooks = hooks
+
+    @property
+    def lazy_hooks(self):
+        """The hooks are applied the first time the value is read."""
+        return self._lazy_hooks
+
+    @lazy_hooks.setter
+    def lazy_hooks(self, lazy_hooks):
+        self._check_frozen('lazy_hooks')
+        self._lazy_hooks = lazy_hooks
+
+    def freeze(self):
+        """Called by Config.freeze_schema : the declaration can not be
+        modified anymore (RuntimeError)."""
+        self._hooks = tuple(self._hooks)
+        self.frozen = True
+
+    @property
+    def hooks_pending(self):
+        """True if the hooks were not applied to the loaded value yet."""
+        return self._hooks_pending
+
+    @property
+    def raw_value(self):
+        """This method will return the value of the current element without
+        applying the pending hooks (see lazy_hooks)."""
+        if self._value is None:
+            return self.default
+        return self._value
+
     @property
     def name(self):
         """This method will return the name of the current element"""
@@ -694,16 +2395,29 @@ class Element(object):
         representation of the current object. Every lines could be
         prefixed and suffixed.
         """
+        return "".join(self.iter_representation(prefix, suffix))
+
+    def iter_representation(self, prefix="", suffix="\n", depth=None):
+        """This method will yield the string representation of the current
+        object, then the one of its sub sections (if any), chunk by chunk.
+        depth is the max number of section levels, the current one included
+        (None : no limit).
+        """
         value = self.value
         if self.hidden:
             value = "xxxxxxxx"
-        line = "{prefix} - {name} : {value}{suffix}".format(
+        yield "{prefix} - {name} : {value}{suffix}".format(
             prefix=prefix,
             name=self._name,
             value=value,
             suffix=suffix
         )
-        return line
+        if depth is not None:
+            depth -= 1
+        for sec in getattr(self, 'sections', {}).values():
+            for chunk in sec.iter_representation(prefix + "\t",
+                                                 depth=depth):
+                yield chunk
 
     def __str__(self):
         return "".join(self.get_representation())
@@ -711,15 +2425,90 @@ class Element(object):
     def __copy__(self):
         newone = type(self)(self._name)
         newone.__dict__.update(self.__dict__)
+        newone._lock = threading.RLock()
         #self.elements = OrderedDict()
         return newone
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # locks can not be copied.
+        state.pop('_lock', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
     def post_load(self):
         """Every element hooks are applied by this method, just after the
-        loading process.
+        loading process. If lazy_hooks is set, they are only marked as
+        pending. It is also the case if one of them is I/O bound, they will
+        be applied by Config.apply_hooks (or by the first access to the
+        value if the element is not loaded by a Config).
         """
-        for h in self.hooks:
-            h(self)
+        if self.hooks and (self.lazy_hooks or any(
+                _is_concurrent_hook(h) for h in self.hooks)):
+            self._hooks_pending = True
+        else:
+            self._hooks_pending = False
+            for h in self.hooks:
+                h(self)
+
+    def apply_hooks(self):
+        """This method will apply the pending hooks right now. It can be
+        used to validate a lazy element eagerly."""
+        if not self._hooks_pending:
+            return
+        with self._lock:
+            # already applied by another thread.
+            if not self._hooks_pending:
+                return
+            raw = self._value
+            # the other threads wait for the lock until the value is
+            # complete, the hooks read and write the value being built.
+            token = _HOOKS_RUNNING.set(_HOOKS_RUNNING.get() + (self,))
+            try:
+                for h in self.hooks:
+                    res = h(self)
+                    if inspect.isawaitable(res):
+                        _run_awaitable(res)
+            except Exception:
+                self._value = raw
+                raise
+            finally:
+                _HOOKS_RUNNING.reset(token)
+            self._hooks_pending = False
+
+    async def apply_hooks_async(self, executor, semaphore):
+        """Coroutine version of apply_hooks, used by Config.apply_hooks. I/O
+        bound hooks are run by the executor, coroutine hooks are awaited."""
+        import asyncio
+        if not self._hooks_pending:
+            return
+        loop = asyncio.get_running_loop()
+        async with semaphore:
+            with self._lock:
+                if not self._hooks_pending:
+                    return
+                raw = self._value
+                token = _HOOKS_RUNNING.set(_HOOKS_RUNNING.get() + (self,))
+                try:
+                    for h in self.hooks:
+                        if getattr(h, 'io_bound', False):
+                            # the hook runs in the current context.
+                            res = await loop.run_in_executor(
+                                executor, contextvars.copy_context().run,
+                                h, self)
+                        else:
+                            res = h(self)
+                        if inspect.isawaitable(res):
+                            await res
+                except Exception:
+                    self._value = raw
+                    raise
+                finally:
+                    _HOOKS_RUNNING.reset(token)
+                self._hooks_pending = False
 
     def load(self, file_parser, section_name):
         """The current element is loaded from the configuration file,
@@ -740,38 +2529,8 @@ class Element(object):
                       + ") : " + self._name)
             data = None
             try:
-                if self.e_type == int:
-                    data = file_parser.getint(section_name, self._name)
-                elif self.e_type == float:
-                    data = file_parser.getfloat(section_name, self._name)
-                elif self.e_type == bool:
-                    data = file_parser.getboolean(section_name, self._name)
-                elif self.e_type == list:
-                    data = file_parser.get(section_name, self._name)
-                    data = data.strip()
-                    data = data.split()
-                    if not data:
-                        msg = "The optional field '%(name)s' was present, \
-type is list, but the current value is an empty \
-list." % {"name": self._name}
-                        log.error(msg)
-                        raise ValueError(msg)
-                elif self.e_type == str:
-                    data = file_parser.get(section_name, self._name)
-                    # happens only when the current field is present,
-                    # type is string, but value is ''
-                    if not data:
-                        msg = "The optional field '%(name)s' was present, \
-                        type is string, but the current value is an empty \
-                        string." % {"name": self._name}
-                        log.error(msg)
-                        raise ValueError(msg)
-                else:
-                    msg = "Data type not supported : %(type)s " % {
-                        "type": self.e_type}
-                    log.error(msg)
-                    raise TypeError(msg)
-
+                data = _get_converter(self.e_type)(file_parser, section_name,
+                                                   self._name)
             except ValueError as ex:
                 msg = "The current field '%(name)s' was present, but the \
 required type is : %(e_type)s." %  {
@@ -811,6 +2570,11 @@ config file." % {"name": self._name}
     def reset(self):
         self.value = None
 
+    def get_memoryview(self):
+        """This method will return a memoryview of the current value (a
+        TypedList array for example), without copying the data."""
+        return memoryview(self.value)
+
     def get_arg_parse_arguments(self):
         """
         During the element declaration, all configuration file requirements
@@ -821,9 +2585,16 @@ config file." % {"name": self._name}
         """
 
         ret = dict()
+        # the pending hooks are applied when the argument is read.
+        if not self._hooks_pending:
+            value = self.value
+        elif self._value is not None or self.default is not None:
+            value = _LazyDefault(self)
+        else:
+            value = None
         if self._required:
-            if self.value is not None:
-                ret["default"] = self.value
+            if value is not None:
+                ret["default"] = value
             else:
                 ret["required"] = True
         ret["dest"] = self._name
@@ -833,8 +2604,12 @@ config file." % {"name": self._name}
             if self.e_type == int or self.e_type == float:
                 # Just override argparse.add_argument 'type' parameter for int or float.
                 ret["type"] = self.e_type
-        if self.value is not None:
-            ret["default"] = self.value
+            if isinstance(self.e_type, TypedList):
+                ret["type"] = self.e_type
+                ret["nargs"] = "+"
+                ret["action"] = _TypedListAction
+        if value is not None:
+            ret["default"] = value
         if self._desc:
             ret["help"] = self._desc
         return ret
@@ -847,28 +2622,118 @@ config file." % {"name": self._name}
         if self.conf_hidden:
             return False
 
+        res = []
         if comments:
-            f.write("\n")
-            f.write("# Attribute (")
-            f.write(str(self.e_type.__name__))
-            f.write(") : ")
-            f.write(self._name.upper())
-            f.write("\n")
+            res.append("\n# Attribute (" + str(self.e_type.__name__) + ") : "
+                       + self._name.upper() + "\n")
             if self._desc and self._desc != argparse.SUPPRESS:
-                f.write("# Description : ")
+                res.append("# Description : ")
                 for i in self._desc.split('\n'):
-                    f.write("# ")
-                    f.write(i)
-                    f.write("\n")
-                f.write("\n")
+                    res.append("# " + i + "\n")
+                res.append("\n")
 
         if not self.conf_required:
-            f.write(";")
-        f.write(self._name)
-        f.write("=")
+            res.append(";")
+        res.append(self._name + "=")
         if self.default is not None and not self.hidden:
-            f.write(str(self.default))
-        f.write("\n")
+            if isinstance(self.e_type, TypedList):
+                res.append(self.e_type.format(self.default))
+            else:
+                res.append(str(self.default))
+        res.append("\n")
+        f.write("".join(res))
+
+
+async def _wait_for(awaitable):
+    return await awaitable
+
+
+def _run_awaitable(awaitable):
+    """Wait for an awaitable from synchronous code, in the current context.
+    asyncio.run can not be used by a thread already running an event loop,
+    the awaitable is run by a helper thread in this case."""
+    import asyncio
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(_wait_for(awaitable))
+    with futures.ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(contextvars.copy_context().run, asyncio.run,
+                               _wait_for(awaitable)).result()
+
+
+def _empty_value_error(name, e_type):
+    # pylint: disable-msg=W0621
+    log = logging.getLogger('argtoolbox')
+    if e_type == str:
+        msg = "The optional field '%(name)s' was present, \
+                        type is string, but the current value is an empty \
+                        string." % {"name": name}
+    else:
+        msg = "The optional field '%(name)s' was present, \
+type is list, but the current value is an empty \
+list." % {"name": name}
+    log.error(msg)
+    return ValueError(msg)
+
+
+def _read_int(file_parser, section_name, name):
+    return file_parser.getint(section_name, name)
+
+
+def _read_float(file_parser, section_name, name):
+    return file_parser.getfloat(section_name, name)
+
+
+def _read_bool(file_parser, section_name, name):
+    return file_parser.getboolean(section_name, name)
+
+
+def _read_list(file_parser, section_name, name):
+    data = file_parser.get(section_name, name).strip().split()
+    if not data:
+        raise _empty_value_error(name, list)
+    return data
+
+
+def _read_str(file_parser, section_name, name):
+    data = file_parser.get(section_name, name)
+    # happens only when the current field is present, type is string, but
+    # value is ''
+    if not data:
+        raise _empty_value_error(name, str)
+    return data
+
+
+def _get_converter(e_type):
+    """Return the function reading an option of type e_type from a file
+    parser : converter(file_parser, section_name, name). It raises
+    configparser.NoOptionError if the option is missing and ValueError if
+    its value is invalid."""
+    if e_type == int:
+        return _read_int
+    if e_type == float:
+        return _read_float
+    if e_type == bool:
+        return _read_bool
+    if e_type == list:
+        return _read_list
+    if isinstance(e_type, TypedList):
+        def read_typed_list(file_parser, section_name, name):
+            data = file_parser.get(section_name, name).strip()
+            if not data:
+                raise _empty_value_error(name, list)
+            return e_type.parse(data)
+        return read_typed_list
+    if e_type == str:
+        return _read_str
+
+    # pylint: disable-msg=W0613
+    def unsupported(file_parser, section_name, name):
+        msg = "Data type not supported : %(type)s " % {"type": e_type}
+        logging.getLogger('argtoolbox').error(msg)
+        raise TypeError(msg)
+    return unsupported
 
 
 class ElementWithSubSections(Element):
@@ -913,18 +2778,7 @@ class ElementWithSubSections(Element):
         return self.sections[self._name]
 
     def get_representation(self, prefix="", suffix="\n"):
-        res = []
-        temp_line = prefix + " - " + str(self._name) + " : "
-        if self.hidden:
-            temp_line += "xxxxxxxx" + suffix
-        else:
-            temp_line += str(self.value) + suffix
-        res.append(temp_line)
-
-        if len(self.sections) > 0:
-            for elt in list(self.sections.values()):
-                res.append("".join(elt.get_representation(prefix + "\t")))
-        return res
+        return list(self.iter_representation(prefix, suffix))
 
     def add_section(self, section):
         """You can add a section inside a Element, the section must be a
@@ -1018,9 +2872,16 @@ class ElementWithRelativeSubSection(Element):
     section.add_element(Element('elt5_field', conf_required=True))
     section.add_element(Element('elt6_field', conf_required=True))
     default.add_element(ElementWithRelativeSubSection('list_of_section_name', section))
+
+    With storage='sqlite', the element values of the relative sections are
+    stored into a SQLite file of the user cache (see argtoolbox.storage)
+    instead of being kept in memory, each SubSection is rebuilt when it is
+    accessed. They are read from the configuration file again only if the
+    file has changed.
     """
 
     def __init__(self, name, rss, *args, **kwargs):
+        self.storage = kwargs.pop('storage', None)
         super(ElementWithRelativeSubSection, self).__init__(name, *args, **kwargs)
         self.e_type = list
         self.sections = OrderedDict()
@@ -1032,35 +2893,101 @@ class ElementWithRelativeSubSection(Element):
     def load(self, file_parser, section_name):
         self._load(file_parser, section_name)
         if isinstance(self.value, list):
-            for sec_name in self.value:
-                try:
-                    sec = copy.deepcopy(self.rss, None)
-                    setattr(sec, '_name', sec_name)
+            store = None
+            if self.storage == 'sqlite':
+                from .storage import open_store
+                schema = [(e.name, repr(e.e_type))
+                          for e in list(self.rss.elements.values())]
+                store, fingerprint = open_store(
+                    section_name + "." + self._name, file_parser, schema)
+            if store is None:
+                for sec_name, sec in self._iter_sections(file_parser,
+                                                         section_name):
                     self.sections[sec_name] = sec
-                    sec.load(file_parser)
-                except ValueError as e:
-                    # pylint: disable-msg=W0621
-                    log = logging.getLogger('argtoolbox')
-                    error = []
-                    error.append("Missing relative section, attribute : ")
-                    error.append("'[" + section_name + "]." + self._name)
-                    error.append("', value : " + str(self.value))
-                    log.error("".join(error))
-                    raise ValueError(e)
+            else:
+                # the values are stored before the hooks (decoded secrets,
+                # ...), they are applied when a section is rebuilt.
+                if store.get_fingerprint() != fingerprint:
+                    store.ingest(
+                        ((sec_name, [(e.name, e.raw_value) for e in
+                                     list(sec.elements.values())])
+                         for sec_name, sec in self._iter_sections(
+                             file_parser, section_name, hooks=False)),
+                        fingerprint)
+                self.sections = _StoredSections(store, self.rss)
         self.post_load()
 
+    def _iter_sections(self, file_parser, section_name, hooks=True):
+        """Load the relative sections, one by one."""
+        for sec_name in self.value:
+            try:
+                sec = copy.deepcopy(self.rss, None)
+                setattr(sec, '_name', sec_name)
+                sec.load(file_parser, hooks=hooks)
+                yield sec_name, sec
+            except ValueError as e:
+                # pylint: disable-msg=W0621
+                log = logging.getLogger('argtoolbox')
+                error = []
+                error.append("Missing relative section, attribute : ")
+                error.append("'[" + section_name + "]." + self._name)
+                error.append("', value : " + str(self.value))
+                log.error("".join(error))
+                raise ValueError(e)
+
     def get_representation(self, prefix="", suffix="\n"):
-        res = []
-        temp_line = prefix + " - " + str(self._name) + " : "
-        if self.hidden:
-            temp_line += "xxxxxxxx" + suffix
-        else:
-            temp_line += str(self.value) + suffix
-        res.append(temp_line)
-        if len(self.sections) > 0:
-            for elt in list(self.sections.values()):
-                res.append("".join(elt.get_representation(prefix + "\t")))
-        return res
+        return list(self.iter_representation(prefix, suffix))
+
+
+class _StoredSections(object):
+    """Read only mapping of the relative sections of an
+    ElementWithRelativeSubSection backed by a SQLite store : every SubSection
+    is rebuilt from the template when it is accessed."""
+
+    # the sub elements were checked before being stored, their hooks are
+    # applied when a section is rebuilt.
+    stored = True
+
+    def __init__(self, store, rss):
+        self.store = store
+        self.rss = rss
+
+    def _build(self, name, values):
+        sec = copy.deepcopy(self.rss, None)
+        setattr(sec, '_name', name)
+        for elt_name, value in values:
+            elt = sec.elements[elt_name]
+            elt.value = value
+            elt.post_load()
+        return sec
+
+    def __getitem__(self, name):
+        return self._build(name, self.store[name])
+
+    def get(self, name, default=None):
+        if name in self.store:
+            return self[name]
+        return default
+
+    def __contains__(self, name):
+        return name in self.store
+
+    def __iter__(self):
+        return iter(self.store)
+
+    def __len__(self):
+        return len(self.store)
+
+    def keys(self):
+        return iter(self.store)
+
+    def values(self):
+        for name, values in self.store.items():
+            yield self._build(name, values)
+
+    def items(self):
+        for name, values in self.store.items():
+            yield name, self._build(name, values)
 
 
 class DefaultCommand(object):
@@ -1094,9 +3021,409 @@ class DefaultCommand(object):
     def complete(self, args, prefix):
         """Auto complete method, args is comming from argparse and prefix is
         the input data from command line.
-        You must return a list."""
+        You must return a list, or yield the candidates (see the timeout of
+        DefaultCompleter)."""
         return []
 
+    def invalidate_completion(self, command_class=None):
+        """Drop the cached completion results (see DefaultCompleter ttl) of
+        the program, or of one of its commands. Commands changing the
+        completed data should call it."""
+        if self.config is not None:
+            DefaultCompleter.invalidate(self.config.prog_name, command_class)
+
+
+def _get_simple_args(args, names=None, exclude=()):
+    """Return the sorted (name, value) of the parsed arguments with a
+    simple value (None, str, numbers, lists of str), used as cache keys."""
+    res = []
+    if names is None:
+        names = sorted(vars(args))
+    for name in names:
+        if name == '__func__' or name in exclude:
+            continue
+        value = getattr(args, name, None)
+        if value is None or isinstance(value, (str, int, float, bool)):
+            res.append((name, value))
+        elif isinstance(value, (list, tuple)) and all(
+                isinstance(v, str) for v in value):
+            res.append((name, list(value)))
+    return res
+
+
+def _get_key_value(value):
+    """Return a stable representation of a parsed argument, used in the
+    cache keys. TypeError is raised if there is none (files, objects, ...).
+    """
+    if value is None or isinstance(value, (str, bytes, int, float)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return (type(value).__name__, [_get_key_value(v) for v in value])
+    if isinstance(value, (set, frozenset)):
+        return ('set', sorted(repr(_get_key_value(v)) for v in value))
+    if isinstance(value, dict):
+        return ('dict', sorted((repr(_get_key_value(k)), _get_key_value(v))
+                               for k, v in value.items()))
+    raise TypeError("no stable representation : %s" % type(value).__name__)
+
+
+def _get_args_key(args, exclude=()):
+    """Return the sorted (name, value) of every parsed argument, except
+    __func__ and exclude, used as cache keys. TypeError is raised if one of
+    them has no stable representation."""
+    res = []
+    for name in sorted(vars(args)):
+        if name == '__func__' or name in exclude:
+            continue
+        try:
+            res.append((name, _get_key_value(getattr(args, name))))
+        except TypeError as ex:
+            raise TypeError("%s : %s" % (name, ex))
+    return res
+
+
+# stdout captures, see _capture_stdout.
+_CAPTURE = {"users": 0, "local": threading.local()}
+_CAPTURE_LOCK = threading.Lock()
+
+
+class _TeeWriter(object):
+    """sys.stdout replacement : the data written by a thread is also kept
+    by the captures of this thread (see _capture_stdout), the other threads
+    only write into the stream."""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, data):
+        for chunks in getattr(_CAPTURE['local'], 'captures', []):
+            chunks.append(data)
+        return self.stream.write(data)
+
+    def __getattr__(self, name):
+        if 'stream' not in self.__dict__:
+            raise AttributeError(name)
+        return getattr(self.stream, name)
+
+
+@contextlib.contextmanager
+def _capture_stdout():
+    """Context manager returning the list of the chunks written into
+    sys.stdout by the current thread. Unlike contextlib.redirect_stdout,
+    the output of the other threads is not captured."""
+    chunks = []
+    with _CAPTURE_LOCK:
+        if not isinstance(sys.stdout, _TeeWriter):
+            sys.stdout = _TeeWriter(sys.stdout)
+        _CAPTURE['users'] += 1
+    local = _CAPTURE['local']
+    if not hasattr(local, 'captures'):
+        local.captures = []
+    local.captures.append(chunks)
+    try:
+        yield chunks
+    finally:
+        local.captures.pop()
+        with _CAPTURE_LOCK:
+            _CAPTURE['users'] -= 1
+            if not _CAPTURE['users'] and isinstance(sys.stdout, _TeeWriter):
+                sys.stdout = sys.stdout.stream
+
+
+def cached_command(ttl=60, depends_on=None, max_size=50 << 20):
+    """Decorator of the __call__ method of a DefaultCommand : its result and
+    its stdout are stored into the user cache, then replayed instead of
+    running the command again with the same arguments.
+
+    Keyword Arguments:
+
+    - ttl -- lifetime of a result, in seconds.
+
+    - depends_on -- names of the configuration sections used by the
+    command, their values are part of the key.
+
+    - max_size -- max size in bytes of the cached results of the program,
+    the least recently used ones are removed.
+
+    The key is made of the command class, the parsed arguments except the
+    protected_args of the command, and the values of the depends_on
+    sections. The command is run without cache if an argument has no stable
+    representation (a file, ...). Only the successful results are stored. It is
+    meant for read only commands (list, show, ...). Only the output of the
+    thread running the command is stored, commands can run concurrently
+    (batch, server).
+    """
+
+    def decorator(func):
+
+        @functools.wraps(func)
+        def wrapper(self, args):
+            cls = type(self)
+            try:
+                arguments = _get_args_key(
+                    args, exclude=getattr(self, 'protected_args', []))
+            except TypeError as ex:
+                self.log.debug("The result can not be cached : %s", ex)
+                return func(self, args)
+            values = []
+            for name in depends_on or []:
+                section = self.config.get_section(name)
+                values.append((name, section.get_values()
+                               if section is not None else None))
+            key = hashlib.sha1(repr((
+                cls.__module__, cls.__qualname__, arguments,
+                values)).encode('utf-8')).hexdigest()
+            directory = get_user_cache_dir('commands', self.config.prog_name)
+            cache_file = os.path.join(directory, key + ".pickle")
+            try:
+                if time.time() - os.stat(cache_file).st_mtime <= ttl:
+                    with open(cache_file, 'rb') as fde:
+                        output, res = pickle.load(fde)
+                    # last use, for the LRU eviction.
+                    os.utime(cache_file, (time.time(),
+                                          os.stat(cache_file).st_mtime))
+                    self.log.debug("cached result : %s", cache_file)
+                    sys.stdout.write(output)
+                    return res
+            except (OSError, EOFError, ValueError, pickle.PickleError):
+                pass
+            with _capture_stdout() as chunks:
+                res = func(self, args)
+            if not res:
+                return res
+            tmp = "%s.%d.tmp" % (cache_file, os.getpid())
+            try:
+                with open(tmp, 'wb') as fde:
+                    pickle.dump(("".join(chunks), res), fde,
+                                pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp, cache_file)
+            # pylint: disable-msg=W0703
+            except Exception as ex:
+                self.log.debug("Can not store the result : %s", ex)
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                return res
+            _evict_lru(directory, max_size)
+            return res
+        return wrapper
+    return decorator
+
+
+def _evict_lru(directory, max_size):
+    """Remove the least recently used files of the directory until its size
+    is below max_size."""
+    entries = []
+    total = 0
+    for entry in os.scandir(directory):
+        try:
+            stat = entry.stat()
+        except OSError:
+            continue
+        entries.append((stat.st_atime, entry.path, stat.st_size))
+        total += stat.st_size
+    entries.sort()
+    while total > max_size and entries:
+        _, path, size = entries.pop(0)
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total -= size
+
+
+class TargetResult(object):
+    """Result of a TargetsCommand for one target."""
+
+    def __init__(self, name, ok, value=None, error=None, attempts=1,
+                 duration=0.0):
+        self.name = name
+        self.ok = ok
+        self.value = value
+        self.error = error
+        self.attempts = attempts
+        self.duration = duration
+
+    def __repr__(self):
+        if self.ok:
+            return "<TargetResult %s : ok>" % self.name
+        return "<TargetResult %s : %s>" % (self.name, self.error)
+
+
+class _Target(object):
+    """Running state of a target."""
+
+    def __init__(self, name, section):
+        self.name = name
+        self.section = section
+        self.attempts = 0
+        self.token = None
+        self.deadline = None
+        self.started = None
+
+
+class TargetsCommand(DefaultCommand):
+    """This command runs run_target once for each target : the relative
+    sections of an ElementWithRelativeSubSection (servers = s1 s2 ...).
+
+    Keyword Arguments:
+
+    - element -- name of the ElementWithRelativeSubSection.
+
+    - section -- name of the section of the element. Default: DEFAULT.
+
+    - workers -- max number of targets processed at the same time, at
+    least 1.
+
+    - timeout -- max duration of one attempt, in seconds. The attempt is
+    abandoned (it can not be killed, run_target should also use the timeout
+    of its connections). Default: None, no timeout. An abandoned attempt no
+    longer counts against workers : while it is still running, more than
+    workers threads may run at the same time.
+
+    - retries -- number of retries of a failing target.
+
+    - backoff -- delay before the first retry, doubled for every retry.
+
+    The results are reported as soon as a target is done, then a summary.
+    The command fails if one target failed.
+    """
+
+    def __init__(self, config=None, element=None, section="DEFAULT",
+                 workers=8, timeout=None, retries=0, backoff=1.0):
+        super(TargetsCommand, self).__init__(config)
+        if workers < 1:
+            raise ValueError("workers must be at least 1 : %s" % workers)
+        self.element = element
+        self.section = section
+        self.workers = workers
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+
+    def get_targets(self, args):
+        """This method will return the targets, a list of (name, section).
+        You can override it to filter them using args."""
+        section = self.config.get_section(self.section)
+        element = None
+        if section is not None:
+            element = section.get_element(self.element)
+        if not isinstance(element, ElementWithRelativeSubSection):
+            raise ValueError("No element with relative sub sections : %s.%s"
+                             % (self.section, self.element))
+        return list(element.sections.items())
+
+    def run_target(self, args, name, section):
+        """ This method must be implemented by the subclass. It is run for
+        one target, section is its SubSection. The result is stored into
+        TargetResult.value, an exception is a failure."""
+        raise NotImplementedError("You must implement this method.")
+
+    def report(self, result):
+        """This method is called for each target as soon as it is done.
+        You can override it to display the results."""
+        if result.ok:
+            self.log.info("%s : done in %.2fs (%d attempts)", result.name,
+                          result.duration, result.attempts)
+        else:
+            self.log.error("%s : failed after %d attempts : %s", result.name,
+                           result.attempts, result.error)
+
+    def iter_results(self, args):
+        """This method will run the targets and yield their TargetResult,
+        in completion order."""
+        results = queue.Queue()
+        waiting = [_Target(n, s) for n, s in self.get_targets(args)]
+        waiting.reverse()
+        delayed = []
+        running = {}
+        tokens = iter(range(1, sys.maxsize))
+
+        def attempt(target, token):
+            try:
+                res = (True, self.run_target(args, target.name,
+                                             target.section))
+            # pylint: disable-msg=W0703
+            except Exception as ex:
+                res = (False, ex)
+            results.put((token, res))
+
+        def failure(target, error, now):
+            if target.attempts <= self.retries:
+                delay = self.backoff * 2 ** (target.attempts - 1)
+                self.log.debug("%s : attempt %d failed, retry in %ss : %s",
+                               target.name, target.attempts, delay, error)
+                heapq.heappush(delayed, (now + delay, target.token, target))
+                return None
+            return TargetResult(target.name, False, error=error,
+                                attempts=target.attempts,
+                                duration=now - target.started)
+
+        while waiting or delayed or running:
+            now = time.monotonic()
+            while delayed and delayed[0][0] <= now:
+                waiting.append(heapq.heappop(delayed)[2])
+            while waiting and len(running) < self.workers:
+                target = waiting.pop()
+                target.attempts += 1
+                target.token = next(tokens)
+                if target.started is None:
+                    target.started = now
+                if self.timeout is not None:
+                    target.deadline = now + self.timeout
+                running[target.token] = target
+                thread = threading.Thread(
+                    target=attempt, args=(target, target.token),
+                    name="target-" + str(target.name))
+                # a timed out attempt is abandoned.
+                thread.daemon = True
+                thread.start()
+            wakeups = [t.deadline for t in list(running.values())
+                       if t.deadline is not None]
+            if delayed:
+                wakeups.append(delayed[0][0])
+            wait = max(0, min(wakeups) - now) if wakeups else None
+            if not running:
+                time.sleep(wait)
+                continue
+            try:
+                token, (ok, value) = results.get(timeout=wait)
+            except queue.Empty:
+                token = None
+            now = time.monotonic()
+            result = None
+            target = running.pop(token, None)
+            # results of the abandoned attempts are ignored.
+            if target is not None:
+                if ok:
+                    result = TargetResult(target.name, True, value=value,
+                                          attempts=target.attempts,
+                                          duration=now - target.started)
+                else:
+                    result = failure(target, value, now)
+                if result is not None:
+                    yield result
+            for token, target in list(running.items()):
+                if target.deadline is not None and target.deadline <= now:
+                    del running[token]
+                    result = failure(target, TimeoutError(
+                        "timeout after %ss" % self.timeout), now)
+                    if result is not None:
+                        yield result
+
+    def __call__(self, args):
+        super(TargetsCommand, self).__call__(args)
+        total = 0
+        failed = 0
+        for result in self.iter_results(args):
+            self.report(result)
+            total += 1
+            failed += 0 if result.ok else 1
+        self.log.info("%(total)d targets, %(ok)d succeeded, %(failed)d "
+                      "failed.",
+                      {"total": total, "ok": total - failed,
+                       "failed": failed})
+        return failed == 0
+
 
 class TestCommand(DefaultCommand):
     """Just a simple command, using the default command class."""
@@ -1109,7 +3436,8 @@ class TestCommand(DefaultCommand):
 
         print("The loaded configuration : ")
         print("---------------------------")
-        print(str(self.config))
+        self.config.write_representation(sys.stdout)
+        print("")
         print("")
 
         print("The command line arguments (argv) : ")
@@ -1123,19 +3451,172 @@ class TestCommand(DefaultCommand):
 
 class DefaultCompleter(object):
     """ TODO
+
+    Keyword Arguments:
+
+    - func_name -- name of the completion method of the command.
+
+    - ttl -- the results are stored into the user cache during ttl seconds.
+    Default: None, no cache.
+
+    - key_args -- names of the parsed arguments the results depend on.
+    Default: every argument with a simple value.
+
+    - narrow -- a cached result for a prefix is used (filtered) for the
+    longer prefixes. The completion method must return every candidate
+    starting with the prefix. Default: True.
+
+    - timeout -- deadline of the completion method, in seconds : it runs in
+    a worker thread, a hanging method does not freeze the shell. The
+    candidates yielded by a generator method before the deadline are
+    returned, nothing if a list is not returned in time. These partial
+    results are not cached. None : no deadline, the method runs in the
+    calling thread. Default: 0.15.
+
+    Commands changing the completed data should call
+    DefaultCompleter.invalidate (or DefaultCommand.invalidate_completion).
     """
-    def __init__(self, func_name="complete"):
+    def __init__(self, func_name="complete", ttl=None, key_args=None,
+                 narrow=True, timeout=0.15):
         self.func_name = func_name
+        self.ttl = ttl
+        self.key_args = key_args
+        self.narrow = narrow
+        self.timeout = timeout
+
+    @staticmethod
+    def _debug(*args):
+        # argcomplete debug output is only enabled by _ARC_DEBUG.
+        if os.environ.get('_ARC_DEBUG'):
+            from argcomplete import debug
+            debug(*args)
+
+    @staticmethod
+    def get_cache_dir(prog_name, command_class=None):
+        """This method will return the directory of the cached results of a
+        program, or of one of its commands."""
+        parts = ['completion', prog_name]
+        if command_class is not None:
+            if not isinstance(command_class, str):
+                command_class = "%s.%s" % (command_class.__module__,
+                                           command_class.__qualname__)
+            parts.append(command_class)
+        base = get_user_cache_dir()
+        return os.path.join(base, *parts)
+
+    @classmethod
+    def invalidate(cls, prog_name, command_class=None):
+        """Drop the cached results of a program, or of one of its
+        commands (a class or its 'module.qualname')."""
+        shutil.rmtree(cls.get_cache_dir(prog_name, command_class),
+                      ignore_errors=True)
+
+    def _get_key(self, args):
+        return _get_simple_args(args, self.key_args)
+
+    def _get_cache_file(self, directory, key, prefix):
+        digest = hashlib.sha1(repr((self.func_name, key, prefix)).encode(
+            'utf-8')).hexdigest()
+        return os.path.join(directory, digest + ".json")
+
+    def _read_cache(self, directory, key, prefix):
+        stems = [prefix]
+        if self.narrow:
+            stems = [prefix[:i] for i in range(len(prefix), -1, -1)]
+        for stem in stems:
+            cache_file = self._get_cache_file(directory, key, stem)
+            try:
+                if time.time() - os.stat(cache_file).st_mtime > self.ttl:
+                    continue
+                with open(cache_file, 'r') as fde:
+                    results = json.load(fde)
+            except (OSError, ValueError):
+                continue
+            self._debug("completion cache hit, prefix : " + stem)
+            return [r for r in results if r.startswith(prefix)]
+        return None
+
+    def _write_cache(self, directory, key, prefix, results):
+        if not all(isinstance(r, str) for r in results):
+            return
+        try:
+            if not os.path.isdir(directory):
+                os.makedirs(directory, 0o700)
+            cache_file = self._get_cache_file(directory, key, prefix)
+            tmp = "%s.%d.tmp" % (cache_file, os.getpid())
+            with open(tmp, 'w') as fde:
+                json.dump(list(results), fde)
+            os.replace(tmp, cache_file)
+        except OSError:
+            pass
+
+    def run(self, fn, args, prefix):
+        """Call the completion method fn until the deadline. Return the
+        candidates and True if the completion method has finished."""
+        if not self.timeout:
+            return list(fn(args, prefix)), True
+        generator = inspect.isgeneratorfunction(fn)
+        results = []
+        errors = []
+        done = threading.Event()
+        cancelled = threading.Event()
+
+        def worker():
+            """Collect the candidates, a list or a generator."""
+            try:
+                candidates = fn(args, prefix)
+                for candidate in candidates:
+                    if cancelled.is_set():
+                        if hasattr(candidates, 'close'):
+                            candidates.close()
+                        break
+                    results.append(candidate)
+            # pylint: disable-msg=W0703
+            except Exception as ex:
+                errors.append(ex)
+            finally:
+                done.set()
+
+        thread = threading.Thread(target=worker, name="completer")
+        thread.daemon = True
+        thread.start()
+        finished = done.wait(self.timeout)
+        if not finished:
+            cancelled.set()
+            self._debug("completion cancelled after %ss, %d partial results"
+                        % (self.timeout, len(results)))
+            # a list can not be returned partially.
+            if not generator:
+                return [], False
+        if errors:
+            raise errors[0]
+        return list(results), finished
+
+    def complete(self, fn, args, prefix, parser=None):
+        """Call the completion method fn, through the cache if a ttl was
+        set."""
+        if not self.ttl:
+            return self.run(fn, args, prefix)[0]
+        prog_name = parser.prog.split()[0] if parser is not None \
+            else os.path.basename(sys.argv[0])
+        directory = self.get_cache_dir(prog_name, type(args.__func__))
+        key = self._get_key(args)
+        results = self._read_cache(directory, key, prefix)
+        if results is None:
+            results, finished = self.run(fn, args, prefix)
+            # partial results are not cached.
+            if finished:
+                self._write_cache(directory, key, prefix, results)
+        return results
 
     def __call__(self, prefix, **kwargs):
-        from argcomplete import debug
-        from argcomplete import warn
         try:
-            debug("\n------------ DefaultCompleter -----------------")
-            debug("Kwargs content :")
-            for i, j in list(kwargs.items()):
-                debug("key : " + str(i))
-                debug("\t - " + str(j))
+            self._debug("\n------------ DefaultCompleter -----------------")
+            if os.environ.get('_ARC_DEBUG'):
+                self._debug("Kwargs content :")
+                for i, j in list(kwargs.items()):
+                    self._debug("key : " + str(i))
+                    self._debug("\t - " + str(j))
 
             args = kwargs.get('parsed_args')
             # pylint: disable-msg=W0612
@@ -1145,13 +3626,14 @@ class DefaultCompleter(object):
             # getting form args the current Command and looking for a method
             # called by default 'complete'. See __init__ method. The method
             # name is store in the class member called self.func_name
-            debug("-------")
-            debug("__func__:" + str(args.__func__))
-            debug("func_name:" + str(self.func_name))
-            debug("\n------------ DefaultCompleter -----------------\n")
+            self._debug("-------")
+            self._debug("__func__:" + str(args.__func__))
+            self._debug("func_name:" + str(self.func_name))
+            self._debug("\n------------ DefaultCompleter -----------------\n")
             fn = getattr(args.__func__, self.func_name, None)
             if fn:
-                return fn(args, prefix)
+                return self.complete(fn, args, prefix, parser)
+            from argcomplete import warn
             warn("ERROR: Can not find completion function inside the __func__ object !")
             return []
 
@@ -1161,17 +3643,18 @@ class DefaultCompleter(object):
             warn("\nERROR::COMPLETE:An exception was caught :" + str(e) + "\n")
             import traceback
             traceback.print_exc()
-            debug("\n------\n")
+            self._debug("\n------\n")
             return ["comlete-error"]
 
 
 class DefaultProgram(object):
     """ TODO """
 
-    def __init__(self, parser, config=None, force_debug=False):
+    def __init__(self, parser, config=None, force_debug=False, argv=None):
         self.parser = parser
         self.config = config
         self.force_debug = force_debug
+        self.argv = argv
 
     def __call__(self):
 
@@ -1221,17 +3704,11 @@ class DefaultProgram(object):
         args = self.parse_args()
 
         if getattr(args, 'debug', False) or self.force_debug:
-            if hasattr(args, 'debugger_names') and getattr(args, 'debugger_names'):
-                for name in args.debugger_names:
-                    llog = logging.getLogger(name)
-                    llog.setLevel(logging.DEBUG)
-            else:
-                llog = logging.getLogger()
-                llog.setLevel(logging.DEBUG)
-            streamHandler.setFormatter(DEBUG_LOGGING_FORMAT)
+            _set_debug_logging(getattr(args, 'debugger_names', None))
             if self.config:
                 print("debug>>>----------- config -------------------")
-                print(str(self.config))
+                self.config.write_representation(sys.stdout)
+                print("")
                 print("debug----------- processing --------------<<<<")
 
             # run command
@@ -1258,9 +3735,8 @@ class DefaultProgram(object):
 
 
     def parse_args(self):
-        args = self.parser.parse_args()
-        for attr in args.__dict__:
-            data = getattr(args, attr)
+        args = self.parser.parse_args(self.argv, _Namespace())
+        for attr, data in list(vars(args).items()):
             if isinstance(data, str):
                 setattr(args, attr, data)
 
@@ -1275,12 +3751,153 @@ class DefaultProgram(object):
         return args
 
 
+# attributes of a parser rebuilt by _load_parser.
+_PARSER_STRUCTURE = ('_actions', '_option_string_actions', '_action_groups',
+                     '_mutually_exclusive_groups', '_defaults', '_registries',
+                     '_positionals', '_optionals', '_subparsers',
+                     '_has_negative_number_optionals',
+                     '_negative_number_matcher')
+
+
+def _dump_parser(parser):
+    """Return the structure of a parser and of its subparsers : a list of
+    records (class, attributes, default values, groups and actions), the
+    subparsers are referenced by their index into the list."""
+    # pylint: disable-msg=W0212
+    records = []
+    indexes = {}
+
+    def dump(par):
+        if id(par) in indexes:
+            return indexes[id(par)]
+        indexes[id(par)] = len(records)
+        record = {}
+        records.append(record)
+        positions = dict((id(a), i) for i, a in enumerate(par._actions))
+        record['class'] = type(par)
+        record['attrs'] = dict((k, v) for k, v in list(vars(par).items())
+                               if k not in _PARSER_STRUCTURE)
+        record['defaults'] = dict(par._defaults)
+        record['groups'] = [(g.title, g.description,
+                             [positions[id(a)] for a in g._group_actions])
+                            for g in par._action_groups]
+        record['mutex'] = [(g.required,
+                            [positions[id(a)] for a in g._group_actions])
+                           for g in par._mutually_exclusive_groups]
+        record['actions'] = []
+        for action in par._actions:
+            attrs = dict(vars(action))
+            attrs.pop('container', None)
+            if isinstance(action, argparse._SubParsersAction):
+                del attrs['_name_parser_map']
+                attrs['choices'] = OrderedDict(
+                    (name, dump(sub))
+                    for name, sub in list(action.choices.items()))
+            record['actions'].append((type(action), attrs))
+        return indexes[id(par)]
+    dump(parser)
+    return records
+
+
+def _load_parser(records):
+    """Rebuild the parser stored by _dump_parser."""
+    # pylint: disable-msg=W0212
+    identity = argparse.ArgumentParser(
+        add_help=False)._registry_get('type', None)
+    parsers = {}
+
+    def load(index):
+        if index in parsers:
+            return parsers[index]
+        record = records[index]
+        attrs = record['attrs']
+        par = record['class'].__new__(record['class'])
+        parsers[index] = par
+        argparse._ActionsContainer.__init__(
+            par, description=attrs.get('description'),
+            prefix_chars=attrs.get('prefix_chars', '-'),
+            argument_default=attrs.get('argument_default'),
+            conflict_handler=attrs.get('conflict_handler', 'error'))
+        par.__dict__.update(attrs)
+        par.register('type', None, identity)
+        groups = [par.add_argument_group(title, desc)
+                  for title, desc, _ in record['groups']]
+        par._positionals, par._optionals = groups[:2]
+        owners = {}
+        for group, (_, _, positions) in zip(groups, record['groups']):
+            for position in positions:
+                owners[position] = group
+        actions = []
+        for position, (cls, attrs) in enumerate(record['actions']):
+            action = cls.__new__(cls)
+            action.__dict__.update(attrs)
+            if isinstance(action, argparse._SubParsersAction):
+                action.choices = OrderedDict(
+                    (name, load(i)) for name, i in list(attrs['choices'].items()))
+                action._name_parser_map = action.choices
+                par._subparsers = owners[position]
+            owners[position]._add_action(action)
+            actions.append(action)
+        for required, positions in record['mutex']:
+            group = par.add_mutually_exclusive_group(required=required)
+            group._group_actions.extend(actions[i] for i in positions)
+        par._defaults.update(record['defaults'])
+        return par
+    return load(0)
+
+
+def _get_module_files(names):
+    """Return the files of the modules (names), except the standard
+    library ones."""
+    stdlib = getattr(sys, 'stdlib_module_names', ())
+    res = []
+    for name in sorted(n for n in names if n):
+        if name.split('.')[0] in stdlib:
+            continue
+        path = getattr(sys.modules.get(name), '__file__', None)
+        if path and os.path.isfile(path):
+            res.append(path)
+    return res
+
+
+def _get_parser_modules(parser):
+    """Return the names of the modules of the objects used by a parser and
+    its subparsers : commands, completers, actions, types, ..."""
+    # pylint: disable-msg=W0212
+    res = set()
+    parsers = [parser]
+    while parsers:
+        par = parsers.pop()
+        objs = [par, par.formatter_class] + list(par._defaults.values())
+        for action in par._actions:
+            objs.extend([action, action.type, action.default,
+                         getattr(action, 'completer', None)])
+            if isinstance(action, argparse._SubParsersAction):
+                parsers.extend(action.choices.values())
+        for obj in objs:
+            if obj is None:
+                continue
+            if isinstance(obj, type) or callable(obj):
+                res.add(getattr(obj, '__module__', None))
+            if not isinstance(obj, type):
+                res.add(type(obj).__module__)
+    return res
+
+
+def _get_file_hash(path):
+    """sha1 of the content of a file."""
+    with open(path, 'rb') as fde:
+        return hashlib.sha1(fde.read()).hexdigest()
+
+
 class BasicProgram(object):
     """ TODO """
 
     def __init__(self, name, config_file=None, desc=None,
                  mandatory=False, use_config_file=True, version="0.1-alpha",
-                 force_debug=False, force_debug_to_file=False):
+                 force_debug=False, force_debug_to_file=False,
+                 parser_cache=False, log_queue=False, fast_paths=False,
+                 batch=False):
 
         # create configuration
         self.config = Config(name, config_file=config_file, desc=desc,
@@ -1292,6 +3909,19 @@ class BasicProgram(object):
         self.formatter_class = None
         self.force_debug = force_debug
         self.force_debug_to_file = force_debug_to_file
+        # the parser built by add_commands can be stored into the user cache.
+        self.parser_cache = parser_cache
+        # log records are written by a background thread, see
+        # _install_queue_logging.
+        self.log_queue = log_queue
+        # --version and --help are answered before the configuration is
+        # loaded, see fast_path.
+        self.fast_paths = fast_paths
+        # --batch and --batch-jobs options, see run_batch.
+        self.batch = batch
+        # destinations of the options used while the configuration is
+        # reloaded (--config-file, SectionHook, ...), see setup_parser.
+        self._setup_dests = set()
         self.log = self.init_logger()
 
     def init_logger(self):
@@ -1299,22 +3929,29 @@ class BasicProgram(object):
         log = logging.getLogger()
         log.setLevel(logging.INFO)
         # logger handlers
-        log.addHandler(streamHandler)
+        stream_handler = _get_logging('streamHandler')
+        debug_format = _get_logging('DEBUG_LOGGING_FORMAT')
+        if self.log_queue:
+            _install_queue_logging()
+        elif (stream_handler not in log.handlers
+              and 'queueHandler' not in _LOGGING):
+            log.addHandler(stream_handler)
 
         # debug mode
         # if you want to enable debug during class construction, file
         # configuration loading, ..., you need to modify the logger level here.
         if self.force_debug:
             log.setLevel(logging.DEBUG)
-            streamHandler.setFormatter(DEBUG_LOGGING_FORMAT)
+            stream_handler.setFormatter(debug_format)
 
         if self.force_debug_to_file:
             dest = self.prog_name + ".log"
-            FILEHA = logging.FileHandler(dest, 'w', 'utf-8')
-            FILEHA.setFormatter(DEBUG_LOGGING_FORMAT)
+            if self.log_queue:
+                _install_queue_logging(dest)
+            else:
+                _add_debug_file(dest)
             log.setLevel(logging.DEBUG)
-            log.addHandler(FILEHA)
-            streamHandler.setFormatter(DEBUG_LOGGING_FORMAT)
+            stream_handler.setFormatter(debug_format)
             log.warning("output log file : " + dest)
         return log
 
@@ -1345,6 +3982,15 @@ class BasicProgram(object):
         self.parser.add_argument('--version',
                                  action="version",
                                  version="%(prog)s " + self.version)
+        if self.batch:
+            self.parser.add_argument(
+                '--batch', metavar="FILE",
+                help="run every command line of FILE ('-' for stdin) "
+                + "in the current process.")
+            self.parser.add_argument(
+                '--batch-jobs', type=int, default=1, metavar="N",
+                help="number of command lines of the batch run "
+                + "concurrently.")
 
     def add_pre_commands(self):
         """ You can override this method in order to add your command line
@@ -1366,17 +4012,25 @@ class BasicProgram(object):
             action="count",
             **self.config.default.debug.get_arg_parse_arguments())
 
-    def __call__(self):
-
+    def setup_config(self):
+        """Declare and load the configuration. This first step does not
+        depend on the command line arguments."""
         # adding some user options to the config object
         self.add_config_options()
 
         # loading default configuration from the file
         self.load()
 
+    def setup_parser(self, argv=None):
+        """Build the cli parser and reload the configuration using argv
+        (sys.argv[1:] if None)."""
+        self.config.argv = argv
+
         # initialisation of the cli parser,
         # some default arguments are also added.
         self.init_parser()
+        # pylint: disable-msg=W0212
+        base = [a for a in self.parser._actions if a.dest != 'config_file']
 
         # adding some user arguments
         self.add_pre_commands()
@@ -1384,19 +4038,445 @@ class BasicProgram(object):
         # reloading configuration with previous optional arguments
         # (example : config file name from argv, ...)
         self.reload()
+        self._setup_dests = set(
+            a.dest for a in self.parser._actions
+            if a not in base and not isinstance(a, argparse._HelpAction))
 
         # adding all commands
-        self.add_commands()
+        if not self.load_cached_parser():
+            self.add_commands()
+            self.add_completion_option()
+            self.save_cached_parser()
+
+    def add_completion_option(self):
+        """Add the hidden option printing the completion script of the
+        whole parser (see argtoolbox.completion). It is added after the
+        commands, the parser is complete when it is used."""
+        from .completion import CompletionScriptAction
+        self.parser.add_argument('--completion-script',
+                                 action=CompletionScriptAction)
+
+    def _get_persistent_objects(self):
+        """Objects referenced by the parser (commands, completers, ...) that
+        must not be stored with the parser, they are linked again to the
+        current objects when the parser is loaded."""
+        objs = {"program": self, "config": self.config}
+        for key, sec in list(self.config.sections.items()):
+            objs["section:" + key] = sec
+            if isinstance(sec, _Section):
+                for name, elt in list(sec.elements.items()):
+                    objs["element:" + key + ":" + name] = elt
+        return objs
+
+    def get_parser_cache_file(self):
+        """This method will return the parser cache file name. The key
+        depends on the program file, the argtoolbox version and the loaded
+        configuration values (used as default values by the parser). The
+        other modules used by the parser are checked by load_cached_parser."""
+        try:
+            program_hash = _get_file_hash(inspect.getfile(type(self)))
+        except (TypeError, IOError):
+            return None
+        key = hashlib.sha1(
+            "|".join((program_hash, __version__,
+                      self.config.get_fingerprint())).encode('utf-8'))
+        try:
+            directory = get_user_cache_dir('parsers')
+        except OSError as ex:
+            self.log.debug("No parser cache : %s", ex)
+            return None
+        return os.path.join(directory,
+                            self.prog_name + "-" + key.hexdigest() + ".pickle")
+
+    def load_cached_parser(self):
+        """Load the parser from the cache if it is enabled and up to date.
+        It returns True on success."""
+        if not self.parser_cache:
+            return False
+        cache_file = self.get_parser_cache_file()
+        if cache_file is None or not os.path.exists(cache_file):
+            return False
+        objs = self._get_persistent_objects()
+        objs["argparse:SUPPRESS"] = argparse.SUPPRESS
 
-        # run
+        class Unpickler(pickle.Unpickler):
+            """Link the parser to the current objects."""
+            def persistent_load(self, pid):
+                return objs[pid]
+        try:
+            with open(cache_file, 'rb') as fde:
+                # the modules used by the commands, the completers, ...
+                for path, digest in list(pickle.load(fde).items()):
+                    if _get_file_hash(path) != digest:
+                        self.log.debug("parser cache outdated : %s", path)
+                        return False
+                parser = _load_parser(Unpickler(fde).load())
+        # pylint: disable-msg=W0703
+        except Exception as ex:
+            self.log.debug("Can not load the cached parser : %s", ex)
+            return False
+        self.log.debug("parser loaded from cache : %s", cache_file)
+        self.parser = parser
+        self.config.parser = parser
+        return True
+
+    def save_cached_parser(self):
+        """Store the current parser into the cache, if it is enabled."""
+        if not self.parser_cache:
+            return False
+        cache_file = self.get_parser_cache_file()
+        if cache_file is None:
+            return False
+        objs = dict((id(v), k) for k, v in
+                    list(self._get_persistent_objects().items()))
+        modules = set()
+
+        class Pickler(pickle.Pickler):
+            """Do not store the current objects with the parser."""
+            def persistent_id(self, obj):
+                if isinstance(obj, type) or callable(obj):
+                    modules.add(getattr(obj, '__module__', None))
+                else:
+                    modules.add(type(obj).__module__)
+                # argparse checks SUPPRESS by identity.
+                if obj is argparse.SUPPRESS:
+                    return "argparse:SUPPRESS"
+                return objs.get(id(obj))
+        data = io.BytesIO()
+        try:
+            Pickler(data, pickle.HIGHEST_PROTOCOL).dump(
+                _dump_parser(self.parser))
+        # pylint: disable-msg=W0703
+        except Exception as ex:
+            # lambda, open files, ... can not be stored.
+            self.log.debug("Can not store the parser into the cache : %s", ex)
+            return False
+        tmp = cache_file + ".%d.tmp" % os.getpid()
+        try:
+            deps = dict((path, _get_file_hash(path))
+                        for path in _get_module_files(modules))
+            with open(tmp, 'wb') as fde:
+                pickle.dump(deps, fde, pickle.HIGHEST_PROTOCOL)
+                fde.write(data.getvalue())
+            # only the last parser of the program is kept.
+            pattern = re.compile(r'^%s-[0-9a-f]{40}\.pickle$'
+                                 % re.escape(self.prog_name))
+            directory = os.path.dirname(cache_file)
+            for fil in os.listdir(directory):
+                if pattern.match(fil):
+                    os.remove(os.path.join(directory, fil))
+            os.replace(tmp, cache_file)
+        except OSError as ex:
+            self.log.debug("Can not store the parser into the cache : %s", ex)
+            with contextlib.suppress(OSError):
+                os.remove(tmp)
+            return False
+        return True
+
+    def run(self, argv=None):
+        """Parse argv (sys.argv[1:] if None) with the parser already built
+        and run the selected command. It returns the command result."""
         run = DefaultProgram(self.parser, self.config,
-                             force_debug=self.force_debug)
-        if run():
+                             force_debug=self.force_debug, argv=argv)
+        return run()
+
+    @staticmethod
+    def get_exit_code(ex):
+        """Convert a SystemExit exception (argparse errors, --help, ...)
+        into an exit code."""
+        if ex.code is None:
+            return 0
+        if isinstance(ex.code, int):
+            return ex.code
+        sys.stderr.write(str(ex.code) + "\n")
+        return 1
+
+    def run_status(self, argv=None):
+        """Same as run, but it returns an exit code instead of the command
+        result and it never exits."""
+        try:
+            if self.run(argv):
+                return 0
+            return 1
+        except SystemExit as ex:
+            return self.get_exit_code(ex)
+
+    def iter_batch(self, source):
+        """Read lazily the command lines of the input file ('-' for stdin).
+        Empty lines and comments are skipped, the program name at the
+        beginning of a line is optional.
+        It yields (line number, argv), argv is None if the line can not be
+        split (unbalanced quote, ...), the error is written on stderr."""
+        names = (self.prog_name, os.path.basename(sys.argv[0]))
+        fde = sys.stdin if source == '-' else open(source, 'r')
+        try:
+            for num, line in enumerate(fde, 1):
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                try:
+                    argv = shlex.split(line)
+                except ValueError as ex:
+                    sys.stderr.write("line %d : %s\n" % (num, ex))
+                    yield num, None
+                    continue
+                if argv and argv[0] in names:
+                    argv = argv[1:]
+                yield num, argv
+        finally:
+            if fde is not sys.stdin:
+                fde.close()
+
+    def _run_batch_line(self, argv):
+        # the line can not be split, see iter_batch.
+        if argv is None:
+            return 2
+        try:
+            args = self.parser.parse_known_args(argv)[0]
+        except SystemExit as ex:
+            return self.get_exit_code(ex)
+        if getattr(args, 'batch', None):
+            self.log.error("nested batch is not supported.")
+            return 2
+        # the configuration is loaded once for the whole batch.
+        for dest in sorted(self._setup_dests):
+            if getattr(args, dest, None) != self.parser.get_default(dest):
+                self.log.error("option '%s' is not supported in a batch "
+                               "command line, it changes the "
+                               "configuration.", dest)
+                return 2
+        return self.run_status(argv)
+
+    def run_batch(self, source, jobs=1):
+        """Run every command line of the input file with the parser and the
+        configuration already loaded. The command lines are run in order,
+        or concurrently when jobs is greater than 1. Only a few lines are
+        read in advance, so the memory does not depend on the file size.
+        It returns True if every command line succeeded."""
+        log = logging.getLogger('argtoolbox.batch')
+        total = 0
+        failed = 0
+
+        def report(num, code):
+            if code:
+                log.error("line %d : exit status %d", num, code)
+            else:
+                log.info("line %d : exit status %d", num, code)
+
+        lines = self.iter_batch(source)
+        if jobs <= 1:
+            for num, argv in lines:
+                code = self._run_batch_line(argv)
+                report(num, code)
+                total += 1
+                failed += 1 if code else 0
+        else:
+            with futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+                pending = {}
+                for num, argv in lines:
+                    future = executor.submit(self._run_batch_line, argv)
+                    pending[future] = num
+                    if len(pending) < jobs * 2:
+                        continue
+                    done = futures.wait(pending,
+                                        return_when=futures.FIRST_COMPLETED)[0]
+                    for future in done:
+                        code = future.result()
+                        report(pending.pop(future), code)
+                        total += 1
+                        failed += 1 if code else 0
+                for future in futures.wait(pending)[0]:
+                    code = future.result()
+                    report(pending.pop(future), code)
+                    total += 1
+                    failed += 1 if code else 0
+        log.info("batch completed : %(total)d command lines, %(ok)d succeeded,"
+                 " %(failed)d failed.",
+                 {"total": total, "ok": total - failed, "failed": failed})
+        return failed == 0
+
+    def serve(self, socket_path=None, idle_timeout=600, workers=4):
+        """Run the current program as a resident server listening on a
+        unix socket. See argtoolbox.server."""
+        from .server import ProgramServer
+        server = ProgramServer(self, socket_path=socket_path,
+                               idle_timeout=idle_timeout, workers=workers)
+        return server.serve_forever()
+
+    @staticmethod
+    def get_info_request(argv):
+        """Return ('version', None) or ('help', subcommands) if argv only
+        asks for the version or for the help of a (sub)command, else
+        None."""
+        words = [i for i in argv if i not in ('-v', '--verbose')]
+        if words == ['--version']:
+            return ('version', None)
+        if words and words[-1] in ('-h', '--help'):
+            path = words[:-1]
+            if not [i for i in path if i.startswith('-')]:
+                return ('help', path)
+        return None
+
+    def get_help_cache_file(self, path):
+        """This method will return the cache file of the help of the
+        subcommands path, None if it can not be cached. The key depends on
+        the program file, the configuration files, the subcommands and the
+        terminal width. The files are only checked, not read."""
+        module = sys.modules.get(type(self).__module__)
+        sources = [getattr(module, '__file__', None)]
+        if sources[0] is None:
+            return None
+        if self.config.use_config_file:
+            if not self.config.config_file:
+                sources.extend(self.config.get_default_file_list())
+            elif isinstance(self.config.config_file, str):
+                sources.append(self.config.config_file)
+            else:
+                return None
+        state = []
+        for source in sources:
+            source = os.path.abspath(source)
+            try:
+                stat = os.stat(source)
+                state.append((source, stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                state.append((source, None, None))
+        columns = shutil.get_terminal_size().columns
+        path_key = hashlib.sha1(" ".join(path).encode('utf-8')).hexdigest()
+        key = hashlib.sha1(repr((state, __version__, self.version, path,
+                                 columns)).encode('utf-8')).hexdigest()
+        try:
+            directory = get_user_cache_dir('help')
+        except OSError:
+            return None
+        return os.path.join(
+            directory, "%s-%s-%s.txt" % (self.prog_name, path_key[:12], key))
+
+    @staticmethod
+    def _read_help_cache(cache_file):
+        """Return the cached help, None if it is missing or if one of the
+        modules used by the parser has changed."""
+        try:
+            with open(cache_file, 'r', encoding='utf-8') as fde:
+                deps = json.loads(fde.readline())
+                for path, state in list(deps.items()):
+                    stat = os.stat(path)
+                    if [stat.st_mtime_ns, stat.st_size] != state:
+                        return None
+                return fde.read()
+        except (OSError, ValueError):
+            return None
+
+    def _write_help_cache(self, cache_file, text):
+        """Store the help with the state of the modules used by the
+        parser."""
+        modules = _get_parser_modules(self.parser)
+        modules.update(c.__module__ for c in type(self).__mro__)
+        deps = {}
+        for path in _get_module_files(modules):
+            stat = os.stat(path)
+            deps[path] = [stat.st_mtime_ns, stat.st_size]
+        # only the last help of the subcommand is kept.
+        prefix = os.path.basename(cache_file).rsplit('-', 1)[0]
+        pattern = re.compile(r'^%s-[0-9a-f]{40}\.txt$' % re.escape(prefix))
+        directory = os.path.dirname(cache_file)
+        tmp = cache_file + ".%d.tmp" % os.getpid()
+        try:
+            for fil in os.listdir(directory):
+                if pattern.match(fil):
+                    os.remove(os.path.join(directory, fil))
+            with open(tmp, 'w', encoding='utf-8') as fde:
+                fde.write(json.dumps(deps) + "\n")
+                fde.write(text)
+            os.replace(tmp, cache_file)
+        except OSError as ex:
+            self.log.debug("Can not store the help into the cache : %s", ex)
+
+    def get_command_parser(self, path):
+        """Return the parser of the subcommands path, None if one of them
+        is not a subcommand."""
+        parser = self.parser
+        for name in path:
+            # pylint: disable-msg=W0212
+            subparsers = [a for a in parser._actions
+                          if isinstance(a, argparse._SubParsersAction)]
+            if not subparsers or name not in subparsers[0].choices:
+                return None
+            parser = subparsers[0].choices[name]
+        return parser
+
+    def fast_path(self, argv):
+        """Answer --version without loading the configuration, and --help
+        from the cached help of the subcommand. The configuration is only
+        loaded and the parser built when the help is not cached yet. Cache
+        errors are ignored, the help is then built as usual.
+        It returns True if the invocation was answered."""
+        if not self.fast_paths or os.environ.get('_ARGCOMPLETE'):
+            return False
+        request = self.get_info_request(argv)
+        if request is None:
+            return False
+        if request[0] == 'version':
+            sys.stdout.write("%s %s\n" % (self.prog_name, self.version))
+            return True
+        path = request[1]
+        cache_file = self.get_help_cache_file(path)
+        if cache_file is not None:
+            text = self._read_help_cache(cache_file)
+            if text is not None:
+                sys.stdout.write(text)
+                return True
+        self.setup_config()
+        self.setup_parser(argv)
+        parser = self.get_command_parser(path)
+        if parser is None:
+            return False
+        text = parser.format_help()
+        if cache_file is not None:
+            self._write_help_cache(cache_file, text)
+        sys.stdout.write(text)
+        return True
+
+    def __call__(self):
+        argv = self.config.argv
+        if argv is None:
+            argv = sys.argv[1:]
+        # informational invocations : --version and --help.
+        if self.fast_path(argv):
+            sys.exit(0)
+        if self.parser is None:
+            self.setup_config()
+            self.setup_parser()
+        # batch mode : the configuration and the parser are reused by every
+        # command line of the batch.
+        argv = self.config.argv
+        if argv is None:
+            argv = sys.argv[1:]
+        args = None
+        if self.batch:
+            args = self.parser.parse_known_args(argv)[0]
+        if getattr(args, 'batch', None):
+            res = self.run_batch(args.batch, args.batch_jobs)
+        else:
+            res = self.run()
+        # run
+        if res:
             sys.exit(0)
         else:
             sys.exit(1)
 
 
+def get_user_cache_dir(*parts):
+    """This method will return (and create) the argtoolbox directory
+    into the user cache ($XDG_CACHE_HOME or ~/.cache)."""
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    directory = os.path.join(base, 'argtoolbox', *parts)
+    if not os.path.isdir(directory):
+        # concurrent commands (batch, server) can create it at the same time.
+        os.makedirs(directory, 0o700, exist_ok=True)
+    return directory
+
+
 def query_yes_no(question, default="yes"):
     """Just prompt the user for a yes/no question"""
     res = _query_yes_no(question, default)
@@ -0,0 +1,146 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Tiny client for programs running in daemon mode (see argtoolbox.server).
+
+It only uses the standard library and does not import argtoolbox itself, so
+the startup cost is the python interpreter one.
+
+usage : argtoolbox-client <prog_name> [program arguments ...]
+"""
+
+# This file is part of argtoolbox.
+#
+# argtoolbox is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# argtoolbox is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with LinShare user cli.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright 2014 Frédéric MARTIN
+#
+# Contributors list:
+#
+#  Frédéric MARTIN frederic.martin.fma@gmail.com
+#
+
+
+import os
+import sys
+import json
+import stat
+import socket
+import threading
+
+
+# Every message exchanged between the client and the server is a json
+# object on a single line.
+#  client -> server : {"argv": [], "cwd": "", "env": {}}, then
+#                     {"in": "data"} ... and {"eof": true}
+#  server -> client : {"out": "data"}, {"err": "data"} ... and
+#                     {"exit": code}
+
+
+def get_socket_path(prog_name):
+    """This method will return the per-user unix socket path used by the
+    server of the program 'prog_name'."""
+    base = os.environ.get('XDG_RUNTIME_DIR') or \
+        os.environ.get('TMPDIR') or '/tmp'
+    directory = os.path.join(base, "argtoolbox-%d" % os.getuid())
+    return os.path.join(directory, prog_name + ".sock")
+
+
+def check_socket_directory(directory):
+    """The socket directory can be in a shared place (/tmp) : it must be
+    a real directory, owned by the current user and closed to the other
+    ones, else an other user could listen in place of the server.
+    PermissionError is raised otherwise."""
+    info = os.lstat(directory)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or \
+            info.st_mode & 0o077:
+        raise PermissionError(
+            "Unsafe socket directory (owner, mode) : %s" % directory)
+
+
+def send_message(sock, message, lock=None):
+    """Send one message (a dict) to the socket."""
+    data = (json.dumps(message) + "\n").encode('utf-8')
+    if lock is None:
+        sock.sendall(data)
+    else:
+        with lock:
+            sock.sendall(data)
+
+
+def _forward_stdin(sock, stdin, lock):
+    """Forward the client stdin to the server, line by line."""
+    try:
+        if stdin is not None:
+            for line in iter(stdin.readline, ''):
+                send_message(sock, {"in": line}, lock)
+        send_message(sock, {"eof": True}, lock)
+    except (OSError, ValueError):
+        pass
+
+
+def request(socket_path, argv, stdin=None, stdout=None, stderr=None,
+            cwd=None, env=None):
+    """Forward one invocation (argv, cwd, environment and streams) to the
+    server listening on socket_path and return the exit code.
+    stdin can be None if nothing has to be forwarded."""
+    stdout = stdout or sys.stdout
+    stderr = stderr or sys.stderr
+    check_socket_directory(os.path.dirname(os.path.abspath(socket_path)))
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(socket_path)
+    lock = threading.Lock()
+    try:
+        send_message(sock, {
+            "argv": list(argv),
+            "cwd": cwd or os.getcwd(),
+            "env": dict(os.environ if env is None else env)}, lock)
+        feeder = threading.Thread(target=_forward_stdin,
+                                  args=(sock, stdin, lock))
+        feeder.daemon = True
+        feeder.start()
+        for line in sock.makefile('r', encoding='utf-8'):
+            message = json.loads(line)
+            if "out" in message:
+                stdout.write(message["out"])
+                stdout.flush()
+            elif "err" in message:
+                stderr.write(message["err"])
+                stderr.flush()
+            elif "exit" in message:
+                return message["exit"]
+        stderr.write("argtoolbox-client: connection closed by the server.\n")
+        return 1
+    finally:
+        sock.close()
+
+
+def main(argv=None):
+    """Client entry point."""
+    if argv is None:
+        argv = sys.argv[1:]
+    if not argv:
+        sys.stderr.write(__doc__.strip().split("\n")[-1] + "\n")
+        return 2
+    socket_path = get_socket_path(argv[0])
+    try:
+        return request(socket_path, argv[1:], stdin=sys.stdin)
+    except (socket.error, OSError) as ex:
+        sys.stderr.write(
+            "argtoolbox-client: no server available for '%s' (%s).\n"
+            % (argv[0], ex))
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
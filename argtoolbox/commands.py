@@ -28,15 +28,21 @@
 
 
 import sys
+import ast
 import stat
 import os
-import shutil
+import json
 import uuid
+import bisect
+import shutil
+import inspect
 import tempfile
 import importlib
-import inspect
 import logging
 import argparse
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+from . import argtoolbox as _argtoolbox
 from .argtoolbox import Config
 from .argtoolbox import BasicProgram
 from .argtoolbox import DefaultProgram
@@ -48,6 +54,357 @@ from .argtoolbox import query_yes_no
 # if you want to debug argcomplete completion,
 # you just need to export _ARC_DEBUG=True
 
+
+class NotStaticError(Exception):
+    """The program can not be read without importing it."""
+
+
+class StaticConfigExtractor(object):
+    """This class reads the Config object declared by a program without
+    importing it : the source code is parsed and only the add_section /
+    add_element calls with literal arguments are evaluated.
+    NotStaticError is raised for everything else (loops, conditions, calls to
+    unknown functions, ...).
+    """
+
+    # argtoolbox objects a program can build.
+    CONSTRUCTORS = ('SimpleSection', 'SubSection', 'ListSection', 'Element',
+                    'ElementWithSubSections', 'ElementWithRelativeSubSection',
+                    'DefaultHook', 'Base64ElementHook', 'TypedList')
+    # methods a program can call on the config, its sections and elements.
+    METHODS = ('add_section', 'add_element', 'add_element_list',
+               'get_default_section', 'get_section', 'get_element')
+    BUILTINS = {'int': int, 'str': str, 'float': float, 'bool': bool,
+                'list': list, 'None': None, 'True': True, 'False': False}
+    SAFE_OBJECTS = (Config, _argtoolbox._AbstractSection,
+                    _argtoolbox.Element, _argtoolbox.DefaultHook)
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'r') as fde:
+            self.tree = ast.parse(fde.read(), filename)
+        self.classes = {}
+        self.imports = {}
+        for node in self.tree.body:
+            if isinstance(node, ast.ClassDef):
+                self.classes[node.name] = node
+            elif isinstance(node, ast.ImportFrom) and node.module in (
+                    'argtoolbox', 'argtoolbox.argtoolbox'):
+                for alias in node.names:
+                    if alias.name == '*':
+                        self.imports.update(
+                            (k, v) for k, v in vars(_argtoolbox).items()
+                            if not k.startswith('_'))
+                        continue
+                    obj = getattr(_argtoolbox, alias.name, None)
+                    if obj is not None:
+                        self.imports[alias.asname or alias.name] = obj
+
+    def _is_program(self, class_name):
+        """True if the class is a BasicProgram (declared or imported)."""
+        obj = self.imports.get(class_name)
+        if obj is not None:
+            return isinstance(obj, type) and issubclass(obj, BasicProgram)
+        node = self.classes.get(class_name)
+        if node is None:
+            return False
+        for base in node.bases:
+            if isinstance(base, ast.Name) and self._is_program(base.id):
+                return True
+        return False
+
+    def _find_program(self):
+        """Looking for 'PROG = MyProgram(...)' at the module level (or in
+        the 'if __name__ == "__main__"' block)."""
+        nodes = []
+        for node in self.tree.body:
+            if isinstance(node, ast.If):
+                nodes.extend(node.body)
+            else:
+                nodes.append(node)
+        for node in nodes:
+            if (isinstance(node, ast.Assign)
+                    and isinstance(node.value, ast.Call)
+                    and isinstance(node.value.func, ast.Name)
+                    and self._is_program(node.value.func.id)):
+                return node.value
+        raise NotStaticError("No BasicProgram instance found.")
+
+    def extract(self):
+        """Build the Config object of the program."""
+        call = self._find_program()
+        class_name = call.func.id
+        if self._find_method(class_name, '__init__')[1] in self.classes:
+            raise NotStaticError("BasicProgram.__init__ is overridden.")
+        if [a for a in call.args if isinstance(a, ast.Starred)] or \
+                [k for k in call.keywords if k.arg is None]:
+            raise NotStaticError("Unsupported program arguments.")
+        signature = inspect.signature(BasicProgram.__init__)
+        bound = signature.bind(
+            None, *call.args, **dict((k.arg, k.value) for k in call.keywords))
+        kwargs = {}
+        for key in ('desc', 'mandatory', 'use_config_file'):
+            if key in bound.arguments:
+                kwargs[key] = self._eval(bound.arguments[key], {}, None)
+        name = self._eval(bound.arguments['name'], {}, None)
+        config = Config(name, **kwargs)
+        self._call_method(class_name, 'add_config_options',
+                          _StaticProgram(config))
+        return config
+
+    def _find_method(self, class_name, method):
+        """Return the method definition (or the library implementation) and
+        the name of the class which defines it."""
+        obj = self.imports.get(class_name)
+        if obj is not None:
+            return getattr(obj, method, None), class_name
+        node = self.classes.get(class_name)
+        if node is None:
+            raise NotStaticError("Unknown class : " + class_name)
+        for item in node.body:
+            if isinstance(item, ast.FunctionDef) and item.name == method:
+                return item, class_name
+        for base in node.bases:
+            if not isinstance(base, ast.Name):
+                raise NotStaticError("Unsupported base class.")
+            res = self._find_method(base.id, method)
+            if res[0] is not None:
+                return res
+        return None, None
+
+    def _call_method(self, class_name, method, program, parent=False):
+        """Run a method of the program class (or of its parent class)."""
+        func, owner = None, None
+        if parent:
+            for base in self.classes[class_name].bases:
+                if not isinstance(base, ast.Name):
+                    raise NotStaticError("Unsupported base class.")
+                func, owner = self._find_method(base.id, method)
+                if func is not None:
+                    break
+        else:
+            func, owner = self._find_method(class_name, method)
+        if func is None:
+            raise NotStaticError("Unknown method : " + method)
+        if not isinstance(func, ast.FunctionDef):
+            # library implementation, like BasicProgram.add_config_options
+            return func(program)
+        if len(func.args.args) != 1 or func.decorator_list:
+            raise NotStaticError("Unsupported method : " + method)
+        env = {func.args.args[0].arg: program}
+        for stmt in func.body:
+            if isinstance(stmt, ast.Pass):
+                continue
+            if isinstance(stmt, ast.Return) and stmt.value is None:
+                break
+            if isinstance(stmt, ast.Expr):
+                if isinstance(stmt.value, ast.Constant):
+                    continue
+                self._eval(stmt.value, env, owner)
+            elif (isinstance(stmt, ast.Assign) and len(stmt.targets) == 1
+                  and isinstance(stmt.targets[0], ast.Name)):
+                env[stmt.targets[0].id] = self._eval(stmt.value, env, owner)
+            else:
+                raise NotStaticError(
+                    "Unsupported statement line %d" % stmt.lineno)
+        return None
+
+    # pylint: disable=too-many-return-statements
+    # pylint: disable=too-many-branches
+    def _eval(self, node, env, owner):
+        """Evaluate an expression of add_config_options."""
+        if isinstance(node, ast.Constant):
+            return node.value
+        if isinstance(node, (ast.List, ast.Tuple)):
+            res = [self._eval(i, env, owner) for i in node.elts]
+            return res if isinstance(node, ast.List) else tuple(res)
+        if isinstance(node, ast.Dict) and None not in node.keys:
+            return dict((self._eval(k, env, owner), self._eval(v, env, owner))
+                        for k, v in zip(node.keys, node.values))
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+            return -self._eval(node.operand, env, owner)
+        if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Add):
+            left = self._eval(node.left, env, owner)
+            right = self._eval(node.right, env, owner)
+            if isinstance(left, str) and isinstance(right, str):
+                return left + right
+        if isinstance(node, ast.Name):
+            if node.id in env:
+                return env[node.id]
+            if node.id in self.BUILTINS:
+                return self.BUILTINS[node.id]
+            if node.id in self.imports and getattr(
+                    self.imports[node.id], '__name__', None) \
+                    in self.CONSTRUCTORS:
+                return self.imports[node.id]
+        if isinstance(node, ast.Attribute):
+            obj = self._eval(node.value, env, owner)
+            if isinstance(obj, _StaticProgram) and node.attr == 'config':
+                return obj.config
+            if isinstance(obj, self.SAFE_OBJECTS) and \
+                    not node.attr.startswith('_'):
+                res = getattr(obj, node.attr)
+                if not callable(res) or node.attr in self.METHODS:
+                    return res
+        if isinstance(node, ast.Call):
+            return self._eval_call(node, env, owner)
+        raise NotStaticError("Unsupported expression line %d"
+                             % getattr(node, 'lineno', 0))
+
+    def _eval_call(self, node, env, owner):
+        func = node.func
+        # super(MyProgram, self).add_config_options()
+        if (isinstance(func, ast.Attribute)
+                and isinstance(func.value, ast.Call)
+                and isinstance(func.value.func, ast.Name)
+                and func.value.func.id == 'super'):
+            program = [v for v in env.values()
+                       if isinstance(v, _StaticProgram)]
+            if not program or owner not in self.classes:
+                raise NotStaticError("Unsupported super call.")
+            return self._call_method(owner, func.attr, program[0], True)
+        func = self._eval(func, env, owner)
+        args = []
+        for arg in node.args:
+            if isinstance(arg, ast.Starred):
+                args.extend(self._eval(arg.value, env, owner))
+            else:
+                args.append(self._eval(arg, env, owner))
+        kwargs = {}
+        for keyword in node.keywords:
+            if keyword.arg is None:
+                kwargs.update(self._eval(keyword.value, env, owner))
+            else:
+                kwargs[keyword.arg] = self._eval(keyword.value, env, owner)
+        return func(*args, **kwargs)
+
+
+class _StaticProgram(object):
+    """Stand-in for 'self' while add_config_options is evaluated."""
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, config):
+        self.config = config
+
+
+def _generate_program(program, options):
+    """Generate the configuration file of one program (process pool
+    worker)."""
+    command = ConfigGenerationCommand()
+    try:
+        config = command.getconfig(program, options.import_program)
+        return program, command.generate(options, config)
+    # pylint: disable=broad-except
+    except Exception as ex:
+        command.log.error("%s : %s", program, ex)
+        return program, False
+
+
+class ExecutableIndex(object):
+    """Index of the executable files found into the $PATH directories.
+    The sorted list of the files of every directory is stored into the user
+    cache, a directory is only listed again when its mtime changes.
+    Lookups follow the $PATH order : the first directory wins."""
+
+    VERSION = 1
+
+    def __init__(self, path=None, cache_file=None):
+        if path is None:
+            path = os.environ.get('PATH', '')
+        self.directories = [d for d in path.split(os.pathsep) if d]
+        if cache_file is None:
+            cache_file = os.path.join(
+                _argtoolbox.get_user_cache_dir(), "executables.json")
+        self.cache_file = cache_file
+        self.index = None
+
+    def _read_cache(self):
+        try:
+            with open(self.cache_file, 'r') as fde:
+                data = json.load(fde)
+            if data.get('version') == self.VERSION:
+                return data['directories']
+        except (OSError, ValueError, KeyError):
+            pass
+        return {}
+
+    def _write_cache(self, directories):
+        tmp = "%s.%d.tmp" % (self.cache_file, os.getpid())
+        try:
+            with open(tmp, 'w') as fde:
+                json.dump({'version': self.VERSION,
+                           'directories': directories}, fde)
+            os.replace(tmp, self.cache_file)
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    @staticmethod
+    def _list(directory):
+        res = []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_file() or entry.is_symlink():
+                        res.append(entry.name)
+                except OSError:
+                    pass
+        res.sort()
+        return res
+
+    def load(self):
+        """Build the index : one stat per directory, the directories which
+        changed since the last time are listed again."""
+        cache = self._read_cache()
+        changed = False
+        self.index = []
+        for directory in self.directories:
+            try:
+                mtime = os.stat(directory).st_mtime_ns
+            except OSError:
+                continue
+            entry = cache.get(directory)
+            if entry is None or entry[0] != mtime:
+                try:
+                    entry = [mtime, self._list(directory)]
+                except OSError:
+                    continue
+                cache[directory] = entry
+                changed = True
+            self.index.append((directory, entry[1]))
+        if changed:
+            self._write_cache(cache)
+        return self
+
+    def _get_index(self):
+        if self.index is None:
+            self.load()
+        return self.index
+
+    def find(self, name):
+        """Return the full path of the first executable named 'name', or
+        None."""
+        for directory, names in self._get_index():
+            i = bisect.bisect_left(names, name)
+            if i < len(names) and names[i] == name:
+                return os.path.join(directory, name)
+        return None
+
+    def complete(self, prefix):
+        """Return the executable names starting with prefix, without
+        duplicates, in $PATH order."""
+        res = []
+        seen = set()
+        for _, names in self._get_index():
+            i = bisect.bisect_left(names, prefix)
+            while i < len(names) and names[i].startswith(prefix):
+                if names[i] not in seen:
+                    seen.add(names[i])
+                    res.append(names[i])
+                i += 1
+        return res
+
+
 class ConfigGenerationCommand(DefaultCommand):
     """Deprecated. This command read a existing program and generate the associated
     configuration file"""
@@ -56,27 +413,56 @@ class ConfigGenerationCommand(DefaultCommand):
         self.log.debug("args: %s", args)
         if args.debug:
             self.log.setLevel(logging.DEBUG)
-        config = self.getconfig(args.program)
-        return self.generate(args, config)
-
-    def getconfig(self, program):
-        """Looking for a Config Object into the input program."""
+        if len(args.program) == 1:
+            config = self.getconfig(args.program[0], args.import_program)
+            return self.generate(args, config)
+        if args.output:
+            self.log.error("--output can not be used with many programs.")
+            return False
+        options = argparse.Namespace(**vars(args))
+        del options.__func__
+        # no prompt in the workers.
+        options.interactive = False
+        res = True
+        with ProcessPoolExecutor(max_workers=args.processes) as executor:
+            for program, status in executor.map(
+                    _generate_program, args.program, repeat(options)):
+                self.log.info("%s : %s", program,
+                              "done" if status else "failed")
+                res = res and status
+        return res
+
+    def getconfig(self, program, import_program=False):
+        """Looking for a Config Object into the input program.
+        The program source code is read first, the program is only imported
+        when the Config object can not be built statically."""
         self.log.info("Looking for Config object into input program ...")
         self.log.debug("input program name : '%s'", program)
-
-        for path in os.environ['PATH'].split(':'):
-            if os.path.isdir(path):
-                for fil in os.listdir(path):
-                    fullfile = path + "/" + fil
-                    if os.path.isfile(fullfile) or os.path.islink(fullfile):
-                        if fil == program:
-                            program = fullfile
-                            break
+        program = self.find_program(program)
+        if not import_program:
+            try:
+                config = StaticConfigExtractor(program).extract()
+                self.log.info("Config object found : %s", config.prog_name)
+                return config
+            except (NotStaticError, SyntaxError, UnicodeDecodeError) as ex:
+                self.log.debug("static extraction failed : %s", ex)
+        return self.import_config(program)
+
+    def find_program(self, program):
+        """Looking for the input program into the $PATH."""
+        if os.sep not in program:
+            fullfile = ExecutableIndex().find(program)
+            if fullfile is not None:
+                program = fullfile
         self.log.info("Program found : %s", program)
         if not os.path.exists(program):
             self.log.error("the current input program does not exist : %s", program)
             raise IOError('No such file')
+        return program
 
+    def import_config(self, program):
+        """Looking for a Config Object into the input program, the program
+        is imported."""
         dest = os.path.join(
             tempfile.gettempdir(),
             str(uuid.uuid4()).replace("-", "") + ".py")
@@ -143,10 +529,19 @@ class ConfigGenerationCommand(DefaultCommand):
             if os.path.exists(configfile):
                 self.log.warn(
                     "The current file already exists : %s", configfile)
+                if not getattr(args, 'interactive', True):
+                    self.log.error("Aborted, use -f to overwrite it.")
+                    return False
                 if not query_yes_no("Overwrite ?", "no"):
                     self.log.error("Aborted.")
                     return False
-        config.write_default_config_file(configfile, args.nocomments)
+        res = config.write_default_config_file(
+            configfile, args.nocomments,
+            skip_unchanged=getattr(args, 'skip_unchanged', False))
+        if res is None:
+            self.log.info("The configuration does not use a file.")
+        elif not res:
+            self.log.info("The configuration file is unchanged.")
         self.log.info("Done.")
         return True
 
@@ -154,15 +549,7 @@ class ConfigGenerationCommand(DefaultCommand):
         """autocomplete binary file into the $PATH"""
         # pylint: disable=unused-argument
         # pylint: disable=no-self-use
-        results = []
-        for path in os.environ['PATH'].split(':'):
-            if os.path.isdir(path):
-                for fil in os.listdir(path):
-                    fullfile = path + "/" + fil
-                    if os.path.isfile(fullfile) or os.path.islink(fullfile):
-                        if fil.startswith(prefix):
-                            results.append(fil)
-        return results
+        return ExecutableIndex().complete(prefix)
 
 
 class GenerateCommand(DefaultCommand):
@@ -244,12 +631,28 @@ class MyProgram(BasicProgram):
         parser_tmp.add_argument('-o', '--output', action="store")
         parser_tmp.add_argument(
             'program',
+            nargs='+',
             action="store").completer = Completer("complete_bin")
+        parser_tmp.add_argument(
+            '-j', '--jobs',
+            dest="processes",
+            type=int,
+            default=None,
+            help="number of processes used to read many programs.")
+        parser_tmp.add_argument(
+            '--import',
+            dest="import_program",
+            action="store_true",
+            help="always import the program instead of reading its source.")
         parser_tmp.add_argument(
             '-n',
             dest="nocomments",
             action="store_false",
             help="config file generation without commments.")
+        parser_tmp.add_argument(
+            '-u', '--skip-unchanged',
+            action="store_true",
+            help="do not rewrite the output file if its content is unchanged.")
         parser_tmp.add_argument(
             '-f',
             dest="force_yes",
@@ -296,7 +699,13 @@ class ConfigGenerationV2Command(object):
                 if not query_yes_no("Overwrite ?", "no"):
                     self.log.error("Aborted.")
                     return False
-        config.write_default_config_file(configfile, args.nocomments)
+        res = config.write_default_config_file(
+            configfile, args.nocomments,
+            skip_unchanged=getattr(args, 'skip_unchanged', False))
+        if res is None:
+            self.log.info("The configuration does not use a file.")
+        elif not res:
+            self.log.info("The configuration file is unchanged.")
         self.log.info("Done.")
         return True
 
@@ -318,6 +727,10 @@ def cli_generate_config(prog_name, config, description=None, command_name="gener
         dest="nocomments",
         action="store_false",
         help="config file generation without commments.")
+    parser_tmp.add_argument(
+        '-u', '--skip-unchanged',
+        action="store_true",
+        help="do not rewrite the output file if its content is unchanged.")
     parser_tmp.add_argument(
         '-d',
         dest="debug",
@@ -0,0 +1,287 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Static shell completion scripts.
+
+The parser tree of a program (subcommands, options, choices) is written into
+a bash (or zsh) completion script. Subcommands, options and choices are
+completed by the shell itself, the program is only run (through argcomplete)
+for the arguments using a completer, a DefaultCompleter for example.
+
+usage : eval "$(<prog_name> --completion-script bash)"
+"""
+
+# This file is part of argtoolbox.
+#
+# argtoolbox is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# argtoolbox is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with LinShare user cli.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright 2014 Frédéric MARTIN
+#
+# Contributors list:
+#
+#  Frédéric MARTIN frederic.martin.fma@gmail.com
+#
+
+
+import re
+import sys
+import argparse
+
+
+SHELLS = ('bash', 'zsh')
+
+# words written as is into the script.
+_SAFE_WORD = re.compile(r'^[\w.,:+@%/=-]+$')
+
+# completion of the values of an argument.
+FILES = "files"
+DYNAMIC = "dynamic"
+NONE = "none"
+
+
+def get_spec(action):
+    """Return how the values of an action are completed : DYNAMIC, FILES,
+    NONE (numbers, ...) or the list of its choices."""
+    if getattr(action, 'completer', None) is not None:
+        return DYNAMIC
+    if action.choices is not None:
+        words = [str(c) for c in action.choices]
+        if all(_SAFE_WORD.match(w) for w in words):
+            return words
+        return DYNAMIC
+    if action.type not in (None, str) and \
+            not isinstance(action.type, argparse.FileType):
+        return NONE
+    return FILES
+
+
+def _get_slots(action):
+    """Number of positional words used by an action, None if variable."""
+    if action.nargs is None or action.nargs == argparse.OPTIONAL:
+        return 1
+    if isinstance(action.nargs, int):
+        return action.nargs
+    if action.nargs == argparse.PARSER:
+        return 1
+    return None
+
+
+def walk_parser(parser, path=()):
+    """Yield a description (a dict) of the parser and of its subparsers.
+
+    - path -- names of the subcommands.
+    - flags -- visible option strings.
+    - values -- {option string: spec} for the options with values.
+    - positionals -- [(index, spec)], index is '*' for the remaining words.
+    - commands -- {name: subparser}.
+    """
+    node = {'path': path, 'flags': [], 'values': {}, 'positionals': [],
+            'commands': {}}
+    index = 0
+    # pylint: disable-msg=W0212
+    for action in parser._actions:
+        if action.option_strings:
+            if action.help is not argparse.SUPPRESS:
+                node['flags'].extend(action.option_strings)
+            if action.nargs != 0:
+                spec = get_spec(action)
+                for option in action.option_strings:
+                    node['values'][option] = spec
+            continue
+        if index is None:
+            continue
+        if isinstance(action, argparse._SubParsersAction):
+            node['commands'].update(action.choices)
+            spec = list(action.choices)
+        else:
+            spec = get_spec(action)
+        slots = _get_slots(action)
+        if slots is None:
+            node['positionals'].append(('*', spec))
+            index = None
+        else:
+            for i in range(index, index + slots):
+                node['positionals'].append((i, spec))
+            index += slots
+        # the remaining words belong to the subcommand.
+        if action.nargs == argparse.PARSER:
+            index = None
+    yield node
+    for name, subparser in list(node['commands'].items()):
+        if _SAFE_WORD.match(name):
+            for sub in walk_parser(subparser, path + (name,)):
+                yield sub
+
+
+def _quote(path, word):
+    return '"%s|%s"' % (" ".join(path), word)
+
+
+def _spec(spec):
+    if isinstance(spec, list):
+        return "words:" + " ".join(spec)
+    return spec
+
+
+def _case(var, items, indent):
+    """case block setting spec, items is a list of (patterns, spec)."""
+    if not items:
+        return []
+    pad = " " * indent
+    lines = [pad + 'case "%s" in' % var]
+    for patterns, spec in items:
+        lines.append(pad + "    %s) spec=\"%s\";;" % ("|".join(patterns),
+                                                     _spec(spec)))
+    lines.append(pad + "esac")
+    return lines
+
+
+def get_completion_script(parser, shell='bash', prog_name=None):
+    """Return the completion script of the parser."""
+    if shell not in SHELLS:
+        raise ValueError("Unsupported shell : %s" % shell)
+    prog_name = prog_name or parser.prog.split()[0]
+    func = "_argtoolbox_" + re.sub(r'\W', '_', prog_name)
+    nodes = list(walk_parser(parser))
+    value_options = []
+    transitions = []
+    values = []
+    flags = []
+    positionals = []
+    remaining = []
+    for node in nodes:
+        path = node['path']
+        for option, spec in list(node['values'].items()):
+            value_options.append(_quote(path, option))
+            values.append(([_quote(path, option)], spec))
+        for name in node['commands']:
+            if _SAFE_WORD.match(name):
+                transitions.append((_quote(path, name),
+                                    " ".join(path + (name,))))
+        if node['flags']:
+            flags.append((['"%s"' % " ".join(path)], node['flags']))
+        for index, spec in node['positionals']:
+            if index == '*':
+                remaining.append(([_quote(path, '*')], spec))
+            else:
+                positionals.append(([_quote(path, index)], spec))
+
+    lines = []
+    if shell == 'zsh':
+        lines.append("autoload -U +X bashcompinit && bashcompinit")
+    lines.extend([
+        "# %s completion, generated by argtoolbox." % prog_name,
+        "%s_python() {" % func,
+        "    local IFS=$'\\013'",
+        "    COMPREPLY=( $(IFS=\"$IFS\" COMP_LINE=\"$COMP_LINE\" "
+        "COMP_POINT=\"$COMP_POINT\" \\",
+        "        COMP_TYPE=\"$COMP_TYPE\" "
+        "_ARGCOMPLETE_COMP_WORDBREAKS=\"$COMP_WORDBREAKS\" \\",
+        "        _ARGCOMPLETE=1 _ARGCOMPLETE_SUPPRESS_SPACE=0 \\",
+        "        \"$1\" 8>&1 9>&2 1>/dev/null 2>/dev/null) )",
+        "    if [[ $? != 0 ]]; then",
+        "        unset COMPREPLY",
+        "    fi",
+        "}",
+        "",
+        "%s() {" % func,
+        "    local cur=\"${COMP_WORDS[COMP_CWORD]}\"",
+        "    local prev=\"${COMP_WORDS[COMP_CWORD-1]}\"",
+        "    local path=\"\" npos=0 i w spec=\"\"",
+        "    if [[ \"$prev\" == \"=\" ]]; then",
+        "        prev=\"${COMP_WORDS[COMP_CWORD-2]}\"",
+        "    fi",
+        "    for ((i=1; i < COMP_CWORD; i++)); do",
+        "        w=\"${COMP_WORDS[i]}\"",
+    ])
+    if value_options:
+        lines.extend([
+            "        case \"$path|$w\" in",
+            "            %s)" % "|".join(value_options),
+            "                if [[ \"${COMP_WORDS[i+1]}\" == \"=\" ]]; then",
+            "                    ((i++))",
+            "                fi",
+            "                ((i++))",
+            "                continue;;",
+            "        esac",
+        ])
+    lines.extend([
+        "        case \"$w\" in",
+        "            -*|=) continue;;",
+        "        esac",
+        "        case \"$path|$w\" in",
+    ])
+    for pattern, new_path in transitions:
+        lines.append("            %s) path=\"%s\"; npos=0;;" % (pattern,
+                                                               new_path))
+    lines.extend([
+        "            *) ((npos++));;",
+        "        esac",
+        "    done",
+    ])
+    if values:
+        lines.extend(_case("$path|$prev", values, 4))
+    lines.extend([
+        "    if [[ -z \"$spec\" ]]; then",
+        "        case \"$cur\" in",
+        "            -*)",
+    ])
+    lines.extend(_case("$path", flags, 16))
+    lines.extend([
+        "                ;;",
+        "            *)",
+    ])
+    lines.extend(_case("$path|$npos", positionals, 16))
+    if remaining:
+        lines.append("                if [[ -z \"$spec\" ]]; then")
+        lines.extend(_case("$path|*", remaining, 20))
+        lines.append("                fi")
+    lines.extend([
+        "                ;;",
+        "        esac",
+        "    fi",
+        "    case \"$spec\" in",
+        "        words:*)",
+        "            COMPREPLY=( $(compgen -W \"${spec#words:}\" -- \"$cur\") );;",
+        "        files)",
+        "            compopt -o filenames 2>/dev/null",
+        "            COMPREPLY=( $(compgen -f -- \"$cur\") );;",
+        "        dynamic)",
+        "            %s_python \"${COMP_WORDS[0]}\";;" % func,
+        "        *)",
+        "            COMPREPLY=();;",
+        "    esac",
+        "}",
+        "complete -F %s %s" % (func, prog_name),
+        "",
+    ])
+    return "\n".join(lines)
+
+
+class CompletionScriptAction(argparse.Action):
+    """Print the completion script of the parser and exit, like the
+    'version' action."""
+
+    def __init__(self, option_strings, dest=argparse.SUPPRESS,
+                 default=argparse.SUPPRESS, choices=SHELLS,
+                 help=argparse.SUPPRESS):
+        # pylint: disable-msg=W0622
+        super(CompletionScriptAction, self).__init__(
+            option_strings=option_strings, dest=dest, default=default,
+            choices=choices, help=help)
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        # pylint: disable-msg=W0212
+        parser._print_message(get_completion_script(parser, values),
+                              sys.stdout)
+        parser.exit()
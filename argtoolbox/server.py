@@ -0,0 +1,497 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Daemon mode : a resident server for any BasicProgram.
+
+The server imports the program once, keeps its Config loaded (it is reloaded
+when the program or one of its configuration files changes) and runs the
+invocations forwarded by argtoolbox.client in a thread pool.
+
+usage : python -m argtoolbox.server <program.py> [idle_timeout]
+"""
+
+# This file is part of argtoolbox.
+#
+# argtoolbox is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# argtoolbox is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with LinShare user cli.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright 2014 Frédéric MARTIN
+#
+# Contributors list:
+#
+#  Frédéric MARTIN frederic.martin.fma@gmail.com
+#
+
+
+import os
+import sys
+import copy
+import json
+import time
+import queue
+import runpy
+import socket
+import logging
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from . import argtoolbox
+from .argtoolbox import BasicProgram
+from .client import check_socket_directory
+from .client import get_socket_path
+from .client import send_message
+
+
+# request context (streams) of the current thread.
+_LOCAL = threading.local()
+
+
+class _RequestStream(object):
+    """sys.stdin/stdout/stderr replacement : every thread writes to (or reads
+    from) the streams of the request it is serving."""
+
+    def __init__(self, name, fallback):
+        self.name = name
+        self.fallback = fallback
+
+    def _target(self):
+        streams = getattr(_LOCAL, 'streams', None)
+        if streams is None:
+            return self.fallback
+        return streams[self.name]
+
+    def write(self, data):
+        return self._target().write(data)
+
+    def flush(self):
+        return self._target().flush()
+
+    def __getattr__(self, name):
+        return getattr(self._target(), name)
+
+    def __iter__(self):
+        return iter(self._target())
+
+
+class _OutputChannel(object):
+    """Buffered output stream sent to the client."""
+
+    def __init__(self, key, sock, lock, bufsize=8192):
+        self.key = key
+        self.sock = sock
+        self.lock = lock
+        self.bufsize = bufsize
+        self.buf = []
+        self.size = 0
+
+    def write(self, data):
+        self.buf.append(data)
+        self.size += len(data)
+        if self.size >= self.bufsize:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        if self.buf:
+            data = "".join(self.buf)
+            self.buf = []
+            self.size = 0
+            send_message(self.sock, {self.key: data}, self.lock)
+
+    # pylint: disable=no-self-use
+    def isatty(self):
+        return False
+
+
+class _InputChannel(object):
+    """Input stream fed by the data coming from the client."""
+
+    def __init__(self, stdout):
+        self.stdout = stdout
+        self.lines = queue.Queue()
+        self.eof = False
+
+    def feed(self, data):
+        self.lines.put(data)
+
+    def close(self):
+        self.lines.put(None)
+
+    def readline(self, *args):
+        # pylint: disable=unused-argument
+        if self.eof:
+            return ''
+        # prompts (like query_yes_no) must be seen before we wait.
+        self.stdout.flush()
+        line = self.lines.get()
+        if line is None:
+            self.eof = True
+            return ''
+        return line
+
+    def read(self, size=-1):
+        # pylint: disable=unused-argument
+        return "".join(iter(self.readline, ''))
+
+    def __iter__(self):
+        return iter(self.readline, '')
+
+    # pylint: disable=no-self-use
+    def isatty(self):
+        return False
+
+
+class _RequestLogFilter(logging.Filter):
+    """While the server runs, the root logger lets every record through :
+    the handlers keep the records of the server level, and the debug records
+    of the requests using the debug mode (see argtoolbox._set_debug_logging).
+    """
+
+    def __init__(self, level):
+        super(_RequestLogFilter, self).__init__()
+        self.level = level
+
+    def filter(self, record):
+        if record.levelno >= self.level:
+            return True
+        # pylint: disable=protected-access
+        context = argtoolbox._LOG_CONTEXT.get()
+        if context is None or not context['debug']:
+            return False
+        names = context['names']
+        return not names or any(
+            record.name == n or record.name.startswith(n + ".")
+            for n in names)
+
+
+class _RequestFormatter(logging.Formatter):
+    """Formatter of the stream handler : the debug format is used for the
+    requests using the debug mode only."""
+
+    def __init__(self, default, debug):
+        super(_RequestFormatter, self).__init__()
+        self.default = default
+        self.debug = debug
+
+    def format(self, record):
+        # pylint: disable=protected-access
+        context = argtoolbox._LOG_CONTEXT.get()
+        if context is not None and context['debug']:
+            return self.debug.format(record)
+        return self.default.format(record)
+
+
+class _ProcessState(object):
+    """The current directory and the environment are shared by all the
+    threads of the process. Requests using the same cwd and environment run
+    concurrently, the other ones wait until the running requests are done."""
+
+    def __init__(self):
+        self.baseline = dict(os.environ)
+        self.cond = threading.Condition()
+        self.current = None
+        self.active = 0
+
+    def delta(self, env):
+        """Compute the environment delta between the server and the client."""
+        res = dict((k, v) for k, v in env.items()
+                   if self.baseline.get(k) != v)
+        for k in self.baseline:
+            if k not in env:
+                res[k] = None
+        return res
+
+    def acquire(self, cwd, env):
+        delta = self.delta(env)
+        key = (cwd, tuple(sorted(delta.items(), key=lambda x: x[0])))
+        with self.cond:
+            while self.active and self.current != key:
+                self.cond.wait()
+            if self.current != key:
+                os.environ.clear()
+                os.environ.update(self.baseline)
+                for k, v in delta.items():
+                    if v is None:
+                        os.environ.pop(k, None)
+                    else:
+                        os.environ[k] = v
+                if os.path.isdir(cwd):
+                    os.chdir(cwd)
+                self.current = key
+            self.active += 1
+
+    def release(self):
+        with self.cond:
+            self.active -= 1
+            self.cond.notify_all()
+
+
+def load_program(program_file):
+    """Import the input program file, without running its main part, and
+    return the first BasicProgram instance found."""
+    module = runpy.run_path(program_file, run_name="argtoolbox_server")
+    for obj in module.values():
+        if isinstance(obj, BasicProgram):
+            return obj
+    raise ValueError("This script does not contain a BasicProgram : "
+                     + program_file)
+
+
+class ProgramServer(object):
+    """Resident server for a BasicProgram, listening on a per-user unix
+    socket. It shuts down itself after idle_timeout seconds without any
+    request."""
+
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, program, socket_path=None, idle_timeout=600,
+                 workers=4, program_file=None):
+        self.log = logging.getLogger('argtoolbox.server')
+        self.socket_path = socket_path or get_socket_path(program.prog_name)
+        self.idle_timeout = idle_timeout
+        self.workers = workers
+        if program_file is None:
+            module = sys.modules.get(type(program).__module__)
+            program_file = getattr(module, '__file__', None)
+        self.program_file = program_file
+        # untouched program, used as a model for the template.
+        self._pristine = copy.deepcopy(program)
+        self._template = None
+        self._fingerprint = None
+        self._lock = threading.Lock()
+        self._state = _ProcessState()
+        self._active = 0
+        self._last_activity = time.time()
+        self._stopped = threading.Event()
+
+    @staticmethod
+    def _stat(path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _get_fingerprint(self, program):
+        """The template must be rebuilt when the program file or one of the
+        configuration files has changed."""
+        config = program.config
+        files = []
+        if config.config_file is None:
+            files.extend(config.get_default_file_list())
+        elif isinstance(config.config_file, str):
+            files.append(config.config_file)
+        if self.program_file:
+            files.append(self.program_file)
+        return tuple((f, self._stat(f)) for f in files)
+
+    def get_template(self):
+        """Return the current program, with its configuration loaded."""
+        with self._lock:
+            fingerprint = self._get_fingerprint(self._pristine)
+            if self._template is None or fingerprint != self._fingerprint:
+                if self._fingerprint is not None:
+                    old = dict(self._fingerprint)
+                    if self.program_file and (
+                            old.get(self.program_file)
+                            != self._stat(self.program_file)):
+                        self.log.debug("program changed, reloading it.")
+                        self._pristine = copy.deepcopy(
+                            load_program(self.program_file))
+                    self.log.debug("configuration changed, reloading it.")
+                template = copy.deepcopy(self._pristine)
+                template.setup_config()
+                self._template = template
+                self._fingerprint = fingerprint
+            return self._template
+
+    def execute(self, argv):
+        """Run one invocation and return its exit code. Each request works
+        on its own copy of the loaded program."""
+        program = copy.deepcopy(self.get_template())
+        # pylint: disable=protected-access
+        token = argtoolbox._LOG_CONTEXT.set({"debug": False, "names": ()})
+        try:
+            try:
+                program.setup_parser(argv)
+            except SystemExit as ex:
+                return program.get_exit_code(ex)
+            return program.run_status(argv)
+        finally:
+            argtoolbox._LOG_CONTEXT.reset(token)
+
+    @staticmethod
+    def _read_messages(reader, stdin):
+        for line in reader:
+            message = json.loads(line)
+            if "in" in message:
+                stdin.feed(message["in"])
+            elif message.get("eof"):
+                break
+        stdin.close()
+
+    def handle(self, conn):
+        """Serve one client connection."""
+        lock = threading.Lock()
+        stdout = _OutputChannel("out", conn, lock)
+        stderr = _OutputChannel("err", conn, lock)
+        stdin = _InputChannel(stdout)
+        code = 1
+        try:
+            reader = conn.makefile('r', encoding='utf-8')
+            header = json.loads(reader.readline())
+            feeder = threading.Thread(target=self._read_messages,
+                                      args=(reader, stdin))
+            feeder.daemon = True
+            feeder.start()
+            _LOCAL.streams = {"stdin": stdin, "stdout": stdout,
+                              "stderr": stderr}
+            self._state.acquire(header["cwd"], header["env"])
+            try:
+                code = self.execute(header["argv"])
+            finally:
+                self._state.release()
+        # pylint: disable=broad-except
+        except Exception:
+            stderr.write(traceback.format_exc())
+        finally:
+            _LOCAL.streams = None
+            try:
+                stdout.flush()
+                stderr.flush()
+                send_message(conn, {"exit": code}, lock)
+            except OSError:
+                pass
+            conn.close()
+            with self._lock:
+                self._active -= 1
+                self._last_activity = time.time()
+
+    def _bind(self):
+        directory = os.path.dirname(self.socket_path)
+        if not os.path.lexists(directory):
+            os.makedirs(directory, 0o700)
+        check_socket_directory(directory)
+        if os.path.exists(self.socket_path):
+            # stale socket from a previous server ?
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.socket_path)
+                probe.close()
+                raise EnvironmentError(
+                    "A server is already listening on " + self.socket_path)
+            except socket.error:
+                os.remove(self.socket_path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+        sock.listen(64)
+        sock.settimeout(0.5)
+        return sock
+
+    def _install_streams(self):
+        # pylint: disable=protected-access
+        saved = (sys.stdin, sys.stdout, sys.stderr)
+        sys.stdin = _RequestStream("stdin", sys.stdin)
+        sys.stdout = _RequestStream("stdout", sys.stdout)
+        sys.stderr = _RequestStream("stderr", sys.stderr)
+        # every log record goes to the stdout of its request, it must be
+        # handled by the thread serving the request.
+        argtoolbox._disable_queue_logging()
+        handler_stream = argtoolbox.streamHandler.stream
+        argtoolbox.streamHandler.setStream(sys.stdout)
+        return saved, handler_stream
+
+    @staticmethod
+    def _install_logging():
+        """The debug mode of a request must not change the loggers shared
+        by the other requests : the level and the format are chosen by the
+        handlers, according to the request of the record."""
+        root = logging.getLogger()
+        handler = argtoolbox.streamHandler
+        saved = (root.level, handler.formatter, list(root.handlers))
+        log_filter = _RequestLogFilter(root.getEffectiveLevel())
+        for target in saved[2]:
+            target.addFilter(log_filter)
+        handler.setFormatter(_RequestFormatter(
+            handler.formatter or logging.Formatter(),
+            argtoolbox.DEBUG_LOGGING_FORMAT))
+        root.setLevel(logging.DEBUG)
+        return saved, log_filter
+
+    @staticmethod
+    def _restore_logging(state):
+        (level, formatter, handlers), log_filter = state
+        logging.getLogger().setLevel(level)
+        argtoolbox.streamHandler.setFormatter(formatter)
+        for target in handlers:
+            target.removeFilter(log_filter)
+
+    def _is_idle(self):
+        with self._lock:
+            return (self._active == 0 and time.time() - self._last_activity
+                    > self.idle_timeout)
+
+    def stop(self):
+        """Ask the server to stop."""
+        self._stopped.set()
+
+    def serve_forever(self):
+        """Accept connections until the idle timeout or stop()."""
+        sock = self._bind()
+        saved, handler_stream = self._install_streams()
+        log_state = self._install_logging()
+        self.log.debug("server listening on %s", self.socket_path)
+        try:
+            self.get_template()
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                while not self._stopped.is_set() and not self._is_idle():
+                    try:
+                        conn, _ = sock.accept()
+                    except socket.timeout:
+                        continue
+                    conn.settimeout(None)
+                    with self._lock:
+                        self._active += 1
+                        self._last_activity = time.time()
+                    executor.submit(self.handle, conn)
+        finally:
+            sock.close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+            sys.stdin, sys.stdout, sys.stderr = saved
+            argtoolbox.streamHandler.setStream(handler_stream)
+            argtoolbox._disable_queue_logging(False)
+            self._restore_logging(log_state)
+            self.log.debug("server stopped.")
+        return True
+
+
+def main(argv=None):
+    """Server entry point."""
+    if argv is None:
+        argv = sys.argv[1:]
+    if not argv:
+        sys.stderr.write(__doc__.strip().split("\n")[-1] + "\n")
+        return 2
+    program_file = os.path.abspath(argv[0])
+    program = load_program(program_file)
+    idle_timeout = 600
+    if len(argv) > 1:
+        idle_timeout = int(argv[1])
+    server = ProgramServer(program, idle_timeout=idle_timeout,
+                           program_file=program_file)
+    server.serve_forever()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
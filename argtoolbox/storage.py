@@ -0,0 +1,171 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""SQLite storage for the sections holding a lot of data (ListSection and
+ElementWithRelativeSubSection declared with storage='sqlite').
+
+The parsed data is ingested once into a SQLite file of the user cache, it is
+ingested again only when one of the configuration files changes. Lookups and
+iterations go through the database, the data is not kept in memory.
+"""
+
+# This file is part of argtoolbox.
+#
+# argtoolbox is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# argtoolbox is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with LinShare user cli.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright 2014 Frédéric MARTIN
+#
+# Contributors list:
+#
+#  Frédéric MARTIN frederic.martin.fma@gmail.com
+#
+
+
+import os
+import pickle
+import hashlib
+import logging
+import sqlite3
+import threading
+from collections.abc import Mapping
+
+from .argtoolbox import get_user_cache_dir
+from .argtoolbox import get_parser_sources
+
+
+class SQLiteStore(Mapping):
+    """Read only mapping stored into a SQLite file. The keys are indexed,
+    the values are pickled. The iteration order is the ingestion order."""
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _get_connection(self):
+        with self._lock:
+            if self._conn is None:
+                self._conn = sqlite3.connect(self.path,
+                                             check_same_thread=False)
+            return self._conn
+
+    def close(self):
+        """Close the database connection, it is opened again if needed."""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def __getstate__(self):
+        # the connection can not be copied or pickled.
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+    def get_fingerprint(self):
+        """Return the fingerprint of the ingested data, None if there is no
+        data yet."""
+        if not os.path.exists(self.path):
+            return None
+        try:
+            row = self._get_connection().execute(
+                "SELECT value FROM meta WHERE key = 'fingerprint'").fetchone()
+        except sqlite3.DatabaseError:
+            return None
+        return row[0] if row else None
+
+    def ingest(self, items, fingerprint):
+        """Replace the content of the store by items, an iterable of
+        (key, value). The data is written into a temporary file which
+        replaces the store at the end, readers are never disturbed."""
+        tmp = "%s.%d.tmp" % (self.path, os.getpid())
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        conn = sqlite3.connect(tmp)
+        try:
+            conn.execute("PRAGMA journal_mode = OFF")
+            conn.execute("PRAGMA synchronous = OFF")
+            conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value)")
+            conn.execute("CREATE TABLE entries (key TEXT, value BLOB)")
+            conn.executemany(
+                "INSERT INTO entries (key, value) VALUES (?, ?)",
+                ((key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+                 for key, value in items))
+            # the index is built once, after the insertions.
+            conn.execute("CREATE UNIQUE INDEX entries_key ON entries (key)")
+            conn.execute("INSERT INTO meta VALUES ('fingerprint', ?)",
+                         (fingerprint,))
+            conn.commit()
+        except BaseException:
+            conn.close()
+            os.remove(tmp)
+            raise
+        conn.close()
+        self.close()
+        os.replace(tmp, self.path)
+
+    def __getitem__(self, key):
+        row = self._get_connection().execute(
+            "SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return pickle.loads(row[0])
+
+    def __contains__(self, key):
+        return self._get_connection().execute(
+            "SELECT 1 FROM entries WHERE key = ?", (key,)).fetchone() \
+            is not None
+
+    def __iter__(self):
+        for row in self._get_connection().execute(
+                "SELECT key FROM entries ORDER BY rowid"):
+            yield row[0]
+
+    def __len__(self):
+        return self._get_connection().execute(
+            "SELECT count(*) FROM entries").fetchone()[0]
+
+    def items(self):
+        for key, value in self._get_connection().execute(
+                "SELECT key, value FROM entries ORDER BY rowid"):
+            yield key, pickle.loads(value)
+
+    def values(self):
+        for _, value in self.items():
+            yield value
+
+
+def open_store(name, file_parser, schema=None):
+    """Return the store of the section 'name' and the fingerprint its data
+    must have, or (None, None) if the data does not come from files (a
+    stream for example). The store must be (re)ingested when its
+    fingerprint is not the expected one. schema describes the structure of
+    the stored values, the store is ingested again if it changes."""
+    sources = get_parser_sources(file_parser)
+    if not sources:
+        return None, None
+    sources = [os.path.abspath(f) for f in sources]
+    state = []
+    for source in sources:
+        try:
+            stat = os.stat(source)
+            state.append((source, stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            state.append((source, None, None))
+    key = hashlib.sha1(repr((sources, name)).encode('utf-8')).hexdigest()
+    fingerprint = hashlib.sha1(
+        repr((state, name, schema)).encode('utf-8')).hexdigest()
+    path = os.path.join(get_user_cache_dir('stores'), key + ".sqlite")
+    logging.getLogger('argtoolbox').debug("store of %s : %s", name, path)
+    return SQLiteStore(path), fingerprint
@@ -134,7 +134,10 @@ setup(
         'argtoolbox': ['templates/*.tml'],
     },
     entry_points={
-        'console_scripts': ['argtoolboxtool=argtoolbox.commands:PROG'],
+        'console_scripts': [
+            'argtoolboxtool=argtoolbox.commands:PROG',
+            'argtoolbox-client=argtoolbox.client:main',
+        ],
     },
 
     # List run-time dependencies here.  These will be installed by pip when your
@@ -7,6 +7,26 @@
 import unittest
 import logging
 from .tests import TestDefaultSection
+from .tests import TestServer
+from .tests import TestServerLogging
+from .tests import TestBatch
+from .tests import TestParserCache
+from .tests import TestStaticConfigExtractor
+from .tests import TestImport
+from .tests import TestLazyLoad
+from .tests import TestResolvedInterpolation
+from .tests import TestQueueLogging
+from .tests import TestStorage
+from .tests import TestExecutableIndex
+from .tests import TestCompletionCache
+from .tests import TestCompleterDeadline
+from .tests import TestCompletionScript
+from .tests import TestFastPaths
+from .tests import TestOverlay
+from .tests import TestTargetsCommand
+from .tests import TestResourcePool
+from .tests import TestCachedCommand
+from .tests import TestFrozenSchema
 
 LOG = logging.getLogger('tests')
 LOG.info("loading tests")
@@ -17,6 +37,26 @@ def get_all_tests():
     loader = unittest.TestLoader()
     suites = unittest.TestSuite()
     suites.addTest(loader.loadTestsFromTestCase(TestDefaultSection))
+    suites.addTest(loader.loadTestsFromTestCase(TestServer))
+    suites.addTest(loader.loadTestsFromTestCase(TestServerLogging))
+    suites.addTest(loader.loadTestsFromTestCase(TestBatch))
+    suites.addTest(loader.loadTestsFromTestCase(TestParserCache))
+    suites.addTest(loader.loadTestsFromTestCase(TestStaticConfigExtractor))
+    suites.addTest(loader.loadTestsFromTestCase(TestImport))
+    suites.addTest(loader.loadTestsFromTestCase(TestLazyLoad))
+    suites.addTest(loader.loadTestsFromTestCase(TestResolvedInterpolation))
+    suites.addTest(loader.loadTestsFromTestCase(TestQueueLogging))
+    suites.addTest(loader.loadTestsFromTestCase(TestStorage))
+    suites.addTest(loader.loadTestsFromTestCase(TestExecutableIndex))
+    suites.addTest(loader.loadTestsFromTestCase(TestCompletionCache))
+    suites.addTest(loader.loadTestsFromTestCase(TestCompleterDeadline))
+    suites.addTest(loader.loadTestsFromTestCase(TestCompletionScript))
+    suites.addTest(loader.loadTestsFromTestCase(TestFastPaths))
+    suites.addTest(loader.loadTestsFromTestCase(TestOverlay))
+    suites.addTest(loader.loadTestsFromTestCase(TestTargetsCommand))
+    suites.addTest(loader.loadTestsFromTestCase(TestResourcePool))
+    suites.addTest(loader.loadTestsFromTestCase(TestCachedCommand))
+    suites.addTest(loader.loadTestsFromTestCase(TestFrozenSchema))
     return suites
 
 if __name__ == '__main__':
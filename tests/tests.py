@@ -29,10 +29,17 @@
 
 import unittest
 import io
+import os
 import binascii
 import sys
+import time
+import tempfile
+import threading
 import logging
+import contextlib
 from argtoolbox import Config, Element, Base64ElementHook
+from argtoolbox import BasicProgram, DefaultCommand, SimpleSection
+from argtoolbox import TargetsCommand, cached_command
 
 
 # pylint: disable-msg=R0904
@@ -156,6 +163,46 @@ elt_list_value=test aa aarrr kkkk mmmmm
         self.assertEqual(len(list_value),
                          len(self.c.default.elt_list_value.value))
 
+    def test_type_typed_list(self):
+        """Trying to get an array of numbers from a option"""
+        import argparse
+        import array
+        from argtoolbox import TypedList
+        elt = self.s.add_element(Element(
+            'elt_list_value', dest='ports', e_type=TypedList('i')))
+        self.s.add_element(Element('elt_type_float', e_type=TypedList('d')))
+        self.s.add_element(Element('elt_type_int', e_type=TypedList('i')))
+        self.assertRaises(ValueError, self.c.load)
+        del self.s.elements['elt_list_value']
+        self.c.load()
+        self.assertEqual(array.array('d', [1.00009]),
+                         self.c.default.elt_type_float.value)
+        self.assertEqual([5], self.c.default.elt_type_int.get_memoryview()
+                         .tolist())
+        parser = argparse.ArgumentParser()
+        parser.add_argument('--ports', **elt.get_arg_parse_arguments())
+        args = parser.parse_args(['--ports', '22', '80'])
+        self.assertEqual(array.array('i', [22, 80]), args.ports)
+
+    def test_typed_list_default(self):
+        """Testing the default value of a TypedList element"""
+        import array
+        from argtoolbox import TypedList
+        elt = self.s.add_element(Element(
+            'ports', e_type=TypedList('H', separator=','), default=[22, 80]))
+        self.assertEqual(array.array('H', [22, 80]), elt.default)
+        other = self.s.add_element(Element(
+            'weights', e_type=TypedList('d'), default="0.5 2",
+            e_type_exclude=True))
+        self.assertEqual(array.array('d', [0.5, 2.0]), other.default)
+        self.assertNotIn('nargs', other.get_arg_parse_arguments())
+        self.c.load()
+        self.assertEqual(array.array('H', [22, 80]), elt.value)
+        out = io.StringIO()
+        self.s.write_config_file(out, False)
+        self.assertIn(";ports=22,80\n", out.getvalue())
+        self.assertIn(";weights=0.5 2.0\n", out.getvalue())
+
     def test_hook_base64(self):
         # pylint: disable-msg=C0301
         """Testing if the Base64ElementHook will warn you if it is not base64 option"""
@@ -179,6 +226,158 @@ elt_list_value=test aa aarrr kkkk mmmmm
         self.c.load()
         self.assertEqual("cVjcmVé", self.c.default.elt_type_not_base64.value)
 
+    def test_lazy_hooks(self):
+        """Testing hooks are applied once, on the first access"""
+        calls = []
+
+        class CountingHook(Base64ElementHook):
+            def __call__(self, elt):
+                calls.append(elt.name)
+                super(CountingHook, self).__call__(elt)
+
+        elt = self.s.add_element(Element(
+            'elt_type_base64', hooks=[CountingHook()], lazy_hooks=True))
+        self.c.load()
+        self.c.load()
+        self.assertEqual([], calls)
+        self.assertEqual("c2VjcmV0", elt.raw_value)
+        self.assertEqual(b"secret", elt.value)
+        self.assertEqual(b"secret", elt.value)
+        self.assertEqual(["elt_type_base64"], calls)
+
+    def test_lazy_hooks_parser(self):
+        """Testing the parser applies the lazy hooks on first access"""
+        import argparse
+        from argtoolbox import DefaultProgram
+        calls = []
+
+        class CountingHook(Base64ElementHook):
+            def __call__(self, elt):
+                calls.append(elt.name)
+                super(CountingHook, self).__call__(elt)
+
+        elt = self.s.add_element(Element(
+            'elt_type_base64', hooks=[CountingHook()], lazy_hooks=True))
+        self.c.load()
+        parser = argparse.ArgumentParser()
+        parser.add_argument('--secret', **elt.get_arg_parse_arguments())
+        parser.add_argument('--other')
+        args = DefaultProgram(parser, self.c,
+                              argv=['--other', 'x']).parse_args()
+        self.assertEqual([], calls)
+        self.assertEqual("x", args.other)
+        self.assertEqual(b"secret", args.elt_type_base64)
+        self.assertEqual(b"secret", args.elt_type_base64)
+        self.assertEqual(["elt_type_base64"], calls)
+        args = DefaultProgram(parser, self.c,
+                              argv=['--secret', 'abc']).parse_args()
+        self.assertEqual("abc", args.elt_type_base64)
+
+    def test_lazy_hooks_threads(self):
+        """Testing readers wait for the lazy hooks applied by a thread"""
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        class BlockingHook(Base64ElementHook):
+            def __call__(self, elt):
+                calls.append(elt.name)
+                super(BlockingHook, self).__call__(elt)
+                started.set()
+                release.wait(5)
+
+        elt = self.s.add_element(Element(
+            'elt_type_base64', hooks=[BlockingHook()], lazy_hooks=True))
+        self.c.load()
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(elt.value))
+                   for _ in range(4)]
+        threads[0].start()
+        self.assertTrue(started.wait(5))
+        for thread in threads[1:]:
+            thread.start()
+        threads[1].join(0.05)
+        self.assertEqual([], results)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([b"secret"] * 4, results)
+        self.assertEqual(["elt_type_base64"], calls)
+
+    def test_lazy_hooks_error(self):
+        """Testing lazy hook errors are raised by the first access"""
+        elt = self.s.add_element(Element(
+            'elt_type_not_base64', hooks=[Base64ElementHook()],
+            lazy_hooks=True))
+        self.c.load()
+        self.assertRaises(TypeError, getattr, elt, 'value')
+        self.assertRaises(TypeError, elt.apply_hooks)
+        self.assertEqual("cVjcmVé", elt.raw_value)
+
+    def test_io_bound_hooks(self):
+        """Testing I/O bound and coroutine hooks are applied concurrently"""
+        import asyncio
+        # every I/O bound hook waits for the other ones.
+        barrier = threading.Barrier(4)
+        calls = []
+
+        class SlowHook(Base64ElementHook):
+            io_bound = True
+
+            def __call__(self, elt):
+                calls.append(elt.name)
+                barrier.wait(5)
+                super(SlowHook, self).__call__(elt)
+
+        class AsyncHook(Base64ElementHook):
+            async def __call__(self, elt):
+                await asyncio.sleep(0)
+                elt.value = elt.value.upper()
+
+        for name in ('elt_type_str', 'elt_type_str2', 'elt_type_not_base64'):
+            self.s.add_element(Element(name, hooks=[SlowHook(True)]))
+        elt = self.s.add_element(Element(
+            'elt_type_base64', dest='b64', hooks=[SlowHook(), AsyncHook()]))
+        self.c.load()
+        self.assertEqual(4, len(calls))
+        self.assertFalse(elt.hooks_pending)
+        self.assertEqual(b"SECRET", elt.value)
+        self.assertEqual("bbb", self.c.default.elt_type_str.value)
+        self.assertEqual("cVjcmVé", self.c.default.elt_type_not_base64.value)
+
+    def test_coroutine_hooks_in_loop(self):
+        """Testing lazy coroutine hooks applied by a running event loop"""
+        import asyncio
+
+        class AsyncHook(Base64ElementHook):
+            async def __call__(self, elt):
+                await asyncio.sleep(0)
+                elt.value = elt.value.upper()
+
+        elt = self.s.add_element(Element(
+            'elt_type_base64', hooks=[Base64ElementHook(), AsyncHook()],
+            lazy_hooks=True))
+        self.c.load()
+
+        async def read():
+            """Read the value from a coroutine"""
+            return elt.value
+        self.assertEqual(b"SECRET", asyncio.run(read()))
+
+    def test_io_bound_hooks_error(self):
+        """Testing the first failing element is reported"""
+        class FailingHook(Base64ElementHook):
+            io_bound = True
+
+            def __call__(self, elt):
+                raise ValueError(elt.name)
+
+        for name in ('elt_type_str', 'elt_type_int', 'elt_type_str2'):
+            self.s.add_element(Element(name, hooks=[FailingHook()]))
+        with self.assertRaises(ValueError) as ctx:
+            self.c.load()
+        self.assertEqual("elt_type_str", str(ctx.exception))
+
     def test_hidden(self):
         """Testing a hidden option"""
         self.s.add_element(Element(
@@ -205,6 +404,89 @@ elt_list_value=test aa aarrr kkkk mmmmm
             'elt_no_value', e_type=int))
         self.assertRaises(ValueError, self.c.load)
 
+    def test_write_default_config_file(self):
+        """Testing the sample file is only written when it changes"""
+        self.s.add_element(Element('elt_type_int', e_type=int, default=5))
+        fde, output = tempfile.mkstemp()
+        os.close(fde)
+        try:
+            self.assertTrue(self.c.write_default_config_file(
+                output, skip_unchanged=True))
+            with open(output) as fde:
+                self.assertIn(";elt_type_int=5\n", fde.read())
+            self.assertFalse(self.c.write_default_config_file(
+                output, skip_unchanged=True))
+            self.s.elt_type_int.default = 6
+            self.assertTrue(self.c.write_default_config_file(
+                output, skip_unchanged=True))
+            with open(output) as fde:
+                self.assertIn(";elt_type_int=6\n", fde.read())
+            self.s.add_element(Element('elt_utf8', desc="adresse de l'hôte"))
+            self.assertTrue(self.c.write_default_config_file(
+                output, skip_unchanged=True))
+            self.assertFalse(self.c.write_default_config_file(
+                output, skip_unchanged=True))
+            with open(output, encoding='utf-8') as fde:
+                self.assertIn("l'hôte", fde.read())
+            self.c.use_config_file = False
+            self.assertIsNone(self.c.write_default_config_file(output))
+        finally:
+            os.remove(output)
+
+    def test_representation(self):
+        """Testing the streamed representation of the configuration"""
+        from argtoolbox import SubSection, ElementWithSubSections
+        section = SubSection()
+        section.add_element(Element('elt_type_int'))
+        self.s.add_element(ElementWithSubSections('elt_type_str', section))
+        self.c.add_section(SimpleSection('other')).add_element(
+            Element('elt_type_int', e_type=int))
+        self.c.load()
+        stream = io.StringIO()
+        self.c.write_representation(stream, bufsize=16)
+        self.assertEqual(str(self.c), stream.getvalue())
+        self.assertIn("\t\tSubSection : BBB\n", stream.getvalue())
+        data = "".join(self.c.iter_representation(depth=1))
+        self.assertIn("\t - elt_type_str : bbb\n", data)
+        self.assertNotIn("SubSection", data)
+        data = "".join(self.c.iter_representation(sections=['other']))
+        self.assertEqual(
+            "Configuration of linshare-cli : \n\tSection OTHER\n"
+            "\t - elt_type_int : None\n", data)
+
+    def test_as_dataclasses(self):
+        """Testing the dataclass view of the configuration"""
+        import dataclasses
+        self.s.add_element(Element('elt_type_int', e_type=int))
+        self.s.add_element(Element('elt_missing', default="aa"))
+        self.c.add_section(SimpleSection('other')).add_element(
+            Element('elt_type_float', e_type=float))
+        self.c.load()
+        view = self.c.as_dataclasses()
+        self.assertEqual(5, view.default.elt_type_int)
+        self.assertEqual("aa", view.default.elt_missing)
+        self.assertIsNone(view.other.elt_type_float)
+        self.assertRaises(dataclasses.FrozenInstanceError, setattr,
+                          view.default, 'elt_type_int', 6)
+        self.assertFalse(hasattr(view.default, '__dict__'))
+        self.assertIs(type(view), type(self.c.as_dataclasses()))
+        source = self.c.get_dataclasses_source()
+        self.assertIn("    elt_type_int: typing.Optional[int]\n", source)
+        self.assertIn("    elt_missing: str\n", source)
+        self.assertIn("    default: DefaultSection\n", source)
+        namespace = {}
+        exec(compile(source, "<dataclasses>", "exec"), namespace)
+        self.assertIn("LinshareCliConfig", namespace)
+
+    def test_as_dataclasses_collision(self):
+        """Testing names giving the same attribute name are reported"""
+        self.s.add_element(Element('elt-a'))
+        self.s.add_element(Element('elt_a'))
+        self.c.load()
+        with self.assertRaises(ValueError) as ctx:
+            self.c.as_dataclasses()
+        self.assertIn("'elt-a' and 'elt_a'", str(ctx.exception))
+
     def test_without_default_without_value_float(self):
         """Testing a missing float option with no default value"""
         self.s.add_element(Element(
@@ -212,6 +494,1587 @@ elt_list_value=test aa aarrr kkkk mmmmm
             e_type=float))
         self.assertRaises(ValueError, self.c.load)
 
+
+class TestOverlay(unittest.TestCase):
+    """Testing the copy-on-write views of a Config."""
+
+    def setUp(self):
+        self.config = Config("test", config_file=io.StringIO(
+            "[DEFAULT]\nverbose = 0\n"
+            "[server]\nhost = a.example\nport = 80\n"
+            "[backup]\nhost = b.example\nport = 81\n"))
+        self.config.get_default_section().add_element(
+            Element('verbose', e_type=int))
+        for name in ("server", "backup"):
+            section = self.config.add_section(SimpleSection(name))
+            section.add_element(Element('host'))
+            section.add_element(Element('port', e_type=int))
+        self.config.load()
+
+    def test_overrides(self):
+        """Testing reads fall through and writes stay in the view"""
+        view = self.config.overlay(server__port=8080, verbose=2)
+        self.assertEqual(8080, view.server.port.value)
+        self.assertEqual("a.example", view.server.host.value)
+        self.assertEqual(2, view.default.verbose.value)
+        view.server.host.value = "c.example"
+        self.assertEqual("c.example", view.get_section("server").host.value)
+        self.assertEqual("a.example", self.config.server.host.value)
+        self.assertEqual(80, self.config.server.port.value)
+        self.assertEqual(0, self.config.default.verbose.value)
+        self.assertEqual("test", view.prog_name)
+        self.assertEqual("port", view.server.port.name)
+        child = view.overlay(server__port=9090)
+        self.assertEqual((9090, "c.example"),
+                         (child.server.port.value, child.server.host.value))
+        self.assertEqual(8080, view.server.port.value)
+        self.assertRaises(ValueError, self.config.overlay, server__user="x")
+
+    def test_section(self):
+        """Testing a section can be replaced in a view"""
+        view = self.config.overlay(server=self.config.backup,
+                                   server__port=443)
+        self.assertEqual(("b.example", 443),
+                         (view.server.host.value, view.server.port.value))
+        self.assertEqual(81, view.backup.port.value)
+
+    def test_methods(self):
+        """Testing the section and element methods read the overrides"""
+        view = self.config.overlay(server__port=8080)
+        data = "".join(view.iter_representation())
+        self.assertIn(" - port : 8080\n", data)
+        self.assertIn(" - port : 81\n", data)
+        self.assertIn(" - port : 8080\n", str(view.server))
+        self.assertEqual([('host', 'a.example'), ('port', 8080)],
+                         view.server.get_values())
+        self.assertEqual(8080, view.as_dataclasses().server.port)
+        self.assertEqual(80, self.config.as_dataclasses().server.port)
+        self.assertEqual(
+            8080, view.server.port.get_arg_parse_arguments()['default'])
+        self.assertNotEqual(self.config.get_fingerprint(),
+                            view.get_fingerprint())
+        self.assertIn(" - port : 80\n", str(self.config))
+
+    def test_pool(self):
+        """Testing the pools of the overridden sections"""
+        self.config.register_pool(SimpleSection,
+                                  lambda s: (s.host.value, s.port.value))
+        view = self.config.overlay(server__port=8080)
+        with view.pool("server").connection() as client:
+            self.assertEqual(("a.example", 8080), client)
+        with self.config.pool("server").connection() as client:
+            self.assertEqual(("a.example", 80), client)
+        self.assertIs(self.config.pool("backup"), view.pool("backup"))
+        view.close_pools()
+        self.assertFalse(self.config.pool("server").closed)
+        self.config.close_pools()
+
+    def test_threads(self):
+        """Testing views are independent across threads"""
+        errors = []
+
+        def worker(num):
+            for i in range(200):
+                view = self.config.overlay(server__port=num * 1000 + i)
+                view.server.host.value = "h%d" % num
+                if (view.server.port.value, view.server.host.value) != \
+                        (num * 1000 + i, "h%d" % num):
+                    errors.append(num)
+        threads = [threading.Thread(target=worker, args=(i,))
+                   for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([], errors)
+        self.assertEqual("a.example", self.config.server.host.value)
+
+
+class PingCommand(TargetsCommand):
+    """Fan-out command used by TestTargetsCommand."""
+
+    def __init__(self, *args, **kwargs):
+        super(PingCommand, self).__init__(*args, **kwargs)
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+        self.calls = []
+
+    def run_target(self, args, name, section):
+        with self.lock:
+            self.calls.append(name)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            mode = section.mode.value
+            if mode == "hang":
+                time.sleep(2)
+            elif mode == "flaky" and self.calls.count(name) == 1:
+                raise IOError("connection reset")
+            elif mode == "down":
+                raise IOError("connection refused")
+            time.sleep(0.02)
+            return section.host.value
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+class TestTargetsCommand(unittest.TestCase):
+    """Testing the fan-out of a command across the targets."""
+
+    def setUp(self):
+        from argtoolbox import ElementWithRelativeSubSection, SubSection
+        data = ["[DEFAULT]", "servers = s1 s2 s3 s4 s5 s6"]
+        modes = {"s2": "flaky", "s3": "down", "s4": "hang"}
+        for i in range(1, 7):
+            name = "s%d" % i
+            data.extend(["[%s]" % name, "host = %s.example" % name,
+                         "mode = %s" % modes.get(name, "ok")])
+        self.config = Config("test", config_file=io.StringIO(
+            "\n".join(data) + "\n"))
+        template = SubSection()
+        template.add_element(Element('host'))
+        template.add_element(Element('mode'))
+        self.config.get_default_section().add_element(
+            ElementWithRelativeSubSection('servers', template))
+        self.config.load()
+
+    def test_fan_out(self):
+        """Testing timeouts, retries and the final status"""
+        command = PingCommand(self.config, "servers", workers=3, timeout=0.5,
+                              retries=1, backoff=0.01)
+        start = time.time()
+        results = dict((r.name, r) for r in command.iter_results(None))
+        self.assertLess(time.time() - start, 1.8)
+        self.assertEqual(["s1", "s2", "s3", "s4", "s5", "s6"],
+                         sorted(results))
+        self.assertEqual("s1.example", results["s1"].value)
+        self.assertEqual((True, 2), (results["s2"].ok, results["s2"].attempts))
+        self.assertEqual((False, 2), (results["s3"].ok, results["s3"].attempts))
+        self.assertIsInstance(results["s4"].error, TimeoutError)
+        self.assertTrue(results["s6"].ok)
+        self.assertLessEqual(command.max_active, 3)
+        command.retries = 0
+        import argparse
+        self.assertFalse(command(argparse.Namespace()))
+
+    def test_workers(self):
+        """Testing an invalid number of workers"""
+        for workers in (0, -1):
+            self.assertRaises(ValueError, PingCommand, self.config, "servers",
+                              workers=workers)
+
+
+class TestResourcePool(unittest.TestCase):
+    """Testing the resource pools of a Config against a local server."""
+
+    def setUp(self):
+        import socket
+        import socketserver
+        self.connections = []
+
+        class Handler(socketserver.BaseRequestHandler):
+            """Echo server counting its connections."""
+            def handle(handler):
+                self.connections.append(handler.client_address)
+                while True:
+                    data = handler.request.recv(64)
+                    if not data:
+                        break
+                    handler.request.sendall(data)
+        socketserver.ThreadingTCPServer.daemon_threads = True
+        self.server = socketserver.ThreadingTCPServer(("127.0.0.1", 0),
+                                                      Handler)
+        threading.Thread(target=self.server.serve_forever,
+                         daemon=True).start()
+        self.config = Config("test", config_file=io.StringIO(
+            "[ldap]\nhost = 127.0.0.1\nport = %d\n"
+            % self.server.server_address[1]))
+        section = self.config.add_section(SimpleSection("ldap"))
+        section.add_element(Element('host'))
+        section.add_element(Element('port', e_type=int))
+        self.config.load()
+        self.config.register_pool(
+            SimpleSection,
+            lambda sec: socket.create_connection((sec.host.value,
+                                                  sec.port.value)),
+            size=2, idle_timeout=0.2, check=lambda c: c.fileno() != -1)
+
+    def tearDown(self):
+        self.config.close_pools()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def ping(self, client):
+        """One operation with a pooled client."""
+        client.sendall(b"ping")
+        self.assertEqual(b"ping", client.recv(4))
+
+    def test_reuse(self):
+        """Testing clients are reused, bounded and evicted"""
+        pool = self.config.pool("ldap")
+        for _ in range(3):
+            with pool.connection() as client:
+                self.ping(client)
+        self.assertIs(pool, self.config.pool("ldap"))
+        self.assertEqual(1, len(self.connections))
+        first = pool.acquire()
+        second = pool.acquire()
+        self.assertRaises(TimeoutError, pool.acquire, 0.05)
+        self.ping(second)
+        pool.release(first)
+        pool.release(second)
+        time.sleep(0.3)
+        client = pool.acquire()
+        self.assertEqual(-1, first.fileno())
+        self.assertIsNot(first, client)
+        pool.release(client)
+
+    def test_teardown(self):
+        """Testing the pool is replaced when the section changes"""
+        pool = self.config.pool("ldap")
+        with pool.connection() as client:
+            self.ping(client)
+        self.config.ldap.host.value = "localhost"
+        self.config.refresh_pools()
+        new_pool = self.config.pool("ldap")
+        self.assertIsNot(pool, new_pool)
+        self.assertTrue(pool.closed)
+        self.assertEqual(-1, client.fileno())
+        self.assertRaises(ValueError, self.config.pool, "missing")
+
+    def test_fingerprint_once(self):
+        """Testing the values are only compared once per load"""
+        section = self.config.get_section("ldap")
+        calls = []
+        get_values = section.get_values
+
+        def counting_get_values():
+            calls.append(1)
+            return get_values()
+        section.get_values = counting_get_values
+        pool = self.config.pool("ldap")
+        for _ in range(5):
+            self.assertIs(pool, self.config.pool("ldap"))
+        self.assertEqual(1, len(calls))
+        self.config.refresh_pools()
+        self.assertIs(pool, self.config.pool("ldap"))
+        self.assertEqual(2, len(calls))
+        self.assertFalse(pool.closed)
+
+
+class ListCommand(DefaultCommand):
+    """Read only command with a cached result."""
+
+    calls = 0
+
+    @cached_command(ttl=60, depends_on=["server"], max_size=400)
+    def __call__(self, args):
+        ListCommand.calls += 1
+        print("%s on %s" % (args.pattern, self.config.server.host.value))
+        return ["result", args.pattern]
+
+
+class SumCommand(DefaultCommand):
+    """Cached command using a list of numbers."""
+
+    calls = 0
+
+    @cached_command(ttl=60)
+    def __call__(self, args):
+        SumCommand.calls += 1
+        print(sum(args.nums))
+        return [sum(args.nums)]
+
+
+class BarrierCommand(DefaultCommand):
+    """Cached command waiting for another one while running."""
+
+    barrier = None
+
+    @cached_command(ttl=60)
+    def __call__(self, args):
+        print("%s start" % args.pattern)
+        self.barrier.wait(5)
+        print("%s end" % args.pattern)
+        return [args.pattern]
+
+
+class TestCachedCommand(unittest.TestCase):
+    """Testing the cached results of the commands."""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.old = os.environ.get('XDG_CACHE_HOME')
+        os.environ['XDG_CACHE_HOME'] = self.tmp
+        self.config = Config("test", config_file=io.StringIO(
+            "[server]\nhost = a.example\n"))
+        self.config.add_section(SimpleSection("server")).add_element(
+            Element('host'))
+        self.config.load()
+        ListCommand.calls = 0
+
+    def tearDown(self):
+        import shutil
+        if self.old is None:
+            del os.environ['XDG_CACHE_HOME']
+        else:
+            os.environ['XDG_CACHE_HOME'] = self.old
+        shutil.rmtree(self.tmp)
+
+    def run_command(self, pattern, password="x"):
+        """Run the command, return its result and its output."""
+        import argparse
+        command = ListCommand(self.config)
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            res = command(argparse.Namespace(__func__=command,
+                                             pattern=pattern,
+                                             password=password))
+        return res, out.getvalue()
+
+    def test_replay(self):
+        """Testing the result and the output are replayed"""
+        expected = (["result", "a*"], "a* on a.example\n")
+        self.assertEqual(expected, self.run_command("a*"))
+        self.assertEqual(expected, self.run_command("a*", password="y"))
+        self.assertEqual(1, ListCommand.calls)
+        self.run_command("b*")
+        self.assertEqual(2, ListCommand.calls)
+        self.config.server.host.value = "b.example"
+        self.assertEqual((["result", "a*"], "a* on b.example\n"),
+                         self.run_command("a*"))
+        self.assertEqual(3, ListCommand.calls)
+
+    def test_lru(self):
+        """Testing the least recently used results are removed"""
+        for pattern in ("a", "b", "c", "a", "d", "e"):
+            self.run_command(pattern * 40)
+        directory = os.path.join(self.tmp, "argtoolbox", "commands", "test")
+        self.assertLess(len(os.listdir(directory)), 6)
+        calls = ListCommand.calls
+        self.run_command("e" * 40)
+        self.assertEqual(calls, ListCommand.calls)
+
+    def test_arguments(self):
+        """Testing every argument is part of the key"""
+        import argparse
+        SumCommand.calls = 0
+
+        def run(nums, **kwargs):
+            command = SumCommand(self.config)
+            with contextlib.redirect_stdout(io.StringIO()):
+                return command(argparse.Namespace(__func__=command,
+                                                  nums=nums, **kwargs))
+        self.assertEqual([3], run([1, 2]))
+        self.assertEqual([15], run([5, 5, 5]))
+        self.assertEqual([3], run([1, 2]))
+        self.assertEqual(2, SumCommand.calls)
+        # no stable representation : not cached.
+        self.assertEqual([3], run([1, 2], output=io.StringIO()))
+        self.assertEqual([3], run([1, 2], output=io.StringIO()))
+        self.assertEqual(4, SumCommand.calls)
+
+    def test_concurrent(self):
+        """Testing each command stores its own output"""
+        import argparse
+        BarrierCommand.barrier = threading.Barrier(2)
+        out = io.StringIO()
+        results = {}
+
+        def run(pattern):
+            command = BarrierCommand(self.config)
+            results[pattern] = command(argparse.Namespace(
+                __func__=command, pattern=pattern))
+        with contextlib.redirect_stdout(out):
+            threads = [threading.Thread(target=run, args=(p, ))
+                       for p in ("a", "b")]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertIs(out, sys.stdout)
+        self.assertEqual({"a": ["a"], "b": ["b"]}, results)
+        self.assertEqual(4, len(out.getvalue().splitlines()))
+        BarrierCommand.barrier = None
+        for pattern in ("a", "b"):
+            command = BarrierCommand(self.config)
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                command(argparse.Namespace(__func__=command,
+                                           pattern=pattern))
+            self.assertEqual("%s start\n%s end\n" % (pattern, pattern),
+                             out.getvalue())
+
+
+class TestFrozenSchema(unittest.TestCase):
+    """Testing the flat load plan of a frozen schema."""
+
+    DATA = ("[DEFAULT]\nverbose = 2\nservers = s1 s2\n"
+            "[ldap]\nhost = ldap.example\nport = 389\nratio = 0.5\n"
+            "tls = yes\nbases = a b c\nsecret = c2VjcmV0\n"
+            "[s1]\nhost = one\n[s2]\nhost = two\n")
+
+    def build(self, data=DATA, freeze=True):
+        """Declare and load a configuration."""
+        from argtoolbox import ElementWithRelativeSubSection, SubSection
+        config = Config("test", config_file=io.StringIO(data))
+        default = config.get_default_section()
+        default.add_element(Element('verbose', e_type=int))
+        template = SubSection()
+        template.add_element(Element('host'))
+        default.add_element(ElementWithRelativeSubSection('servers',
+                                                          template))
+        ldap = config.add_section(SimpleSection("ldap", required=True))
+        ldap.add_element(Element('host', conf_required=True))
+        ldap.add_element(Element('port', e_type=int))
+        ldap.add_element(Element('ratio', e_type=float))
+        ldap.add_element(Element('tls', e_type=bool))
+        ldap.add_element(Element('bases', e_type=list))
+        ldap.add_element(Element('user', default="admin"))
+        ldap.add_element(Element('secret', hooks=[Base64ElementHook()]))
+        config.add_section(SimpleSection("other")).add_element(
+            Element('label', default="x"))
+        if freeze:
+            config.freeze_schema()
+        config.load()
+        return config
+
+    def test_same_values(self):
+        """Testing the plan loads the same values"""
+        self.assertEqual(str(self.build(freeze=False)), str(self.build()))
+        config = self.build()
+        self.assertEqual((389, 0.5, True, ["a", "b", "c"], "admin", b"secret"),
+                         tuple(config.ldap.get_element(n).value for n in (
+                             "port", "ratio", "tls", "bases", "user",
+                             "secret")))
+        self.assertEqual(["s1", "s2"],
+                         list(config.default.servers.sections))
+        self.assertEqual("x", config.other.label.value)
+
+    def test_errors(self):
+        """Testing the plan raises the loading errors"""
+        self.assertRaises(ValueError, self.build,
+                          self.DATA.replace("389", "ldap"))
+        self.assertRaises(ValueError, self.build,
+                          self.DATA.replace("host = ldap.example", ""))
+        self.assertRaises(ValueError, self.build,
+                          self.DATA.replace("[ldap]", "[other]"))
+
+    def test_frozen(self):
+        """Testing the declarations can not change once frozen"""
+        config = self.build()
+        self.assertRaises(RuntimeError, config.add_section,
+                          SimpleSection("new"))
+        self.assertRaises(RuntimeError, config.ldap.add_element,
+                          Element('new'))
+        port = config.ldap.port
+        for name, value in (("default", 1), ("e_type", str),
+                            ("conf_required", True), ("hooks", []),
+                            ("lazy_hooks", True)):
+            self.assertRaises(RuntimeError, setattr, port, name, value)
+        self.assertIsInstance(port.hooks, tuple)
+        self.assertEqual((None, int), (port.default, port.e_type))
+        port.value = 636
+        self.assertEqual(636, port.value)
+
+    def test_empty_required_section(self):
+        """Testing a missing required section without elements"""
+        for freeze in (False, True):
+            config = Config("test", config_file=io.StringIO(self.DATA))
+            config.add_section(SimpleSection("empty", required=True))
+            if freeze:
+                config.freeze_schema()
+            config.load()
+
+
+class TestLazyLoad(unittest.TestCase):
+    """Testing the lazy_load mode of Config."""
+
+    def setUp(self):
+        sample_config = ["[DEFAULT]\nowner=default\n"]
+        for i in range(50):
+            sample_config.append("[tenant%d]\nport=%d\n" % (i, 1000 + i))
+        sample_config.append("[broken]\nport=abc\n")
+        self.c = Config("test-lazy",
+                        config_file=io.StringIO("".join(sample_config)),
+                        lazy_load=True)
+        self.c.get_default_section().add_element(Element('owner'))
+        for i in range(50):
+            section = self.c.add_section(SimpleSection("tenant%d" % i))
+            section.add_element(Element('port', e_type=int))
+        section = self.c.add_section(SimpleSection("broken"))
+        section.add_element(Element('port', e_type=int))
+
+    def test_on_demand(self):
+        """Testing sections are loaded on first access"""
+        self.c.load()
+        self.assertTrue(self.c.sections['tenant3'].load_pending)
+        self.assertEqual(1003, self.c.tenant3.port.value)
+        self.assertFalse(self.c.sections['tenant3'].load_pending)
+        self.assertTrue(self.c.sections['tenant4'].load_pending)
+        self.assertEqual(1004, self.c.get_section('tenant4').port.value)
+        self.assertEqual(1005, self.c.sections['tenant5'].port.value)
+        self.assertEqual("default", self.c.default.owner.value)
+        self.assertRaises(ValueError, getattr, self.c, 'broken')
+        self.assertRaises(ValueError, getattr, self.c, 'broken')
+
+    def test_on_demand_threads(self):
+        """Testing a section is loaded once by concurrent readers"""
+        self.c.load()
+        section = self.c.sections['tenant3']
+        calls = []
+        load = section.load
+
+        def counting_load(file_parser):
+            """Count the calls, let the other threads start"""
+            calls.append(1)
+            time.sleep(0.05)
+            load(file_parser)
+        section.load = counting_load
+        barrier = threading.Barrier(8)
+        results = []
+
+        def read():
+            """Read the port once every thread is started"""
+            barrier.wait()
+            results.append(self.c.tenant3.port.value)
+        threads = [threading.Thread(target=read) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([1003] * 8, results)
+        self.assertEqual(1, len(calls))
+
+    def test_validate_all(self):
+        """Testing validate_all raises the loading errors"""
+        self.c.load()
+        self.assertRaises(ValueError, self.c.validate_all)
+        del self.c.sections['broken']
+        self.c.validate_all()
+        self.assertFalse(self.c.sections['tenant49'].load_pending)
+
+
+class TestResolvedInterpolation(unittest.TestCase):
+    """Testing the ResolvedInterpolation engine."""
+
+    def setUp(self):
+        sample_config = """[DEFAULT]
+domain=example.org
+url=https://%(host)s/
+
+[ldap]
+host=ldap.${DEFAULT:domain}
+uri=ldap://${host}:389
+rate=100%%
+
+[web]
+host=${ldap:host}
+loop1=${loop2}
+loop2=${loop1}
+after_loop=${loop1}
+missing=%(nothing)s
+"""
+        from argtoolbox import ResolvedInterpolation
+        self.c = Config("test-interpolation",
+                        config_file=io.StringIO(sample_config),
+                        interpolation=ResolvedInterpolation())
+        self.c.load()
+        self.parser = self.c.file_parser
+
+    def test_references(self):
+        """Testing local and cross-section references"""
+        self.assertEqual("ldap.example.org", self.parser.get('ldap', 'host'))
+        self.assertEqual("ldap://ldap.example.org:389",
+                         self.parser.get('ldap', 'uri'))
+        self.assertEqual("https://ldap.example.org/",
+                         self.parser.get('web', 'url'))
+        self.assertEqual("100%", self.parser.get('ldap', 'rate'))
+
+    def test_errors(self):
+        """Testing cycles and missing references"""
+        import configparser
+        self.assertRaises(configparser.InterpolationDepthError,
+                          self.parser.get, 'web', 'loop1')
+        self.assertRaises(configparser.InterpolationDepthError,
+                          self.parser.get, 'web', 'after_loop')
+        self.assertRaises(configparser.InterpolationMissingOptionError,
+                          self.parser.get, 'web', 'missing')
+
+    def test_invalidation(self):
+        """Testing the cache is dropped when an option is set"""
+        self.assertEqual("ldap.example.org", self.parser.get('web', 'host'))
+        self.parser.set('DEFAULT', 'domain', 'example.com')
+        self.assertEqual("ldap.example.com", self.parser.get('web', 'host'))
+
+
+class TestQueueLogging(unittest.TestCase):
+    """Testing the queue based logging of BasicProgram."""
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.mkdtemp()
+        os.chdir(self.tmp)
+        self.level = logging.getLogger().level
+
+    def tearDown(self):
+        from argtoolbox.argtoolbox import _stop_queue_logging
+        _stop_queue_logging()
+        logging.getLogger().setLevel(self.level)
+        os.chdir(self.cwd)
+        import shutil
+        shutil.rmtree(self.tmp)
+
+    def test_queue_logging(self):
+        """Testing handlers are installed once and records are flushed"""
+        from logging.handlers import QueueHandler
+        from argtoolbox.argtoolbox import _stop_queue_logging
+        with open("test-queue.log", "w") as fde:
+            fde.write("previous run\n")
+        for _ in range(2):
+            program = BasicProgram("test-queue", log_queue=True,
+                                   force_debug_to_file=True,
+                                   use_config_file=False)
+        root = logging.getLogger()
+        self.assertEqual(1, len([h for h in root.handlers
+                                 if isinstance(h, QueueHandler)]))
+        for i in range(100):
+            program.log.debug("message %d", i)
+        _stop_queue_logging()
+        with open("test-queue.log") as fde:
+            data = fde.read()
+        self.assertIn("message 0\n", data)
+        self.assertIn("message 99\n", data)
+        self.assertEqual(1, data.count("message 50\n"))
+        with open("test-queue.log.1") as fde:
+            self.assertEqual("previous run\n", fde.read())
+
+
+class EchoCommand(DefaultCommand):
+    """Print the configured host and the input arguments."""
+
+    def __call__(self, args):
+        super(EchoCommand, self).__call__(args)
+        print("host=%s words=%s" % (self.config.ldap.host.value,
+                                     " ".join(args.words)))
+        return True
+
+
+class EchoProgram(BasicProgram):
+    """Small program used by the server tests."""
+
+    def add_config_options(self):
+        super(EchoProgram, self).add_config_options()
+        section = self.config.add_section(SimpleSection("ldap"))
+        section.add_element(Element('host', default="127.0.0.1"))
+
+    def add_commands(self):
+        super(EchoProgram, self).add_commands()
+        self.subparsers = self.parser.add_subparsers()
+        parser_tmp = self.subparsers.add_parser('echo')
+        parser_tmp.add_argument('words', nargs='*')
+        parser_tmp.set_defaults(__func__=EchoCommand(self.config))
+
+
+class TestServer(unittest.TestCase):
+    """Testing the daemon mode (server and client)."""
+
+    def setUp(self):
+        from argtoolbox.server import ProgramServer
+        self.tmpdir = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.tmpdir, "echo.sock")
+        config = io.StringIO("[ldap]\nhost=10.0.0.1\n")
+        prog = EchoProgram("echo-prog", config_file=config)
+        self.server = ProgramServer(prog, socket_path=self.socket_path,
+                                    idle_timeout=30)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        for _ in range(100):
+            if os.path.exists(self.socket_path):
+                break
+            time.sleep(0.05)
+
+    def tearDown(self):
+        self.server.stop()
+        self.thread.join()
+        os.rmdir(self.tmpdir)
+
+    def request(self, argv):
+        """Forward argv to the server, return the exit code and stdout"""
+        from argtoolbox.client import request
+        out = io.StringIO()
+        err = io.StringIO()
+        code = request(self.socket_path, argv, stdout=out, stderr=err)
+        return code, out.getvalue()
+
+    def test_request(self):
+        """Testing a command run by the server"""
+        code, out = self.request(["echo", "a", "b"])
+        self.assertEqual(0, code)
+        self.assertIn("host=10.0.0.1 words=a b", out)
+
+    def test_concurrent_requests(self):
+        """Testing isolated outputs of concurrent requests"""
+        results = {}
+
+        def run(i):
+            """one client"""
+            results[i] = self.request(["echo", str(i)])
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for i in range(8):
+            self.assertEqual((0, "host=10.0.0.1 words=%d\n" % i),
+                             results[i])
+
+    def test_argparse_error(self):
+        """Testing the exit code of an invalid command line"""
+        code, _ = self.request(["unknown"])
+        self.assertEqual(2, code)
+
+    def test_socket_directory(self):
+        """Testing the socket directory must be private"""
+        from argtoolbox.server import ProgramServer
+        os.chmod(self.tmpdir, 0o755)
+        try:
+            self.assertRaises(PermissionError, self.request, ["echo", "a"])
+            # pylint: disable-msg=W0212
+            server = ProgramServer(self.server._pristine,
+                                   socket_path=os.path.join(self.tmpdir,
+                                                            "other.sock"))
+            self.assertRaises(PermissionError, server._bind)
+        finally:
+            os.chmod(self.tmpdir, 0o700)
+        self.assertEqual(0, self.request(["echo", "a"])[0])
+
+    def test_debug_request(self):
+        """Testing the debug mode of a request does not leak"""
+        code, out = self.request(["-d", "echo", "b"])
+        self.assertEqual(0, code)
+        self.assertIn("Namespace : begin", out)
+        results = {}
+
+        def run(i, argv):
+            """one client"""
+            results[i] = self.request(argv + ["echo", str(i)])
+        threads = [threading.Thread(target=run, args=(i, ["-d"] * (i % 2)))
+                   for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for i in range(0, 8, 2):
+            self.assertEqual((0, "host=10.0.0.1 words=%d\n" % i),
+                             results[i])
+        for i in range(1, 8, 2):
+            self.assertIn("DEBUG", results[i][1])
+        self.assertEqual((0, "host=10.0.0.1 words=c\n"),
+                         self.request(["echo", "c"]))
+        self.server.stop()
+        self.thread.join()
+        self.assertEqual(logging.INFO, logging.getLogger().level)
+
+
+class WarnCommand(DefaultCommand):
+    """Log the input arguments."""
+
+    def __call__(self, args):
+        super(WarnCommand, self).__call__(args)
+        self.log.warning("words=%s", " ".join(args.words))
+        return True
+
+
+class WarnProgram(EchoProgram):
+    """Small program logging from its command."""
+
+    def add_commands(self):
+        super(WarnProgram, self).add_commands()
+        parser_tmp = self.subparsers.add_parser('warn')
+        parser_tmp.add_argument('words', nargs='*')
+        parser_tmp.set_defaults(__func__=WarnCommand(self.config))
+
+
+class TestServerLogging(TestServer):
+    """Testing the log records of the requests served by the daemon."""
+
+    def setUp(self):
+        from argtoolbox.server import ProgramServer
+        self.tmpdir = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.tmpdir, "warn.sock")
+        config = io.StringIO("[ldap]\nhost=10.0.0.1\n")
+        prog = WarnProgram("warn-prog", config_file=config, log_queue=True)
+        self.server = ProgramServer(prog, socket_path=self.socket_path,
+                                    idle_timeout=30)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        for _ in range(100):
+            if os.path.exists(self.socket_path):
+                break
+            time.sleep(0.05)
+
+    def tearDown(self):
+        from argtoolbox.argtoolbox import _stop_queue_logging
+        super(TestServerLogging, self).tearDown()
+        _stop_queue_logging()
+
+    def test_request_logs(self):
+        """Testing the records of concurrent requests are routed to them"""
+        results = {}
+
+        def run(i):
+            """one client"""
+            results[i] = self.request(["warn", str(i)])
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for i in range(8):
+            code, out = results[i]
+            self.assertEqual(0, code)
+            self.assertEqual(1, out.count("words="))
+            self.assertIn("words=%d\n" % i, out)
+
+
+class TestBatch(unittest.TestCase):
+    """Testing the batch mode of BasicProgram."""
+
+    def setUp(self):
+        config = io.StringIO("[ldap]\nhost=10.0.0.1\n")
+        self.prog = EchoProgram("echo-prog", config_file=config, batch=True)
+        self.prog.setup_config()
+        self.prog.setup_parser([])
+        fde, self.batch = tempfile.mkstemp()
+        os.close(fde)
+
+    def tearDown(self):
+        os.remove(self.batch)
+
+    def run_batch(self, lines, jobs=1):
+        """Run the batch, return the result and stdout"""
+        with open(self.batch, 'w') as fde:
+            fde.write("\n".join(lines))
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out), \
+                contextlib.redirect_stderr(io.StringIO()):
+            res = self.prog.run_batch(self.batch, jobs)
+        return res, out.getvalue()
+
+    def test_batch(self):
+        """Testing command lines run in order"""
+        res, out = self.run_batch(
+            ["# comment", "echo-prog echo a", "", "echo b"])
+        self.assertTrue(res)
+        self.assertEqual("host=10.0.0.1 words=a\nhost=10.0.0.1 words=b\n",
+                         out)
+
+    def test_batch_failure(self):
+        """Testing a batch containing an invalid command line"""
+        res, out = self.run_batch(["echo a", "unknown", "echo c"])
+        self.assertFalse(res)
+        self.assertEqual(2, out.count("host=10.0.0.1"))
+
+    def test_batch_malformed_line(self):
+        """Testing a command line which can not be split"""
+        with open(self.batch, 'w') as fde:
+            fde.write("echo a\necho 'b\necho c\n")
+        for jobs in (1, 2):
+            out = io.StringIO()
+            err = io.StringIO()
+            with contextlib.redirect_stdout(out), \
+                    contextlib.redirect_stderr(err):
+                res = self.prog.run_batch(self.batch, jobs)
+            self.assertFalse(res)
+            self.assertEqual(2, out.getvalue().count("host=10.0.0.1"))
+            self.assertIn("line 2 : No closing quotation", err.getvalue())
+
+    def test_batch_jobs(self):
+        """Testing command lines run concurrently"""
+        res, out = self.run_batch(["echo %d" % i for i in range(50)], 4)
+        self.assertTrue(res)
+        self.assertEqual(50, out.count("host=10.0.0.1"))
+
+    def test_batch_config_options(self):
+        """Testing options changing the configuration in a batch"""
+        res, out = self.run_batch(["echo a", "--config-file x.cfg echo b",
+                                   "--batch other echo c"])
+        self.assertFalse(res)
+        self.assertEqual("host=10.0.0.1 words=a\n", out)
+
+    def test_batch_opt_in(self):
+        """Testing the batch options are only added on demand"""
+        prog = EchoProgram("echo-prog", config_file=io.StringIO(""))
+        prog.setup_config()
+        prog.setup_parser([])
+        # pylint: disable-msg=W0212
+        options = prog.parser._option_string_actions
+        self.assertNotIn('--batch', options)
+        self.assertIn('--batch-jobs', self.prog.parser._option_string_actions)
+        self.assertNotIn('-j', self.prog.parser._option_string_actions)
+
+
+class TestParserCache(unittest.TestCase):
+    """Testing the parser cache of BasicProgram."""
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.old_cache_dir = os.environ.get('XDG_CACHE_HOME')
+        os.environ['XDG_CACHE_HOME'] = self.cache_dir
+
+    def tearDown(self):
+        import shutil
+        if self.old_cache_dir is None:
+            del os.environ['XDG_CACHE_HOME']
+        else:
+            os.environ['XDG_CACHE_HOME'] = self.old_cache_dir
+        shutil.rmtree(self.cache_dir)
+
+    @staticmethod
+    def build(host):
+        """Build a program, return it and the number of add_commands calls"""
+        calls = []
+
+        class Program(EchoProgram):
+            """Counting add_commands calls"""
+            def add_commands(self):
+                calls.append(1)
+                super(Program, self).add_commands()
+        config = io.StringIO("[ldap]\nhost=%s\n" % host)
+        prog = Program("echo-prog", config_file=config, parser_cache=True)
+        prog.setup_config()
+        prog.setup_parser(["echo", "a"])
+        return prog, len(calls)
+
+    def run_echo(self, prog):
+        """Run the echo command, return stdout"""
+        # pylint: disable-msg=R0201
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            self.assertTrue(prog.run(["echo", "a"]))
+        return out.getvalue()
+
+    def test_cache_hit(self):
+        """Testing the parser is loaded from the cache"""
+        prog, calls = self.build("10.0.0.1")
+        self.assertEqual(1, calls)
+        prog, calls = self.build("10.0.0.1")
+        self.assertEqual(0, calls)
+        self.assertEqual("host=10.0.0.1 words=a\n", self.run_echo(prog))
+        args = prog.parser.parse_args(["echo"])
+        self.assertIs(prog.config, args.__func__.config)
+        self.assertFalse(hasattr(args, 'help'))
+
+    def test_cache_config_change(self):
+        """Testing the cache is invalidated by configuration changes"""
+        self.build("10.0.0.1")
+        prog, calls = self.build("10.0.0.2")
+        self.assertEqual(1, calls)
+        self.assertEqual("host=10.0.0.2 words=a\n", self.run_echo(prog))
+
+    def test_cache_help(self):
+        """Testing the help of a parser loaded from the cache"""
+        prog = self.build("10.0.0.1")[0]
+        expected = prog.parser.format_help()
+        prog, calls = self.build("10.0.0.1")
+        self.assertEqual(0, calls)
+        self.assertEqual(expected, prog.parser.format_help())
+
+    def test_cache_command_module(self):
+        """Testing the cache is invalidated when a command module changes"""
+        import importlib
+        path = os.path.join(self.cache_dir, "cached_cmds.py")
+        code = ("from argtoolbox import DefaultCommand\n"
+                "class CmdCommand(DefaultCommand):\n"
+                "    def __call__(self, args):\n"
+                "        return %s\n")
+        with open(path, 'w') as fde:
+            fde.write(code % "True")
+        sys.path.insert(0, self.cache_dir)
+        try:
+            module = importlib.import_module("cached_cmds")
+
+            def build():
+                """Build the program, return the add_commands calls"""
+                calls = []
+
+                class Program(EchoProgram):
+                    """Using a command of another module"""
+                    def add_commands(self):
+                        calls.append(1)
+                        subparsers = self.parser.add_subparsers()
+                        parser_tmp = subparsers.add_parser('cmd')
+                        parser_tmp.set_defaults(
+                            __func__=module.CmdCommand(self.config))
+                prog = Program("echo-prog", config_file=io.StringIO(""),
+                               parser_cache=True)
+                prog.setup_config()
+                prog.setup_parser([])
+                return len(calls)
+            self.assertEqual(1, build())
+            self.assertEqual(0, build())
+            with open(path, 'w') as fde:
+                fde.write(code % "False")
+            self.assertEqual(1, build())
+        finally:
+            sys.path.remove(self.cache_dir)
+            sys.modules.pop("cached_cmds", None)
+
+    def test_cache_other_program(self):
+        """Testing a program does not remove the cache of another one"""
+        prog = self.build("10.0.0.1")[0]
+        cache_file = prog.get_parser_cache_file()
+        other = os.path.join(os.path.dirname(cache_file),
+                             "echo-prog-admin-" + "0" * 40 + ".pickle")
+        with open(other, 'w') as fde:
+            fde.write("")
+        self.build("10.0.0.2")
+        self.assertTrue(os.path.exists(other))
+        self.assertFalse(os.path.exists(cache_file))
+
+    def test_without_cache(self):
+        """Testing the program runs when the cache can not be used"""
+        os.environ['XDG_CACHE_HOME'] = "/proc/nope"
+        prog, calls = self.build("10.0.0.1")
+        self.assertEqual(1, calls)
+        self.assertIsNone(prog.get_parser_cache_file())
+        self.assertEqual("host=10.0.0.1 words=a\n", self.run_echo(prog))
+        os.environ['XDG_CACHE_HOME'] = self.cache_dir
+        cache_file = prog.get_parser_cache_file()
+        # the temporary file can not be written.
+        os.mkdir(cache_file + ".%d.tmp" % os.getpid())
+        prog, calls = self.build("10.0.0.1")
+        self.assertEqual(1, calls)
+        self.assertFalse(os.path.exists(cache_file))
+        self.assertEqual("host=10.0.0.1 words=a\n", self.run_echo(prog))
+        with open(cache_file, 'w') as fde:
+            fde.write("broken")
+        prog, calls = self.build("10.0.0.1")
+        self.assertEqual(1, calls)
+
+
+class TestStorage(unittest.TestCase):
+    """Testing the SQLite storage of ListSection and
+    ElementWithRelativeSubSection."""
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.old_cache_dir = os.environ.get('XDG_CACHE_HOME')
+        os.environ['XDG_CACHE_HOME'] = self.cache_dir
+        self.config_file = os.path.join(self.cache_dir, "test.cfg")
+        self.write(2)
+
+    def tearDown(self):
+        import shutil
+        if self.old_cache_dir is None:
+            del os.environ['XDG_CACHE_HOME']
+        else:
+            os.environ['XDG_CACHE_HOME'] = self.old_cache_dir
+        shutil.rmtree(self.cache_dir)
+
+    def write(self, count):
+        """Write a configuration file with count hosts"""
+        data = ["[DEFAULT]\nhosts=%s\n" % " ".join(
+            "host%d" % i for i in range(count))]
+        data.append("[mapping]\n")
+        data.extend("key%d=value%d\n" % (i, i) for i in range(count))
+        data.extend("[host%d]\nport=%d\ntoken=c2VjcmV0\n" % (i, 1000 + i)
+                    for i in range(count))
+        with open(self.config_file, 'w') as fde:
+            fde.write("".join(data))
+        mtime = time.time() + count
+        os.utime(self.config_file, (mtime, mtime))
+
+    def build(self):
+        """Build and load a config using the SQLite storage"""
+        from argtoolbox import ListSection, SubSection
+        from argtoolbox import ElementWithRelativeSubSection
+        config = Config("test-storage", config_file=self.config_file)
+        mapping = config.add_section(ListSection('mapping',
+                                                 storage='sqlite'))
+        rss = SubSection()
+        rss.add_element(Element('port', e_type=int))
+        rss.add_element(Element('token', hooks=[Base64ElementHook()]))
+        hosts = config.get_default_section().add_element(
+            ElementWithRelativeSubSection('hosts', rss, storage='sqlite'))
+        config.load()
+        return mapping, hosts
+
+    def test_storage(self):
+        """Testing lookups and iterations go through the store"""
+        from argtoolbox.storage import SQLiteStore
+        mapping, hosts = self.build()
+        self.assertIsInstance(mapping.elements, SQLiteStore)
+        self.assertEqual("value1", mapping.elements['key1'])
+        self.assertEqual([('key0', 'value0'), ('key1', 'value1')],
+                         list(mapping.elements.items()))
+        self.assertEqual(1001, hosts.sections['host1'].port.value)
+        self.assertEqual(['host0', 'host1'], list(hosts.sections))
+        self.assertIn("SubSection : HOST1", "".join(
+            hosts.iter_representation()))
+
+    def test_ingestion(self):
+        """Testing the data is ingested again only if the file changes"""
+        from argtoolbox.storage import SQLiteStore
+        mapping, _ = self.build()
+        calls = []
+        ingest = SQLiteStore.ingest
+
+        def counting_ingest(store, items, fingerprint):
+            calls.append(store.path)
+            return ingest(store, items, fingerprint)
+        SQLiteStore.ingest = counting_ingest
+        try:
+            self.build()
+            self.assertEqual([], calls)
+            self.write(3)
+            mapping, hosts = self.build()
+            self.assertEqual(2, len(calls))
+        finally:
+            SQLiteStore.ingest = ingest
+        self.assertEqual(3, len(mapping.elements))
+        self.assertEqual(1002, hosts.sections['host2'].port.value)
+
+    def test_storage_hooks(self):
+        """Testing the values are stored before the hooks"""
+        _, hosts = self.build()
+        self.assertEqual(b"secret", hosts.sections['host1'].token.value)
+        with open(hosts.sections.store.path, 'rb') as fde:
+            data = fde.read()
+        self.assertIn(b"c2VjcmV0", data)
+        self.assertNotIn(b"secret", data)
+
+    def test_storage_fingerprint(self):
+        """Testing the fingerprint of a config does not read the stores"""
+        from argtoolbox.storage import SQLiteStore
+        config = self.build()[0]
+        items = SQLiteStore.items
+
+        def failing_items(store):
+            raise AssertionError(store.path)
+        SQLiteStore.items = failing_items
+        try:
+            self.assertEqual(1, len(config.get_values()))
+        finally:
+            SQLiteStore.items = items
+
+
+class TestExecutableIndex(unittest.TestCase):
+    """Testing the $PATH executable index of argtoolboxtool."""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.dirs = []
+        for i, names in enumerate([["prog", "prog-b"], ["prog", "other"]]):
+            directory = os.path.join(self.tmp, "bin%d" % i)
+            os.mkdir(directory)
+            for name in names:
+                open(os.path.join(directory, name), 'w').close()
+            self.dirs.append(directory)
+        self.path = os.pathsep.join(self.dirs + ["/nonexistent"])
+        self.cache_file = os.path.join(self.tmp, "index.json")
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmp)
+
+    def test_lookup(self):
+        """Testing lookups use the first $PATH directory"""
+        from argtoolbox.commands import ExecutableIndex
+        index = ExecutableIndex(self.path, self.cache_file)
+        self.assertEqual(os.path.join(self.dirs[0], "prog"),
+                         index.find("prog"))
+        self.assertEqual(os.path.join(self.dirs[1], "other"),
+                         index.find("other"))
+        self.assertIsNone(index.find("pro"))
+        self.assertEqual(["prog", "prog-b"], index.complete("pro"))
+        self.assertEqual(["prog", "prog-b", "other"], index.complete(""))
+
+    def test_cache(self):
+        """Testing only the changed directories are listed again"""
+        from argtoolbox.commands import ExecutableIndex
+        ExecutableIndex(self.path, self.cache_file).load()
+        listed = []
+        index = ExecutableIndex(self.path, self.cache_file)
+        original = index._list
+        index._list = lambda d: listed.append(d) or original(d)
+        index.load()
+        self.assertEqual([], listed)
+        open(os.path.join(self.dirs[1], "new"), 'w').close()
+        mtime = time.time() + 10
+        os.utime(self.dirs[1], (mtime, mtime))
+        index.load()
+        self.assertEqual([self.dirs[1]], listed)
+        self.assertEqual(os.path.join(self.dirs[1], "new"),
+                         index.find("new"))
+
+
+class HostsCommand(DefaultCommand):
+    """Command with a (slow) completion method."""
+
+    calls = []
+
+    def complete(self, args, prefix):
+        self.calls.append(prefix)
+        return [h for h in ["alpha", "alpine", "beta"] if h.startswith(prefix)]
+
+
+class TestCompletionCache(unittest.TestCase):
+    """Testing the completion results cache of DefaultCompleter."""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.old = os.environ.get('XDG_CACHE_HOME')
+        os.environ['XDG_CACHE_HOME'] = self.tmp
+        HostsCommand.calls = []
+
+    def tearDown(self):
+        import shutil
+        if self.old is None:
+            del os.environ['XDG_CACHE_HOME']
+        else:
+            os.environ['XDG_CACHE_HOME'] = self.old
+        shutil.rmtree(self.tmp)
+
+    def complete(self, completer, prefix, **kwargs):
+        import argparse
+        args = argparse.Namespace(__func__=HostsCommand(), **kwargs)
+        parser = argparse.ArgumentParser(prog="prog hosts")
+        return completer(prefix, parsed_args=args, parser=parser)
+
+    def test_cache(self):
+        """Testing cached results are reused and narrowed"""
+        from argtoolbox import DefaultCompleter
+        completer = DefaultCompleter(ttl=60)
+        self.assertEqual(["alpha", "alpine"], self.complete(completer, "al"))
+        self.assertEqual(["alpha", "alpine"], self.complete(completer, "al"))
+        self.assertEqual(["alpine"], self.complete(completer, "alpi"))
+        self.assertEqual(["al"], HostsCommand.calls)
+        self.complete(completer, "al", verbose=True)
+        self.assertEqual(["al", "al"], HostsCommand.calls)
+        self.complete(DefaultCompleter(), "al")
+        self.assertEqual(["al", "al", "al"], HostsCommand.calls)
+
+    def test_invalidation(self):
+        """Testing expired and invalidated results are computed again"""
+        from argtoolbox import DefaultCompleter
+        completer = DefaultCompleter(ttl=60)
+        self.complete(completer, "a")
+        DefaultCompleter.invalidate("prog", HostsCommand)
+        self.complete(completer, "a")
+        self.assertEqual(["a", "a"], HostsCommand.calls)
+        completer.ttl = 0.01
+        time.sleep(0.05)
+        self.complete(completer, "a")
+        self.assertEqual(["a", "a", "a"], HostsCommand.calls)
+
+
+class TestCompleterDeadline(unittest.TestCase):
+    """Testing the deadline of the completion methods."""
+
+    def test_partial_results(self):
+        """Testing a slow completion method returns the candidates found
+        before the deadline"""
+        import argparse
+        from argtoolbox import DefaultCompleter
+        release = threading.Event()
+        closed = threading.Event()
+
+        class SlowCommand(DefaultCommand):
+            """Command with a hanging completion method."""
+            def complete(self, args, prefix):
+                try:
+                    yield "one"
+                    yield "two"
+                    release.wait(5)
+                    yield "three"
+                finally:
+                    closed.set()
+
+        args = argparse.Namespace(__func__=SlowCommand())
+        start = time.time()
+        res = DefaultCompleter(timeout=0.1)("", parsed_args=args)
+        self.assertLess(time.time() - start, 1)
+        self.assertEqual(["one", "two"], res)
+        release.set()
+        self.assertTrue(closed.wait(5))
+        res = DefaultCompleter(timeout=None)("", parsed_args=args)
+        self.assertEqual(["one", "two", "three"], res)
+
+    def test_list_results(self):
+        """Testing a hanging completion method returning a list is given up
+        at the default deadline, and cached once it returns in time"""
+        import argparse
+        import shutil
+        from argtoolbox import DefaultCompleter
+        calls = []
+        release = threading.Event()
+        returned = threading.Event()
+
+        class SlowCommand(DefaultCommand):
+            """Command with a hanging completion method."""
+            def complete(self, args, prefix):
+                calls.append(prefix)
+                release.wait(5)
+                returned.set()
+                return ["one", "two"]
+
+        cache_dir = tempfile.mkdtemp()
+        old_cache_dir = os.environ.get('XDG_CACHE_HOME')
+        os.environ['XDG_CACHE_HOME'] = cache_dir
+        try:
+            args = argparse.Namespace(__func__=SlowCommand())
+            completer = DefaultCompleter(ttl=60)
+            start = time.time()
+            self.assertEqual([], completer("", parsed_args=args))
+            self.assertLess(time.time() - start, 1)
+            release.set()
+            self.assertTrue(returned.wait(5))
+            self.assertEqual(["one", "two"], completer("", parsed_args=args))
+            self.assertEqual(["one", "two"], completer("", parsed_args=args))
+            self.assertEqual(["", ""], calls)
+        finally:
+            if old_cache_dir is None:
+                del os.environ['XDG_CACHE_HOME']
+            else:
+                os.environ['XDG_CACHE_HOME'] = old_cache_dir
+            shutil.rmtree(cache_dir)
+
+
+class CompletedProgram(BasicProgram):
+    """Program with static and dynamic completions."""
+
+    def add_commands(self):
+        super(CompletedProgram, self).add_commands()
+        from argtoolbox import DefaultCompleter
+        subparsers = self.parser.add_subparsers()
+        parser = subparsers.add_parser('list')
+        parser.add_argument('--format', choices=['json', 'text'])
+        parser.add_argument('host').completer = DefaultCompleter()
+        parser = subparsers.add_parser('show')
+        parser.add_argument('kind', choices=['user', 'group'])
+
+
+class TestCompletionScript(unittest.TestCase):
+    """Testing the static completion script."""
+
+    def setUp(self):
+        prog = CompletedProgram("prog", use_config_file=False)
+        prog.setup_config()
+        prog.setup_parser([])
+        self.parser = prog.parser
+
+    def test_script(self):
+        """Testing the script completes the static words in bash"""
+        import shutil
+        import subprocess
+        from argtoolbox.completion import get_completion_script
+        script = get_completion_script(self.parser)
+        self.assertIn("complete -F _argtoolbox_prog prog", script)
+        self.assertTrue(get_completion_script(self.parser, 'zsh').startswith(
+            "autoload -U +X bashcompinit"))
+        self.assertRaises(ValueError, get_completion_script, self.parser,
+                          'fish')
+        if shutil.which("bash") is None:
+            self.skipTest("bash is not available")
+        script += """
+_argtoolbox_prog_python() { COMPREPLY=("python:$1"); }
+t() {
+    COMP_WORDS=("$@"); COMP_CWORD=$(( ${#COMP_WORDS[@]} - 1 ))
+    _argtoolbox_prog; echo "${COMPREPLY[*]}"
+}
+t prog ""
+t prog show ""
+t prog list --format ""
+t prog list --format json ""
+t prog list --f
+"""
+        res = subprocess.run(["bash", "-c", script], stdout=subprocess.PIPE,
+                             check=True, universal_newlines=True)
+        self.assertEqual(["list show", "user group", "json text",
+                          "python:prog", "--format"],
+                         res.stdout.splitlines())
+
+    def test_option(self):
+        """Testing the hidden option prints the script"""
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            self.assertRaises(SystemExit, self.parser.parse_args,
+                              ["--completion-script", "bash"])
+        self.assertIn("_argtoolbox_prog()", out.getvalue())
+        self.assertNotIn("--completion-script", self.parser.format_help())
+
+
+class TestFastPaths(unittest.TestCase):
+    """Testing --version and --help skip the configuration loading."""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.old = os.environ.get('XDG_CACHE_HOME')
+        os.environ['XDG_CACHE_HOME'] = self.tmp
+
+    def tearDown(self):
+        import shutil
+        if self.old is None:
+            del os.environ['XDG_CACHE_HOME']
+        else:
+            os.environ['XDG_CACHE_HOME'] = self.old
+        shutil.rmtree(self.tmp)
+
+    def run_program(self, argv):
+        """Run the program, return its output and if the configuration was
+        loaded."""
+        prog = CompletedProgram("prog", use_config_file=False,
+                                version="1.2", fast_paths=True)
+        prog.config.argv = argv
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            with self.assertRaises(SystemExit) as ctx:
+                prog()
+        self.assertEqual(0, ctx.exception.code)
+        return out.getvalue(), prog.parser is not None
+
+    def test_version(self):
+        """Testing --version does not build the program"""
+        self.assertEqual(("prog 1.2\n", False),
+                         self.run_program(["--version"]))
+
+    def test_help(self):
+        """Testing the help is rendered once"""
+        text, loaded = self.run_program(["show", "-h"])
+        self.assertTrue(loaded)
+        self.assertIn("{user,group}", text)
+        self.assertEqual((text, False), self.run_program(["show", "-h"]))
+        text, loaded = self.run_program(["--help"])
+        self.assertTrue(loaded)
+        self.assertIn("{list,show}", text)
+
+    def test_help_cache_files(self):
+        """Testing the files of the other processes are kept"""
+        text = self.run_program(["show", "-h"])[0]
+        directory = os.path.join(self.tmp, "argtoolbox", "help")
+        cache_file = os.listdir(directory)[0]
+        tmp = os.path.join(directory, cache_file + ".1.tmp")
+        open(tmp, 'w').close()
+        # the cached help is outdated when a module of the parser changes.
+        stat = os.stat(__file__)
+        os.utime(__file__, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        try:
+            self.assertEqual((text, True), self.run_program(["show", "-h"]))
+        finally:
+            os.utime(__file__, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.assertTrue(os.path.exists(tmp))
+        self.assertEqual(2, len(os.listdir(directory)))
+
+    def test_help_without_cache(self):
+        """Testing the help when the cache can not be created"""
+        os.environ['XDG_CACHE_HOME'] = "/proc/nope"
+        text, loaded = self.run_program(["show", "-h"])
+        self.assertTrue(loaded)
+        self.assertIn("{user,group}", text)
+
+
+class TestStaticConfigExtractor(unittest.TestCase):
+    """Testing the config extraction without importing the program."""
+
+    PROGRAM = """
+import sys
+from argtoolbox import BasicProgram, SimpleSection, Element
+from argtoolbox import Base64ElementHook
+
+sys.exit("the program must not be imported")
+
+class MyProgram(BasicProgram):
+    def add_config_options(self):
+        super(MyProgram, self).add_config_options()
+        section = self.config.add_section(SimpleSection("ldap"))
+        section.add_element(Element('host', default="127.0.0.1",
+                                    desc="ldap " + "host"))
+        section.add_element(Element('port', e_type=int, default=389))
+        section.add_element(Element('password', hidden=True,
+                                    hooks=[Base64ElementHook(), ]))
+%s
+
+PROG = MyProgram("static-prog", desc="a static program")
+"""
+
+    def extract(self, extra=""):
+        """Extract the config of the sample program"""
+        from argtoolbox.commands import StaticConfigExtractor
+        fde, program = tempfile.mkstemp(suffix=".py")
+        with os.fdopen(fde, 'w') as fde:
+            fde.write(self.PROGRAM % extra)
+        try:
+            return StaticConfigExtractor(program).extract()
+        finally:
+            os.remove(program)
+
+    def test_extract(self):
+        """Testing the Config object built from the source code"""
+        config = self.extract()
+        self.assertEqual("static-prog", config.prog_name)
+        self.assertEqual(["DEFAULT", "ldap"], list(config.sections))
+        self.assertEqual(0, config.default.debug.default)
+        self.assertEqual("ldap host", config.ldap.host._desc)
+        self.assertEqual(int, config.ldap.port.e_type)
+        self.assertTrue(config.ldap.password.hidden)
+
+    def test_not_static(self):
+        """Testing programs which must be imported"""
+        from argtoolbox.commands import NotStaticError
+        self.assertRaises(NotStaticError, self.extract,
+                          "        for i in range(3): pass")
+        self.assertRaises(NotStaticError, self.extract,
+                          "        section.add_element(Element(get_name()))")
+
+
+class TestImport(unittest.TestCase):
+    """Testing the cost of 'import argtoolbox'."""
+
+    def get_modules(self, statement):
+        """Return the modules imported by a statement, according to
+        -X importtime, in a new interpreter."""
+        import subprocess
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        res = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", statement],
+            cwd=root, stderr=subprocess.PIPE, check=True,
+            universal_newlines=True)
+        modules = []
+        for line in res.stderr.splitlines():
+            if line.startswith("import time:") and "|" in line:
+                fields = line[len("import time:"):].split("|")
+                if fields[1].strip().isdigit():
+                    modules.append(fields[2].strip())
+        return modules
+
+    def test_import_time(self):
+        """Testing heavy modules are not imported by 'import argtoolbox'"""
+        modules = self.get_modules("import argtoolbox")
+        self.assertIn("argtoolbox", modules)
+        for name in ("argtoolbox.argtoolbox", "argparse", "configparser",
+                     "base64", "logging", "sqlite3", "asyncio",
+                     "argcomplete", "numpy"):
+            self.assertNotIn(name, modules)
+        modules = self.get_modules("import argtoolbox.argtoolbox")
+        self.assertIn("argtoolbox.argtoolbox", modules)
+        for name in ("sqlite3", "asyncio", "logging.handlers",
+                     "dataclasses", "argcomplete", "numpy"):
+            self.assertNotIn(name, modules)
+
+    def test_lazy_names(self):
+        """Testing the public names are still available"""
+        import argtoolbox
+        from argtoolbox import argtoolbox as module
+        self.assertIs(module.Config, argtoolbox.Config)
+        self.assertIs(module.streamHandler, argtoolbox.streamHandler)
+        self.assertIn("BasicProgram", dir(argtoolbox))
+        self.assertRaises(AttributeError, getattr, argtoolbox, "missing")
+
+
 if __name__ == '__main__':
     LOG = logging.getLogger('argtoolbox')
     STREAMHANDLER = logging.StreamHandler(sys.stdout)